@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from typing import Any, Optional
+
+from fundamentals_store import last_trading_day
+
+
+DEFAULT_CACHE_DIR = os.getenv("AI_CACHE_DIR", "ai_cache")
+MAX_BYTES = int(float(os.getenv("AI_CACHE_MAX_MB", "50")) * 1024 * 1024)
+
+_locks_guard = threading.Lock()
+# 只要還有 session 拿著鎖就會留著，沒人用了自動移除，不會隨鍵的數量無限增長
+_locks: "weakref.WeakValueDictionary[str, _KeyLock]" = weakref.WeakValueDictionary()
+
+
+class _KeyLock:
+    """threading.Lock 不能被弱參照，包一層讓它能放進 WeakValueDictionary"""
+
+    __slots__ = ("_lock", "__weakref__")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self._lock.acquire(blocking, timeout)
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if hasattr(value, "item"):
+        # numpy 純量
+        return _normalize(value.item())
+    return value
+
+
+def make_key(model: str, features: dict[str, Any]) -> str:
+    """以模型名稱 + 正規化後的輸入特徵產生快取鍵；特徵相同就共用同一份分析"""
+    payload = json.dumps(
+        {"model": model, "features": _normalize(features)},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _path(key: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"{key}.json")
+
+
+def get(key: str, cache_dir: str = DEFAULT_CACHE_DIR) -> Optional[str]:
+    """只回傳同一個交易日產生的分析；命中時更新 mtime 作為 LRU 依據"""
+    path = _path(key, cache_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except Exception:
+        return None
+    if record.get("day") != last_trading_day():
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+        return None
+    try:
+        os.utime(path, None)
+    except Exception:
+        pass
+    return record.get("text")
+
+
+def put(
+    key: str,
+    text: str,
+    model: str = "",
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    max_bytes: int = MAX_BYTES,
+) -> None:
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = _path(key, cache_dir)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        record = {"day": last_trading_day(), "model": model, "created": int(time.time()), "text": text}
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        evict(cache_dir, max_bytes)
+    except Exception:
+        return
+
+
+def evict(cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = MAX_BYTES) -> int:
+    """總大小超過上限時，從最久沒被讀取的項目開始刪除"""
+    files = []
+    total = 0
+    try:
+        names = os.listdir(cache_dir)
+    except Exception:
+        return 0
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except Exception:
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except Exception:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def generation_lock(key: str) -> _KeyLock:
+    """同一個鍵同時只讓一個 session 呼叫 LLM，其他人等它寫入快取後直接讀取
+
+    呼叫端在 acquire 到 release 期間要一直持有回傳的物件
+    """
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = _KeyLock()
+        return lock
@@ -0,0 +1,154 @@
+import pandas as pd
+
+
+CHIP_NAMES = {
+    "Foreign_Investor": "外資",
+    "Investment_Trust": "投信",
+    "Dealer_Self": "自營商(自行)",
+    "Dealer_Hedging": "自營商(避險)",
+}
+
+
+def pivot_chip(df):
+    """FinMind 法人買賣超明細 -> 每日一列、各法人一欄的買賣超 (股)"""
+    if df is None or df.empty:
+        return None
+    df = df.copy()
+    if "buy_sell" not in df and {"buy", "sell"} <= set(df.columns):
+        df["buy_sell"] = df["buy"] - df["sell"]
+    df["name"] = df["name"].map(CHIP_NAMES)
+    df["date"] = pd.to_datetime(df["date"])
+    return df.pivot_table(
+        index="date", columns="name", values="buy_sell", aggfunc="sum"
+    ).fillna(0)
+
+
+def chip_5d_sums(df_chip):
+    """近 5 日外資 / 投信買賣超 (股)"""
+    if df_chip is None:
+        return 0, 0
+    f = df_chip["外資"].tail(5).sum() if "外資" in df_chip else 0
+    t = df_chip["投信"].tail(5).sum() if "投信" in df_chip else 0
+    return f, t
+
+
+def chip_message(df_chip):
+    if df_chip is None:
+        return "籌碼中性"
+    f, t = chip_5d_sums(df_chip)
+    return f"近5日外資{int(f / 1000)}張/投信{int(t / 1000)}張"
+
+
+# 量化評分 (加入動能權重)
+def calculate_quant_score(bundle, df_chip, fundamentals):
+    techs = bundle.techs
+    scores = {}
+
+    # 1. 技術面
+    tech_score = 50
+    if techs["Trend"] == "多頭":
+        tech_score += 10
+    if techs["MACD_Hist"] > 0:
+        tech_score += 10
+    if techs["K"] > techs["D"]:
+        tech_score += 10
+    if techs["RSI"] > 80:
+        tech_score -= 10
+    elif techs["RSI"] < 20:
+        tech_score += 10
+    scores["技術"] = min(max(tech_score, 0), 100)
+
+    # 2. 籌碼面
+    chip_score = 50
+    if df_chip is not None:
+        try:
+            f = df_chip["外資"].tail(5).sum() if "外資" in df_chip else 0
+            t = df_chip["投信"].tail(5).sum() if "投信" in df_chip else 0
+            if t > 0:
+                chip_score += 20
+            if f < -5000:
+                chip_score -= 20
+            elif f > 0:
+                chip_score += 10
+        except:
+            pass
+    scores["籌碼"] = min(max(chip_score, 0), 100)
+
+    # 3. 價值面 (更嚴格)
+    val_score = 50
+    pe = fundamentals["pe"]
+    pb = fundamentals["pb"]
+
+    if pb > 0 and pb < 1.0:
+        val_score += 20
+    if pe > 0 and pe < 15:
+        val_score += 20
+    if techs["Trend"] == "空頭" and val_score > 60:  # 價值陷阱扣分
+        val_score -= 20
+
+    scores["價值"] = min(max(val_score, 0), 100)
+
+    # 4. 股息
+    dy = fundamentals["yield"]
+    scores["股息"] = min(max(50 + (dy - 3) * 10, 0), 100) if dy else 50
+
+    return scores
+
+
+# AI 分析 (v7.0 戰術動能版)
+def ai_features(code, name, price, techs, fund, chip_msg):
+    """Prompt 實際用到的輸入，依 prompt 顯示的精度取整；相同特徵即共用同一份分析"""
+    return {
+        "code": code,
+        "name": name,
+        "price": round(float(price), 2),
+        "above_ma60": bool(price > techs["MA60"]),
+        "k": round(float(techs["K"]), 1),
+        "d": round(float(techs["D"]), 1),
+        "macd_up": bool(techs["MACD_Hist"] > 0),
+        "rsi": round(float(techs["RSI"]), 1),
+        "pe": round(float(fund["pe"] or 0), 1),
+        "pb": round(float(fund["pb"] or 0), 2),
+        "yield": round(float(fund["yield"] or 0), 1),
+        "chip": chip_msg,
+    }
+
+
+def build_ai_prompt(code, name, price, techs, quant, fund, chip_msg):
+    kd_status = "黃金交叉(偏多)" if techs["K"] > techs["D"] else "死亡交叉(偏空)"
+    macd_status = "紅柱(動能強)" if techs["MACD_Hist"] > 0 else "綠柱(動能弱)"
+    ma_status = "站上季線(長多)" if price > techs["MA60"] else "跌破季線(長空)"
+
+    prompt = f"""
+    角色：嚴格的避險基金操盤手。分析 {name} ({code})。
+    目標：不要只看價值，要看「動能」與「陷阱」。
+    
+    【市場數據】
+    - 股價: {price:.2f}
+    - 趨勢: {ma_status}
+    - KD指標: K={techs["K"]:.1f}, D={techs["D"]:.1f} -> {kd_status}
+    - MACD動能: {macd_status}
+    - RSI: {techs["RSI"]:.1f}
+    
+    【基本面估值】
+    - PE: {fund["pe"]:.1f}倍 / PB: {fund["pb"]:.2f}倍 / 殖利率: {fund["yield"]:.1f}%
+    - 警告：若趨勢為空頭且 PB < 1，可能是「價值陷阱」，請勿盲目推薦買進。
+    
+    【籌碼】{chip_msg}
+    
+    請依照 Markdown 輸出：
+    # 決策：[強力買進 / 拉回布局 / 觀望 / 反彈減碼 / 放空] (請選最嚴格的一個)
+    
+    ### ⚔️ 技術動能判讀 (最重要)
+    * **KD 與 MACD 解析**：(解讀目前的動能是增強還是減弱？)
+    * **趨勢確認**：(確認股價與季線 MA60 的關係)。
+    
+    ### 🏢 估值陷阱檢測
+    * (若 PB 低但技術面弱，請直言「可能是價值陷阱，不宜過早接刀」)。
+    * (若基本面佳且技術面轉強，才可稱為「價值浮現」)。
+    
+    ### 💡 實戰操作策略
+    * **關鍵點位**：(給出支撐與壓力)。
+    * **進場條件**：(例如：需等待 MACD 翻紅，或站回月線才可進場)。
+    """
+    return prompt
@@ -2,12 +2,15 @@ import os
 import time
 from typing import Any, Optional
 
-import requests
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, Header, HTTPException
 from pydantic import BaseModel, Field
 
+# 下面的模組在 import 時就會讀取設定
+load_dotenv()
+
 from alert_store import read_recent_alerts
+from notifier import get_notifier, load_metrics
 from watchlist_store import (
     DEFAULT_WATCHLIST_FILE,
     load_watchlist_file,
@@ -15,11 +18,7 @@ from watchlist_store import (
 )
 
 
-load_dotenv()
-
 APP_API_KEY = os.getenv("APP_API_KEY")
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
 
 def require_api_key(
@@ -32,14 +31,10 @@ def require_api_key(
 
 
 def send_telegram_message(msg: str) -> None:
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+    status = get_notifier(process="api_server").send(msg, channels=("telegram",)).get("telegram")
+    if status == "skipped":
         raise HTTPException(status_code=500, detail="Telegram not configured")
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": TELEGRAM_CHAT_ID, "text": msg}
-    try:
-        res = requests.post(url, json=payload, timeout=10)
-        res.raise_for_status()
-    except Exception:
+    if status != "ok":
         raise HTTPException(status_code=502, detail="Failed to send Telegram message")
 
 
@@ -96,3 +91,16 @@ def get_alerts(limit: int = 100) -> dict[str, Any]:
 def notify_test(payload: MessagePayload) -> dict[str, Any]:
     send_telegram_message(payload.message)
     return {"ok": True}
+
+
+@app.get("/notify/metrics", dependencies=[Depends(require_api_key)])
+def notify_metrics() -> dict[str, Any]:
+    # 各程序 (每日報告、盤中監控、本 API) 發送後各自寫檔，這裡彙整
+    processes = load_metrics()
+    totals: dict[str, dict[str, int]] = {}
+    for item in processes.values():
+        for name, m in (item.get("channels") or {}).items():
+            total = totals.setdefault(name, {"sent": 0, "failed": 0, "skipped": 0})
+            for k in total:
+                total[k] += int(m.get(k, 0))
+    return {"channels": totals, "processes": processes}
@@ -2,15 +2,32 @@ import streamlit as st
 import yfinance as yf
 import pandas as pd
 import twstock
-import ta
-import json
 import os
+import time
 import requests
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from groq import Groq
 from datetime import datetime, timedelta
 
+from finmind_cache import FINMIND_CACHE_MAX_LAG_DAYS, load_stock_rows
+from fundamentals_store import empty_fundamentals, get_fundamentals, stored_fundamentals
+import ai_cache
+from analysis import (
+    ai_features,
+    build_ai_prompt,
+    calculate_quant_score,
+    chip_5d_sums,
+    chip_message,
+    pivot_chip,
+)
+from chart_render import CHART_RANGES, get_price_figure
+from detail_snapshots import load_snapshot, sync_snapshot_file
+from fetch_cache import FETCH_TIMEOUTS, fetch_cache, fetch_pool, screener_pool, submit_once, wait_result
+from indicators import data_version, get_bundle
+from llm_stream import StreamStats, split_header, stream_chat
+from sidebar_model import load_sidebar_model, sheet_cache
+from stock_search import resolve_stock, search_stocks
+from watchlist_store import load_watchlist_file
+
 try:
     import gspread
 except Exception:
@@ -36,12 +53,19 @@ except:
     SERVICE_ACCOUNT_INFO = None
 
 WATCHLIST_SHEET_NAME = os.environ.get("WATCHLIST_SHEET_NAME", "watchlist")
+AI_STREAMING = os.environ.get("AI_STREAMING", "1") != "0"
+AI_MODEL = "llama-3.3-70b-versatile"
+SNAPSHOT_FILE = os.environ.get("DETAIL_SNAPSHOT_FILE", "detail_snapshots.bin")
 
 
 # ==========================================
 # 2. 數據獲取與計算
 # ==========================================
 def get_finmind_data(dataset, code, days=90):
+    # 先讀批次同步的本地快取 (夠新才用)，沒有或過期才對 FinMind 發單檔請求
+    rows = load_stock_rows(dataset, code, days=days, max_lag_days=FINMIND_CACHE_MAX_LAG_DAYS)
+    if rows:
+        return pd.DataFrame(rows)
     try:
         url = "https://api.finmindtrade.com/api/v4/data"
         start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
@@ -50,9 +74,11 @@ def get_finmind_data(dataset, code, days=90):
         data = r.json()
         if data["msg"] == "success" and data["data"]:
             return pd.DataFrame(data["data"])
-        return None
     except:
-        return None
+        pass
+    # 網路也失敗：過期或不完整的快取總比沒有好
+    rows = load_stock_rows(dataset, code, days=days, allow_partial=True)
+    return pd.DataFrame(rows) if rows else None
 
 
 def load_watchlist_from_sheet():
@@ -76,24 +102,15 @@ def load_watchlist_from_sheet():
 
 def get_chip_data(code):
     df = get_finmind_data("TaiwanStockInstitutionalInvestorBuySell", code, days=60)
-    if df is not None:
-        df["name"] = df["name"].map(
-            {
-                "Foreign_Investor": "外資",
-                "Investment_Trust": "投信",
-                "Dealer_Self": "自營商(自行)",
-                "Dealer_Hedging": "自營商(避險)",
-            }
-        )
-        df["date"] = pd.to_datetime(df["date"])
-        return df.pivot_table(
-            index="date", columns="name", values="buy_sell", aggfunc="sum"
-        ).fillna(0)
-    return None
+    return pivot_chip(df)
 
 
 def get_fundamental_data(code, ticker):
-    data = {"pe": 0, "pb": 0, "yield": 0, "source": "None"}
+    data = empty_fundamentals()
+    # 0. 批次更新的估值檔 (每日一次，免網路)
+    stored = get_fundamentals(code)
+    if stored and not stored["stale"]:
+        return stored_fundamentals(stored, stale=False)
     # 1. FinMind
     df = get_finmind_data("TaiwanStockPER", code, days=90)
     if df is not None and not df.empty:
@@ -102,6 +119,8 @@ def get_fundamental_data(code, ticker):
         data["pb"] = latest.get("PBR", 0)
         data["yield"] = latest.get("dividend_yield", 0)
         data["source"] = "FinMind"
+        data["as_of"] = latest.get("date")
+        data["stale"] = False
     # 2. Yahoo Fallback
     if data["pe"] == 0 and data["yield"] == 0:
         try:
@@ -111,151 +130,28 @@ def get_fundamental_data(code, ticker):
             y_val = info.get("dividendYield", 0)
             data["yield"] = y_val * 100 if y_val else 0
             data["source"] = "Yahoo"
+            data["as_of"] = datetime.now().strftime("%Y-%m-%d")
+            data["stale"] = False
         except:
             pass
+    # 3. 即時來源都失敗時，退回過期的估值檔並標示
+    if data["source"] == "None" and stored:
+        return stored_fundamentals(stored, stale=True)
     return data
 
 
-def calculate_technicals(df):
-    """計算 KD, MACD, RSI"""
-    close = df["Close"]
-
-    # RSI
-    rsi = ta.momentum.rsi(close, window=14).iloc[-1]
-
-    # MACD
-    macd = ta.trend.MACD(close)
-    macd_line = macd.macd().iloc[-1]
-    macd_signal = macd.macd_signal().iloc[-1]
-    macd_hist = macd.macd_diff().iloc[-1]
-
-    # KD
-    stoch = ta.momentum.StochasticOscillator(
-        df["High"], df["Low"], close, window=9, smooth_window=3
-    )
-    k = stoch.stoch().iloc[-1]
-    d = stoch.stoch_signal().iloc[-1]
-
-    # MA
-    ma20 = ta.trend.sma_indicator(close, 20).iloc[-1]
-    ma60 = ta.trend.sma_indicator(close, 60).iloc[-1]
-
-    return {
-        "RSI": rsi,
-        "MACD_Hist": macd_hist,
-        "K": k,
-        "D": d,
-        "MA20": ma20,
-        "MA60": ma60,
-        "Trend": "多頭" if close.iloc[-1] > ma60 else "空頭",
-    }
-
-
-# ==========================================
-# 3. 量化評分 (加入動能權重)
-# ==========================================
-def calculate_quant_score(df_tech, df_chip, fundamentals, techs):
-    scores = {}
-
-    # 1. 技術面
-    tech_score = 50
-    if techs["Trend"] == "多頭":
-        tech_score += 10
-    if techs["MACD_Hist"] > 0:
-        tech_score += 10
-    if techs["K"] > techs["D"]:
-        tech_score += 10
-    if techs["RSI"] > 80:
-        tech_score -= 10
-    elif techs["RSI"] < 20:
-        tech_score += 10
-    scores["技術"] = min(max(tech_score, 0), 100)
-
-    # 2. 籌碼面
-    chip_score = 50
-    if df_chip is not None:
-        try:
-            f = df_chip["外資"].tail(5).sum() if "外資" in df_chip else 0
-            t = df_chip["投信"].tail(5).sum() if "投信" in df_chip else 0
-            if t > 0:
-                chip_score += 20
-            if f < -5000:
-                chip_score -= 20
-            elif f > 0:
-                chip_score += 10
-        except:
-            pass
-    scores["籌碼"] = min(max(chip_score, 0), 100)
-
-    # 3. 價值面 (更嚴格)
-    val_score = 50
-    pe = fundamentals["pe"]
-    pb = fundamentals["pb"]
-
-    if pb > 0 and pb < 1.0:
-        val_score += 20
-    if pe > 0 and pe < 15:
-        val_score += 20
-    if techs["Trend"] == "空頭" and val_score > 60:  # 價值陷阱扣分
-        val_score -= 20
-
-    scores["價值"] = min(max(val_score, 0), 100)
-
-    # 4. 股息
-    dy = fundamentals["yield"]
-    scores["股息"] = min(max(50 + (dy - 3) * 10, 0), 100) if dy else 50
-
-    return scores
-
-
 # ==========================================
-# 4. AI 分析 (v7.0 戰術動能版)
+# 3. AI 分析 (v7.0 戰術動能版)
 # ==========================================
 def get_ai_analysis(code, name, price, techs, quant, fund, chip_msg):
     if not GROQ_API_KEY:
         return "⚠️ 請設定 API Key"
 
-    kd_status = "黃金交叉(偏多)" if techs["K"] > techs["D"] else "死亡交叉(偏空)"
-    macd_status = "紅柱(動能強)" if techs["MACD_Hist"] > 0 else "綠柱(動能弱)"
-    ma_status = "站上季線(長多)" if price > techs["MA60"] else "跌破季線(長空)"
-
-    prompt = f"""
-    角色：嚴格的避險基金操盤手。分析 {name} ({code})。
-    目標：不要只看價值，要看「動能」與「陷阱」。
-    
-    【市場數據】
-    - 股價: {price:.2f}
-    - 趨勢: {ma_status}
-    - KD指標: K={techs["K"]:.1f}, D={techs["D"]:.1f} -> {kd_status}
-    - MACD動能: {macd_status}
-    - RSI: {techs["RSI"]:.1f}
-    
-    【基本面估值】
-    - PE: {fund["pe"]:.1f}倍 / PB: {fund["pb"]:.2f}倍 / 殖利率: {fund["yield"]:.1f}%
-    - 警告：若趨勢為空頭且 PB < 1，可能是「價值陷阱」，請勿盲目推薦買進。
-    
-    【籌碼】{chip_msg}
-    
-    請依照 Markdown 輸出：
-    # 決策：[強力買進 / 拉回布局 / 觀望 / 反彈減碼 / 放空] (請選最嚴格的一個)
-    
-    ### ⚔️ 技術動能判讀 (最重要)
-    * **KD 與 MACD 解析**：(解讀目前的動能是增強還是減弱？)
-    * **趨勢確認**：(確認股價與季線 MA60 的關係)。
-    
-    ### 🏢 估值陷阱檢測
-    * (若 PB 低但技術面弱，請直言「可能是價值陷阱，不宜過早接刀」)。
-    * (若基本面佳且技術面轉強，才可稱為「價值浮現」)。
-    
-    ### 💡 實戰操作策略
-    * **關鍵點位**：(給出支撐與壓力)。
-    * **進場條件**：(例如：需等待 MACD 翻紅，或站回月線才可進場)。
-    """
-
+    prompt = build_ai_prompt(code, name, price, techs, quant, fund, chip_msg)
     client = Groq(api_key=GROQ_API_KEY)
     try:
         completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+            model=AI_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
             max_tokens=850,
@@ -265,69 +161,295 @@ def get_ai_analysis(code, name, price, techs, quant, fund, chip_msg):
         return f"Error: {e}"
 
 
+def is_cacheable_analysis(analysis):
+    return bool(analysis) and not analysis.startswith(("Error", "⚠️"))
+
+
+def render_verdict(slot, header):
+    header = header or "AI 沒有回應"
+    if "買進" in header:
+        slot.error(f"### {header}")
+    elif "放空" in header or "減碼" in header:
+        slot.success(f"### {header}")
+    else:
+        slot.warning(f"### {header}")
+
+
+def render_ai_stream(prompt, refresh_sec=0.1):
+    """邊收邊畫：第一行 (# 決策：...) 一到就先顯示顏色框，內文隨後補上"""
+    header_slot = st.empty()
+    body_slot = st.empty()
+    header_slot.caption("AI 正在進行多空動能審查...")
+    stats = StreamStats()
+    text = ""
+    header = None
+    last_render = 0.0
+    try:
+        for delta in stream_chat(prompt, GROQ_API_KEY, stats, model=AI_MODEL):
+            text += delta
+            if header is None:
+                header, _ = split_header(text)
+                if header is not None:
+                    render_verdict(header_slot, header)
+            now = time.time()
+            if header is not None and now - last_render >= refresh_sec:
+                body_slot.markdown(split_header(text)[1] + "▌")
+                last_render = now
+    except Exception as e:
+        # 中途斷線：保留已收到的內容給使用者看，但標成失敗 (不會寫進快取)
+        text = f"Error: {e}" if not text.strip() else f"⚠️ AI 回應中斷 ({e})\n{text}"
+    if not text.strip():
+        text = "⚠️ AI 沒有回應"
+
+    header, body = split_header(text + "\n")
+    render_verdict(header_slot, header)
+    body_slot.markdown(body)
+    return text, stats
+
+
+# ==========================================
+# 4. 監控清單總覽 (批次計算)
+# ==========================================
+SCREENER_PERIOD = "6mo"
+SCREENER_TIMEOUT = float(os.environ.get("SCREENER_TIMEOUT", "30"))
+
+
+def prefetch_prices(symbols, period=SCREENER_PERIOD):
+    """快取裡沒有的代號用一次 yf.download 批次下載，再逐檔寫回共用快取"""
+    missing = {
+        code: sym
+        for code, sym in symbols.items()
+        if fetch_cache.get("price", code, extra=period) is None
+    }
+    if not missing:
+        return 0
+    try:
+        data = yf.download(
+            list(missing.values()),
+            period=period,
+            group_by="ticker",
+            auto_adjust=True,
+            progress=False,
+            threads=True,
+        )
+    except Exception:
+        return 0
+    if data is None or data.empty:
+        return 0
+    stored = 0
+    for code, sym in missing.items():
+        try:
+            df = data[sym] if isinstance(data.columns, pd.MultiIndex) else data
+            df = df.dropna(how="all")
+        except KeyError:
+            continue
+        if len(df) >= 20:
+            fetch_cache.put("price", code, df, extra=period)
+            stored += 1
+    return stored
+
+
+def screener_row(code, suffix, name):
+    """單檔的總覽列；只讀共用快取，缺的才補抓，估值不打 Yahoo"""
+    df = fetch_cache.get_or_fetch(
+        "price",
+        code,
+        lambda: yf.Ticker(f"{code}{suffix}").history(period=SCREENER_PERIOD),
+        extra=SCREENER_PERIOD,
+        should_cache=lambda d: d is not None and len(d) >= 20,
+    )
+    if df is None or len(df) < 20:
+        return None
+    bundle = get_bundle(code, df)
+    techs = bundle.techs
+    df_chip = fetch_cache.get_or_fetch("chip", code, lambda: get_chip_data(code))
+
+    fund = fetch_cache.get("fundamental", code)
+    if fund is None:
+        stored = get_fundamentals(code)
+        fund = stored_fundamentals(stored, stored["stale"]) if stored else empty_fundamentals()
+    quant = calculate_quant_score(bundle, df_chip, fund)
+    f, t = chip_5d_sums(df_chip)
+    latest = bundle.latest_price
+    return {
+        "代號": code,
+        "名稱": name,
+        "股價": round(latest, 2),
+        "漲跌%": round((latest / bundle.prev_price - 1) * 100, 2),
+        "RSI": round(techs["RSI"], 1),
+        "K": round(techs["K"], 1),
+        "D": round(techs["D"], 1),
+        "MACD": "翻紅" if techs["MACD_Hist"] > 0 else "翻黑",
+        "趨勢": techs["Trend"],
+        "技術": quant["技術"],
+        "籌碼": quant["籌碼"],
+        "價值": quant["價值"],
+        "股息": quant["股息"],
+        "總分": int(sum(quant.values()) / 4),
+        "外資5日(張)": int(f / 1000),
+        "投信5日(張)": int(t / 1000),
+    }
+
+
+def build_screener(codes, timeout=SCREENER_TIMEOUT):
+    """
+    先批次下載股價，再把每檔的指標 / 籌碼 / 評分平行算好。
+    回傳 (DataFrame, 失敗或逾時的代號)。
+    """
+    resolved, failed = [], []
+    for c in dict.fromkeys(codes):
+        code, suffix, name = resolve_stock_code(c)
+        if code:
+            resolved.append((code, suffix, name))
+        else:
+            failed.append(c)
+    prefetch_prices({code: f"{code}{suffix}" for code, suffix, _ in resolved})
+
+    deadline = time.time() + timeout
+    # 獨立的池；前一次 rerun 還在算的代號直接等同一個結果，不重複排入
+    futures = {
+        item[0]: submit_once(screener_pool, ("screener", item[0]), screener_row, *item)
+        for item in resolved
+    }
+    rows = []
+    for code, future in futures.items():
+        row = wait_result(future, deadline)
+        if row is None:
+            failed.append(code)
+        else:
+            rows.append(row)
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df = df.sort_values("總分", ascending=False, ignore_index=True)
+    return df, failed
+
+
 # ==========================================
 # 5. 主程式 (UI 回歸版)
 # ==========================================
 def resolve_stock_code(query):
-    query = query.strip()
-    target_code = None
-    market_type = "上市"
-    if query.isdigit():
-        target_code = query
-        if target_code in twstock.codes:
-            market_type = twstock.codes[target_code].market
-    else:
-        for code in twstock.codes:
-            if twstock.codes[code].name == query:
-                target_code = code
-                market_type = twstock.codes[code].market
-                break
-    if target_code:
-        suffix = ".TW" if market_type == "上市" else ".TWO"
-        return target_code, suffix, twstock.codes[target_code].name
+    entry = resolve_stock(query)
+    if entry:
+        return entry.code, entry.suffix, entry.name
+    # 索引不收權證等類別，完全符合的代號仍可查
+    code = query.strip()
+    if code in twstock.codes:
+        info = twstock.codes[code]
+        return code, ".TW" if info.market == "上市" else ".TWO", info.name
     return None, None, None
 
 
+def render_metrics(code, name, bundle):
+    """股價 / KD / MACD 指標卡；回傳總分欄位的 placeholder"""
+    techs = bundle.techs
+    latest = bundle.latest_price
+    color = "#ff2b2b" if latest - bundle.prev_price > 0 else "#2dc937"
+
+    st.markdown(f"## {name} ({code})")
+    c1, c2, c3, c4 = st.columns(4)
+    c1.markdown(
+        f"#### 股價\n<h2 style='color:{color}'>${latest:.2f}</h2>",
+        unsafe_allow_html=True,
+    )
+    c2.markdown(f"#### KD指標\n### K{techs['K']:.0f} / D{techs['D']:.0f}")
+    c3.markdown(f"#### MACD\n### {'🟥翻紅' if techs['MACD_Hist'] > 0 else '🟩翻黑'}")
+    score_slot = c4.empty()
+    score_slot.markdown("#### 總分\n### ⏳")
+    return score_slot
+
+
+def render_score(slot, quant):
+    slot.markdown(
+        f"#### 總分\n<h2 style='color:orange'>{int(sum(quant.values()) / 4)}</h2>",
+        unsafe_allow_html=True,
+    )
+
+
+def render_analysis(analysis):
+    header, body = split_header(analysis + "\n")
+    render_verdict(st.empty(), header)
+    st.markdown(body)
+
+
+def render_snapshot(code, name, snap):
+    """批次作業產生的快照，不發任何網路請求；按「即時更新」才改抓即時資料"""
+    bundle = snap["bundle"]
+    fund = snap["fundamentals"]
+    df_chip = snap["chip"]
+
+    score_slot = render_metrics(code, name, bundle)
+    render_score(score_slot, snap["quant"])
+    c1, c2 = st.columns([4, 1])
+    stale_mark = " ⚠️ 過期" if snap["stale"] else ""
+    c1.caption(
+        f"📦 快照 {snap['as_of']}{stale_mark} (產生於 {snap['generated_at']}) · "
+        f"估值來源: {fund['source']} ({fund['as_of'] or '無資料'})"
+    )
+    c2.button("🔄 即時更新", key="go_live", on_click=go_live, args=(code,), use_container_width=True)
+
+    st.markdown("---")
+    st.plotly_chart(
+        get_price_figure(code, "snapshot", ("snapshot", snap["generated_at"]), bundle, df_chip),
+        use_container_width=True,
+        key="chart_snapshot",
+    )
+
+    with st.chat_message("assistant"):
+        analysis = snap.get("ai")
+        if not analysis:
+            features = ai_features(
+                code, name, bundle.latest_price, bundle.techs, fund, chip_message(df_chip)
+            )
+            analysis = ai_cache.get(ai_cache.make_key(AI_MODEL, features))
+        if analysis:
+            render_analysis(analysis)
+        else:
+            st.caption("快照未附 AI 分析，按「🔄 即時更新」產生")
+
+
+def go_live(code):
+    st.session_state["live_codes"].add(code)
+
+
+def open_stock(code):
+    # 在 widget 建立前 (callback) 切換頁面
+    st.session_state["current_stock"] = code
+    st.session_state["page"] = "個股分析"
+
+
 if "current_stock" not in st.session_state:
     st.session_state["current_stock"] = None
+if "live_codes" not in st.session_state:
+    # 按過「即時更新」的代號，不再使用快照
+    st.session_state["live_codes"] = set()
 
 # --- 🟢 這裡把側邊欄邏輯找回來了！ ---
 st.sidebar.title("📂 戰情室資料庫")
+page = st.sidebar.radio("頁面", ["個股分析", "監控清單總覽"], horizontal=True, key="page")
 if st.sidebar.button("🔄 重新讀取"):
+    sheet_cache.invalidate("watchlist")
+    if st.session_state["current_stock"]:
+        fetch_cache.invalidate(st.session_state["current_stock"])
     st.rerun()
 
-db = {}
-try:
-    with open("stock_database.json", "r", encoding="utf-8") as f:
-        db = json.load(f)
-    if db:
-        st.sidebar.caption(
-            f"上次更新: {next(iter(db.values())).get('update_time', '未知')}"
-        )
-except:
+# 資料庫只在檔案更新時重新解析；Sheets 清單有 TTL 並於背景更新
+sidebar_model = load_sidebar_model("stock_database.json")
+db = sidebar_model["db"] if sidebar_model else {}
+if db:
+    st.sidebar.caption(f"上次更新: {sidebar_model['update_time']}")
+elif sidebar_model is None:
     st.sidebar.warning("尚未讀取到資料庫 (請等待 GitHub Actions 執行)")
 
-watchlist_codes = load_watchlist_from_sheet()
+watchlist_codes = sheet_cache.get("watchlist", load_watchlist_from_sheet)
 if not watchlist_codes:
-    if os.path.exists("watchlist.json"):
-        try:
-            with open("watchlist.json", "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if isinstance(data, list):
-                watchlist_codes = [c for c in data if isinstance(c, str)]
-        except:
-            watchlist_codes = []
+    watchlist_codes = load_watchlist_file("watchlist.json")
 if not watchlist_codes:
     env_watchlist = os.environ.get("WATCHLIST_CODES", "")
     if env_watchlist.strip():
         watchlist_codes = [c.strip() for c in env_watchlist.split(",") if c.strip()]
 
-red_list = [v for k, v in db.items() if v.get("status") == "RED"]
-green_list = [v for k, v in db.items() if v.get("status") == "GREEN"]
-yellow_list = [v for k, v in db.items() if v.get("status") == "YELLOW"]
-
-red_top = sorted(red_list, key=lambda x: x.get("pct_change", 0), reverse=True)[:10]
-green_top = sorted(green_list, key=lambda x: x.get("pct_change", 0))[:10]
+red_top = sidebar_model["red_top"] if sidebar_model else []
+green_top = sidebar_model["green_top"] if sidebar_model else []
 
 with st.sidebar:
     with st.expander("🔴 強勢 Top10", expanded=True):
@@ -360,11 +482,26 @@ with st.sidebar:
 
     st.markdown("---")
     # 搜尋框放在選單下面
-    q = st.text_input("搜尋代號/名稱", label_visibility="collapsed")
-    if st.button("🚀 AI 深度分析", type="primary", use_container_width=True) and q:
-        c, _, _ = resolve_stock_code(q)
-        if c:
-            st.session_state["current_stock"] = c
+    q = st.text_input(
+        "搜尋代號/名稱", placeholder="代號、名稱、簡稱或拼音首字 (tjd)", label_visibility="collapsed"
+    )
+    matches = search_stocks(q, limit=8) if q else []
+    pick = None
+    if matches:
+        pick = st.selectbox(
+            "候選",
+            matches,
+            format_func=lambda e: f"{e.code} {e.name}",
+            label_visibility="collapsed",
+            key="search_pick",
+        )
+    elif q:
+        st.caption("找不到符合的股票")
+    if st.button("🚀 AI 深度分析", type="primary", use_container_width=True) and pick:
+        st.session_state["current_stock"] = pick.code
+
+    # 主畫面跑完才填入，才能反映本次 rerun 的命中狀況
+    cache_status = st.empty()
 
 # --- 主畫面 ---
 st.title("📈 台股 AI 戰情室 (v7.1 完全體)")
@@ -372,115 +509,152 @@ st.title("📈 台股 AI 戰情室 (v7.1 完全體)")
 
 target = st.session_state["current_stock"]
 
-if target:
+if page == "監控清單總覽":
+    st.markdown("## 🟡 監控清單總覽")
+    if not watchlist_codes:
+        st.info("尚未設定監控清單")
+    else:
+        with st.spinner(f"計算 {len(watchlist_codes)} 檔..."):
+            started = time.time()
+            df_screen, failed = build_screener(watchlist_codes)
+        st.caption(f"{len(df_screen)} 檔 · {time.time() - started:.1f}s (點欄位標題可排序)")
+        if failed:
+            st.warning(f"資料不足或逾時: {', '.join(failed)}")
+        if not df_screen.empty:
+            st.dataframe(df_screen, use_container_width=True, hide_index=True)
+            pick = st.selectbox("查看個股", [""] + df_screen["代號"].tolist(), key="screener_pick")
+            if pick:
+                st.button("🚀 AI 深度分析", key="screener_go", on_click=open_stock, args=(pick,))
+
+elif target:
     code, suffix, name = resolve_stock_code(target)
-    if code:
+    snap = None
+    sync_snapshot_file(path=SNAPSHOT_FILE)
+    if code and code not in st.session_state["live_codes"]:
+        snap = load_snapshot(code, SNAPSHOT_FILE)
+    if snap:
+        render_snapshot(code, name, snap)
+    elif code:
         try:
             ticker = yf.Ticker(f"{code}{suffix}")
-            df_tech = ticker.history(period="6mo")
+            range_label = st.radio(
+                "區間", list(CHART_RANGES), horizontal=True, key="chart_range"
+            )
+            period = CHART_RANGES[range_label]
+            # 股價 / 籌碼 / 估值同時發出，畫面依到達順序逐步更新
+            started = time.time()
+            futures = {
+                "price": fetch_pool.submit(
+                    fetch_cache.get_or_fetch,
+                    "price",
+                    code,
+                    lambda: ticker.history(period=period),
+                    extra=period,
+                    should_cache=lambda df: df is not None and len(df) >= 20,
+                ),
+                "chip": fetch_pool.submit(
+                    fetch_cache.get_or_fetch, "chip", code, lambda: get_chip_data(code)
+                ),
+                "fundamental": fetch_pool.submit(
+                    fetch_cache.get_or_fetch,
+                    "fundamental",
+                    code,
+                    lambda: get_fundamental_data(code, ticker),
+                    should_cache=lambda d: d["source"] != "None",
+                ),
+            }
+            df_tech = wait_result(futures["price"], started + FETCH_TIMEOUTS["price"])
 
-            if len(df_tech) < 20:
+            if df_tech is None or len(df_tech) < 20:
                 st.error("❌ 資料不足")
             else:
-                # 執行 v7.0 的核心計算
-                df_chip = get_chip_data(code)
-                fund = get_fundamental_data(code, ticker)
-                techs = calculate_technicals(df_tech)  # 包含 KD, MACD
-                quant = calculate_quant_score(df_tech, df_chip, fund, techs)
-
-                # 準備 AI 訊息
-                chip_msg = "籌碼中性"
-                if df_chip is not None:
-                    f = df_chip["外資"].tail(5).sum() if "外資" in df_chip else 0
-                    t = df_chip["投信"].tail(5).sum() if "投信" in df_chip else 0
-                    chip_msg = f"近5日外資{int(f / 1000)}張/投信{int(t / 1000)}張"
+                # 指標只算一次，指標卡 / 圖表 / 評分 / AI 共用
+                bundle = get_bundle(code, df_tech)
+                techs = bundle.techs
 
                 # UI 顯示
-                latest = df_tech["Close"].iloc[-1]
-                chg = latest - df_tech["Close"].iloc[-2]
-                color = "#ff2b2b" if chg > 0 else "#2dc937"
-
-                st.markdown(f"## {name} ({code})")
-                c1, c2, c3, c4 = st.columns(4)
-                c1.markdown(
-                    f"#### 股價\n<h2 style='color:{color}'>${latest:.2f}</h2>",
-                    unsafe_allow_html=True,
-                )
-                c2.markdown(f"#### KD指標\n### K{techs['K']:.0f} / D{techs['D']:.0f}")
-                c3.markdown(
-                    f"#### MACD\n### {'🟥翻紅' if techs['MACD_Hist'] > 0 else '🟩翻黑'}"
-                )
-                c4.markdown(
-                    f"#### 總分\n<h2 style='color:orange'>{int(sum(quant.values()) / 4)}</h2>",
-                    unsafe_allow_html=True,
-                )
+                latest = bundle.latest_price
+                score_slot = render_metrics(code, name, bundle)
+                fund_slot = st.empty()
 
                 st.markdown("---")
 
-                # 圖表
-                fig = make_subplots(
-                    rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3]
-                )
-                df_tech["MA20"] = techs["MA20"]
-                df_tech["MA60"] = techs["MA60"]
-
-                fig.add_trace(
-                    go.Candlestick(
-                        x=df_tech.index,
-                        open=df_tech["Open"],
-                        high=df_tech["High"],
-                        low=df_tech["Low"],
-                        close=df_tech["Close"],
-                        name="K線",
-                    ),
-                    row=1,
-                    col=1,
-                )
-                fig.add_trace(
-                    go.Scatter(
-                        x=df_tech.index,
-                        y=df_tech["MA60"],
-                        line=dict(color="green", width=1),
-                        name="季線",
-                    ),
-                    row=1,
-                    col=1,
+                # 圖表：先畫 K 線，籌碼到了再補上
+                chart_slot = st.empty()
+                version = data_version(df_tech)
+                chart_slot.plotly_chart(
+                    get_price_figure(code, period, version, bundle, None),
+                    use_container_width=True,
+                    key="chart_price",
                 )
 
+                df_chip = wait_result(
+                    futures["chip"], started + FETCH_TIMEOUTS["chip"]
+                )
                 if df_chip is not None:
-                    df_chip = df_chip.reindex(df_tech.index).fillna(0)
-                    fig.add_trace(
-                        go.Bar(
-                            x=df_chip.index,
-                            y=df_chip["投信"],
-                            marker_color="red",
-                            name="投信",
-                        ),
-                        row=2,
-                        col=1,
+                    chart_slot.plotly_chart(
+                        get_price_figure(code, period, version, bundle, df_chip),
+                        use_container_width=True,
+                        key="chart_full",
                     )
 
-                st.plotly_chart(fig, use_container_width=True)
-
-                # AI
-                with st.chat_message("assistant"):
-                    with st.spinner("AI 正在進行多空動能審查..."):
-                        analysis = get_ai_analysis(
-                            code, name, latest, techs, quant, fund, chip_msg
-                        )
-
-                        parts = analysis.split("\n", 1)
-                        header = parts[0].replace("#", "").strip()
-                        body = parts[1] if len(parts) > 1 else ""
+                fund = wait_result(
+                    futures["fundamental"],
+                    started + FETCH_TIMEOUTS["fundamental"],
+                    default=empty_fundamentals(),
+                )
+                quant = calculate_quant_score(bundle, df_chip, fund)
+                render_score(score_slot, quant)
+                stale_mark = " ⚠️ 過期" if fund["stale"] else ""
+                fund_slot.caption(
+                    f"估值來源: {fund['source']} ({fund['as_of'] or '無資料'}){stale_mark}"
+                )
 
-                        if "買進" in header:
-                            st.error(f"### {header}")
-                        elif "放空" in header or "減碼" in header:
-                            st.success(f"### {header}")
-                        else:
-                            st.warning(f"### {header}")
+                # 準備 AI 訊息
+                chip_msg = chip_message(df_chip)
 
-                        st.markdown(body)
+                # AI (依輸入特徵快取，同一交易日內特徵相同就不再呼叫 LLM)
+                with st.chat_message("assistant"):
+                    ai_key = ai_cache.make_key(
+                        AI_MODEL, ai_features(code, name, latest, techs, fund, chip_msg)
+                    )
+                    analysis = ai_cache.get(ai_key)
+                    streamed = False
+                    if analysis is None:
+                        gen_lock = ai_cache.generation_lock(ai_key)
+                        if not gen_lock.acquire(blocking=False):
+                            with st.spinner("同一檔分析產生中，等待共用結果..."):
+                                gen_lock.acquire()
+                            analysis = ai_cache.get(ai_key)
+                        try:
+                            if analysis is None and AI_STREAMING and GROQ_API_KEY:
+                                prompt = build_ai_prompt(
+                                    code, name, latest, techs, quant, fund, chip_msg
+                                )
+                                analysis, ai_stats = render_ai_stream(prompt)
+                                streamed = True
+                                if ai_stats.ttft is not None:
+                                    st.caption(
+                                        f"⏱️ 首字 {ai_stats.ttft:.2f}s · 完成 {ai_stats.total:.2f}s"
+                                    )
+                            elif analysis is None:
+                                with st.spinner("AI 正在進行多空動能審查..."):
+                                    analysis = get_ai_analysis(
+                                        code, name, latest, techs, quant, fund, chip_msg
+                                    )
+                            if is_cacheable_analysis(analysis):
+                                ai_cache.put(ai_key, analysis, AI_MODEL)
+                        finally:
+                            gen_lock.release()
+
+                    if not streamed:
+                        render_analysis(analysis)
 
         except Exception as e:
             st.error(f"Err: {e}")
+
+cache_stats = fetch_cache.summary()
+cache_status.caption(
+    f"快取 命中 {cache_stats['hit'] + cache_stats['disk_hit']} / 未命中 {cache_stats['miss']}"
+    f" (磁碟 {cache_stats['disk_hit']}, 淘汰 {cache_stats['evict']}, 共 {cache_stats['entries']} 筆)"
+)
@@ -11,6 +11,8 @@ from plotly.subplots import make_subplots
 from groq import Groq
 from datetime import datetime, timedelta
 
+import ai_cache
+
 # ==========================================
 # 1. 設定與金鑰
 # ==========================================
@@ -96,6 +98,18 @@ def get_ai_analysis(code, name, df_tech, df_chip):
     else:
         chip_msg = "無籌碼數據。"
 
+    model = "llama-3.3-70b-versatile"
+    # 與 app.py 的 prompt 不同，以 prompt 名稱區隔快取
+    cache_key = ai_cache.make_key(model, {
+        "prompt": "batch_scan", "code": code, "name": name,
+        "price": round(float(price), 2), "ma20": round(float(ma20), 2),
+        "ma60": round(float(ma60), 2), "rsi": round(float(rsi), 1),
+        "vol": int(vol), "chip": chip_msg,
+    })
+    cached = ai_cache.get(cache_key)
+    if cached:
+        return cached
+
     client = Groq(api_key=GROQ_API_KEY)
     
     prompt = f"""
@@ -113,11 +127,14 @@ def get_ai_analysis(code, name, df_tech, df_chip):
     """
     try:
         completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+            model=model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3, max_tokens=650
         )
-        return completion.choices[0].message.content
+        analysis = completion.choices[0].message.content
+        if analysis:
+            ai_cache.put(cache_key, analysis, model)
+        return analysis
     except Exception as e: return f"AI Error: {e}"
 
 # ==========================================
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "300"))
+FIGURE_CACHE_SIZE = 32
+
+# 下拉選單顯示名稱 -> yfinance period
+CHART_RANGES = {"6個月": "6mo", "1年": "1y", "2年": "2y", "5年": "5y"}
+
+_lock = threading.Lock()
+# 只快取序列化後的 JSON 字串 (不可變)，各 session 各自拿到新的 Figure，不共用同一個物件
+_figures: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+def _bucket_starts(n: int, max_points: int) -> np.ndarray:
+    size = max(1, -(-n // max(1, max_points)))
+    return np.arange(0, n, size)
+
+
+def bucket_ohlc(bundle, max_points: int = CHART_MAX_POINTS) -> dict[str, Any]:
+    """
+    依固定桶寬合併 K 棒：開=桶內第一筆、高=最高、低=最低、收=最後一筆。
+    均線取每桶最後一筆，與合併後的 K 棒對齊。資料點不超過 max_points 時原樣回傳。
+    """
+    n = len(bundle.close)
+    if n <= max_points:
+        return {
+            "x": bundle.index,
+            "open": bundle.open,
+            "high": bundle.high,
+            "low": bundle.low,
+            "close": bundle.close,
+            "ma20": bundle.ma20,
+            "ma60": bundle.ma60,
+            "starts": None,
+        }
+    starts = _bucket_starts(n, max_points)
+    ends = np.append(starts[1:], n) - 1
+    return {
+        "x": bundle.index[starts],
+        "open": bundle.open[starts],
+        "high": np.fmax.reduceat(bundle.high, starts),
+        "low": np.fmin.reduceat(bundle.low, starts),
+        "close": bundle.close[ends],
+        "ma20": bundle.ma20[ends],
+        "ma60": bundle.ma60[ends],
+        "starts": starts,
+    }
+
+
+def bucket_sum(values: np.ndarray, starts: Optional[np.ndarray]) -> np.ndarray:
+    if starts is None:
+        return values
+    return np.add.reduceat(values, starts)
+
+
+def build_price_figure(bundle, df_chip: Optional[pd.DataFrame], max_points: int = CHART_MAX_POINTS) -> go.Figure:
+    data = bucket_ohlc(bundle, max_points)
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3])
+
+    fig.add_trace(
+        go.Candlestick(
+            x=data["x"],
+            open=data["open"],
+            high=data["high"],
+            low=data["low"],
+            close=data["close"],
+            name="K線",
+        ),
+        row=1,
+        col=1,
+    )
+    # 均線用 WebGL 繪製
+    fig.add_trace(
+        go.Scattergl(
+            x=data["x"],
+            y=data["ma20"],
+            line=dict(color="orange", width=1),
+            name="月線",
+        ),
+        row=1,
+        col=1,
+    )
+    fig.add_trace(
+        go.Scattergl(
+            x=data["x"],
+            y=data["ma60"],
+            line=dict(color="green", width=1),
+            name="季線",
+        ),
+        row=1,
+        col=1,
+    )
+
+    if df_chip is not None and "投信" in df_chip:
+        chip = df_chip["投信"].reindex(bundle.index).fillna(0).to_numpy(dtype=float)
+        fig.add_trace(
+            go.Bar(
+                x=data["x"],
+                y=bucket_sum(chip, data["starts"]),
+                marker_color="red",
+                name="投信",
+            ),
+            row=2,
+            col=1,
+        )
+    fig.update_layout(xaxis_rangeslider_visible=False)
+    return fig
+
+
+def figure_from_json(spec: str) -> go.Figure:
+    """由快取的 JSON 建 Figure；內容來自已驗證過的圖表，跳過逐欄驗證 (約 1ms，完整驗證要 10ms 以上)"""
+    return go.Figure(json.loads(spec), _validate=False)
+
+
+def get_price_figure_json(
+    code: str,
+    chart_range: str,
+    version: tuple,
+    bundle,
+    df_chip: Optional[pd.DataFrame],
+    max_points: int = CHART_MAX_POINTS,
+) -> str:
+    """同一檔、同一區間、同一版資料的圖表只建一次並序列化一次"""
+    chip_version = None
+    if df_chip is not None and len(df_chip):
+        chip_version = (len(df_chip), str(df_chip.index[-1]))
+    key = (str(code), chart_range, version, chip_version, max_points)
+    with _lock:
+        spec = _figures.get(key)
+        if spec is not None:
+            _figures.move_to_end(key)
+            return spec
+    spec = build_price_figure(bundle, df_chip, max_points).to_json()
+    with _lock:
+        _figures[key] = spec
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            _figures.popitem(last=False)
+    return spec
+
+
+def get_price_figure(
+    code: str,
+    chart_range: str,
+    version: tuple,
+    bundle,
+    df_chip: Optional[pd.DataFrame],
+    max_points: int = CHART_MAX_POINTS,
+) -> go.Figure:
+    """從快取的 JSON 建出這個 session 專用的 Figure"""
+    return figure_from_json(get_price_figure_json(code, chart_range, version, bundle, df_chip, max_points))
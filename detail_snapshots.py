@@ -0,0 +1,396 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+import requests
+
+from analysis import build_ai_prompt, calculate_quant_score, chip_message, pivot_chip
+from finmind_cache import CHIP_DATASET, DEFAULT_CACHE_DIR, load_stock_rows
+from fundamentals_store import empty_fundamentals, get_fundamentals, last_trading_day, stored_fundamentals
+from indicators import IndicatorBundle, compute_bundle
+from watchlist_store import load_watchlist_file
+
+
+DEFAULT_SNAPSHOT_FILE = os.getenv("DETAIL_SNAPSHOT_FILE", "detail_snapshots.bin")
+SNAPSHOT_ROWS = int(os.getenv("SNAPSHOT_ROWS", "130"))
+# 多抓一段讓 MA60 / MACD 有足夠的暖機資料，快照只保留最後 SNAPSHOT_ROWS 筆
+HISTORY_PERIOD = "1y"
+DOWNLOAD_CHUNK = 50
+AI_MODEL = "llama-3.3-70b-versatile"
+
+COLUMNS = (
+    "open", "high", "low", "close", "volume",
+    "rsi", "macd", "macd_signal", "macd_hist", "k", "d", "ma20", "ma60",
+)
+DTYPE = np.float32
+# 快照檔 (數 MB) 不進 git 歷史：批次作業上傳到 GitHub Release，儀表板從這個網址下載
+DETAIL_SNAPSHOT_URL = os.getenv("DETAIL_SNAPSHOT_URL", "")
+DETAIL_SNAPSHOT_SYNC_SEC = float(os.getenv("DETAIL_SNAPSHOT_SYNC_SEC", "1800"))
+
+# 檔案格式：[各檔矩陣 + meta JSON ...][索引 JSON][索引位移 uint64][MAGIC]
+MAGIC = b"TWSNAP01"
+_FOOTER = struct.Struct("<Q8s")
+
+_lock = threading.Lock()
+# path -> 下次檢查遠端快照的時間
+_sync_at: dict[str, float] = {}
+# path -> (mtime, size, mmap, index)
+_files: dict[str, tuple[float, int, mmap.mmap, dict[str, Any]]] = {}
+# (path, mtime, code) -> snapshot
+_snapshots: dict[tuple, dict[str, Any]] = {}
+
+
+# ==========================================
+# 寫入 (批次作業)
+# ==========================================
+def build_record(
+    code: str,
+    name: str,
+    df: pd.DataFrame,
+    df_chip: Optional[pd.DataFrame],
+    fund: dict[str, Any],
+    ai_text: Optional[str] = None,
+    rows: int = SNAPSHOT_ROWS,
+) -> tuple[np.ndarray, dict[str, Any]]:
+    """單檔快照：最近 rows 筆的 OHLCV + 指標矩陣，以及評分 / 籌碼 / 估值 / AI 摘要"""
+    bundle = compute_bundle(df)
+    matrix = np.column_stack([getattr(bundle, c)[-rows:] for c in COLUMNS]).astype(DTYPE)
+    dates = [d.strftime("%Y-%m-%d") for d in pd.DatetimeIndex(bundle.index[-rows:])]
+
+    chip = None
+    if df_chip is not None and not df_chip.empty:
+        recent = df_chip.tail(rows)
+        chip = {
+            "dates": [d.strftime("%Y-%m-%d") for d in pd.DatetimeIndex(recent.index)],
+            "columns": [str(c) for c in recent.columns],
+            "data": recent.to_numpy(dtype=float).tolist(),
+        }
+    meta = {
+        "code": code,
+        "name": name,
+        "as_of": dates[-1],
+        "dates": dates,
+        "techs": bundle.techs,
+        "quant": calculate_quant_score(bundle, df_chip, fund),
+        "fundamentals": fund,
+        "chip": chip,
+        "ai": ai_text,
+        "ai_model": AI_MODEL if ai_text else None,
+    }
+    return matrix, meta
+
+
+def _json_default(value: Any) -> Any:
+    # numpy 純量
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def write_snapshots(records: dict[str, tuple[np.ndarray, dict[str, Any]]], path: str = DEFAULT_SNAPSHOT_FILE) -> int:
+    """全部寫成單一檔案後 os.replace，讀取端不會看到寫一半的內容"""
+    index = {
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "columns": list(COLUMNS),
+        "dtype": np.dtype(DTYPE).str,
+        "stocks": {},
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        for code, (matrix, meta) in records.items():
+            # 矩陣起點對齊 8 bytes
+            f.write(b"\0" * (-f.tell() % 8))
+            offset = f.tell()
+            f.write(np.ascontiguousarray(matrix, dtype=DTYPE).tobytes())
+            meta_offset = f.tell()
+            meta_bytes = json.dumps(meta, ensure_ascii=False, default=_json_default).encode("utf-8")
+            f.write(meta_bytes)
+            index["stocks"][code] = {
+                "offset": offset,
+                "rows": int(matrix.shape[0]),
+                "meta_offset": meta_offset,
+                "meta_len": len(meta_bytes),
+                "as_of": meta["as_of"],
+            }
+        index_offset = f.tell()
+        f.write(json.dumps(index, ensure_ascii=False).encode("utf-8"))
+        f.write(_FOOTER.pack(index_offset, MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(records)
+
+
+# ==========================================
+# 讀取 (儀表板)
+# ==========================================
+def _open(path: str) -> Optional[tuple[float, mmap.mmap, dict[str, Any]]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    with _lock:
+        cached = _files.get(path)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[0], cached[2], cached[3]
+    if st.st_size < _FOOTER.size:
+        return None
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, magic = _FOOTER.unpack(mm[-_FOOTER.size:])
+        if magic != MAGIC:
+            return None
+        index = json.loads(mm[index_offset:-_FOOTER.size].decode("utf-8"))
+    except Exception:
+        return None
+    with _lock:
+        # 舊的 mmap 可能還被先前回傳的陣列引用，交給 GC 釋放
+        _files[path] = (st.st_mtime, st.st_size, mm, index)
+        for key in [k for k in _snapshots if k[0] == path and k[1] != st.st_mtime]:
+            del _snapshots[key]
+    return st.st_mtime, mm, index
+
+
+def snapshot_index(path: str = DEFAULT_SNAPSHOT_FILE) -> Optional[dict[str, Any]]:
+    opened = _open(path)
+    return opened[2] if opened else None
+
+
+def download_snapshot_file(url: str, path: str = DEFAULT_SNAPSHOT_FILE, timeout: float = 30) -> bool:
+    """
+    遠端檔案有變更 (ETag 不同) 才下載；格式檢查通過才 os.replace，
+    已開啟的 mmap 仍指向舊檔，不受影響。回傳本地檔是否有更新。
+    """
+    etag_path = f"{path}.etag"
+    headers = {}
+    if os.path.exists(path):
+        try:
+            with open(etag_path, "r", encoding="utf-8") as f:
+                headers["If-None-Match"] = f.read().strip()
+        except Exception:
+            pass
+    tmp = f"{path}.{os.getpid()}.download"
+    try:
+        with requests.get(url, headers=headers, timeout=timeout, stream=True) as res:
+            if res.status_code == 304:
+                return False
+            res.raise_for_status()
+            with open(tmp, "wb") as f:
+                for chunk in res.iter_content(1 << 20):
+                    f.write(chunk)
+            etag = res.headers.get("ETag", "")
+        with open(tmp, "rb") as f:
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            if _FOOTER.unpack(f.read(_FOOTER.size))[1] != MAGIC:
+                raise ValueError("快照格式錯誤")
+        os.replace(tmp, path)
+        with open(etag_path, "w", encoding="utf-8") as f:
+            f.write(etag)
+        return True
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+
+
+def sync_snapshot_file(
+    url: str = DETAIL_SNAPSHOT_URL, path: str = DEFAULT_SNAPSHOT_FILE, interval: float = DETAIL_SNAPSHOT_SYNC_SEC
+) -> None:
+    """每 interval 秒最多在背景檢查一次遠端快照，不阻塞目前的頁面"""
+    if not url:
+        return
+    with _lock:
+        if time.time() < _sync_at.get(path, 0):
+            return
+        _sync_at[path] = time.time() + interval
+    threading.Thread(target=download_snapshot_file, args=(url, path), daemon=True).start()
+
+
+def _is_stale(as_of: str, now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now()
+    return as_of < last_trading_day(now - timedelta(days=1))
+
+
+def load_snapshot(
+    code: str, path: str = DEFAULT_SNAPSHOT_FILE, now: Optional[datetime] = None
+) -> Optional[dict[str, Any]]:
+    """
+    只解碼被查詢的那一檔；數值序列是 mmap 上的唯讀 view，不另外複製。
+    回傳 meta 加上 bundle (IndicatorBundle)、chip (DataFrame 或 None)、generated_at、stale。
+    """
+    opened = _open(path)
+    if opened is None:
+        return None
+    mtime, mm, index = opened
+    entry = index["stocks"].get(str(code))
+    if entry is None:
+        return None
+    key = (path, mtime, str(code))
+    with _lock:
+        snap = _snapshots.get(key)
+    if snap is None:
+        try:
+            snap = _decode(mm, index, entry)
+        except Exception:
+            return None
+        with _lock:
+            _snapshots[key] = snap
+    return dict(snap, stale=_is_stale(snap["as_of"], now))
+
+
+def _decode(mm: mmap.mmap, index: dict[str, Any], entry: dict[str, Any]) -> dict[str, Any]:
+    columns = index["columns"]
+    start, end = entry["meta_offset"], entry["meta_offset"] + entry["meta_len"]
+    meta = json.loads(mm[start:end].decode("utf-8"))
+    matrix = np.frombuffer(
+        mm, dtype=np.dtype(index["dtype"]), count=entry["rows"] * len(columns), offset=entry["offset"]
+    ).reshape(entry["rows"], len(columns))
+    series = {c: matrix[:, i] for i, c in enumerate(columns)}
+    bundle = IndicatorBundle(index=pd.DatetimeIndex(meta["dates"]), techs=meta["techs"], **series)
+
+    df_chip = None
+    chip = meta.get("chip")
+    if chip:
+        df_chip = pd.DataFrame(chip["data"], index=pd.DatetimeIndex(chip["dates"]), columns=chip["columns"])
+    return dict(meta, bundle=bundle, chip=df_chip, generated_at=index.get("generated_at"))
+
+
+# ==========================================
+# 批次產生
+# ==========================================
+def _symbol(code: str) -> str:
+    import twstock
+
+    info = twstock.codes.get(code)
+    suffix = ".TWO" if info is not None and info.market != "上市" else ".TW"
+    return f"{code}{suffix}"
+
+
+def _name(code: str) -> str:
+    import twstock
+
+    info = twstock.codes.get(code)
+    return info.name if info is not None else code
+
+
+def download_histories(codes: list[str], period: str = HISTORY_PERIOD, chunk: int = DOWNLOAD_CHUNK) -> dict[str, pd.DataFrame]:
+    import yfinance as yf
+
+    out: dict[str, pd.DataFrame] = {}
+    for i in range(0, len(codes), chunk):
+        part = {_symbol(c): c for c in codes[i : i + chunk]}
+        try:
+            data = yf.download(
+                list(part), period=period, group_by="ticker", auto_adjust=True, progress=False, threads=True
+            )
+        except Exception as e:
+            print(f"⚠️ 下載失敗 ({i}-{i + len(part)}): {e}")
+            continue
+        if data is None or data.empty:
+            continue
+        for sym, code in part.items():
+            try:
+                df = data[sym] if isinstance(data.columns, pd.MultiIndex) else data
+            except KeyError:
+                continue
+            df = df.dropna(how="all")
+            if len(df) >= 20:
+                out[code] = df
+    return out
+
+
+def _ai_summary(prompt: str, api_key: str) -> Optional[str]:
+    try:
+        from groq import Groq
+
+        completion = Groq(api_key=api_key).chat.completions.create(
+            model=AI_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+            max_tokens=850,
+        )
+        return completion.choices[0].message.content
+    except Exception as e:
+        print(f"⚠️ AI 摘要失敗: {e}")
+        return None
+
+
+def build_snapshots(
+    codes: list[str],
+    names: Optional[dict[str, str]] = None,
+    path: str = DEFAULT_SNAPSHOT_FILE,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    ai_codes: Optional[set[str]] = None,
+    api_key: Optional[str] = None,
+) -> int:
+    """籌碼與估值只讀本地快取 / 估值檔；ai_codes 內的代號才呼叫 LLM 產生摘要"""
+    names = names or {}
+    ai_codes = ai_codes or set()
+    histories = download_histories(codes)
+    records = {}
+    for code in codes:
+        df = histories.get(code)
+        if df is None:
+            continue
+        rows = load_stock_rows(CHIP_DATASET, code, days=90, cache_dir=cache_dir)
+        df_chip = pivot_chip(pd.DataFrame(rows)) if rows else None
+        stored = get_fundamentals(code)
+        fund = stored_fundamentals(stored, stored["stale"]) if stored else empty_fundamentals()
+        name = names.get(code) or _name(code)
+
+        ai_text = None
+        if code in ai_codes and api_key:
+            bundle = compute_bundle(df)
+            price = bundle.latest_price
+            quant = calculate_quant_score(bundle, df_chip, fund)
+            prompt = build_ai_prompt(code, name, price, bundle.techs, quant, fund, chip_message(df_chip))
+            ai_text = _ai_summary(prompt, api_key)
+        try:
+            records[code] = build_record(code, name, df, df_chip, fund, ai_text)
+        except Exception as e:
+            print(f"⚠️ {code} 快照失敗: {e}")
+    return write_snapshots(records, path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="產生每檔個股的詳細快照 (供儀表板離線顯示)")
+    parser.add_argument("--db", default="stock_database.json")
+    parser.add_argument("--watchlist", default="watchlist.json")
+    parser.add_argument("--out", default=DEFAULT_SNAPSHOT_FILE)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--ai-limit", type=int, default=0, help="替監控清單前 N 檔預先產生 AI 摘要")
+    args = parser.parse_args()
+
+    try:
+        with open(args.db, "r", encoding="utf-8") as f:
+            db = json.load(f)
+    except Exception:
+        db = {}
+    watchlist = load_watchlist_file(args.watchlist)
+    codes = list(dict.fromkeys(list(db) + watchlist))
+    names = {code: item.get("name", code) for code, item in db.items()}
+
+    started = time.time()
+    count = build_snapshots(
+        codes,
+        names=names,
+        path=args.out,
+        cache_dir=args.cache_dir,
+        ai_codes=set(watchlist[: args.ai_limit]),
+        api_key=os.getenv("GROQ_API_KEY"),
+    )
+    size = os.path.getsize(args.out) / 1024
+    print(f"✅ 快照 {count}/{len(codes)} 檔 → {args.out} ({size:.0f} KB, {time.time() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from fundamentals_store import last_trading_day
+
+
+# 各資料來源的存活秒數
+SOURCE_TTL = {
+    "price": int(os.getenv("FETCH_TTL_PRICE_SEC", "300")),
+    "chip": int(os.getenv("FETCH_TTL_CHIP_SEC", "21600")),
+    "fundamental": int(os.getenv("FETCH_TTL_FUNDAMENTAL_SEC", "86400")),
+}
+DEFAULT_TTL = 600
+
+# 個股頁平行抓取時，各來源最多等待的秒數
+FETCH_TIMEOUTS = {
+    "price": float(os.getenv("FETCH_TIMEOUT_PRICE_SEC", "15")),
+    "chip": float(os.getenv("FETCH_TIMEOUT_CHIP_SEC", "8")),
+    "fundamental": float(os.getenv("FETCH_TIMEOUT_FUNDAMENTAL_SEC", "10")),
+}
+
+MEMORY_MAX_ENTRIES = int(os.getenv("FETCH_CACHE_MAX_ENTRIES", "256"))
+# 設定目錄才啟用磁碟層 (跨 session / 重啟共用)
+DISK_DIR = os.getenv("FETCH_CACHE_DIR", "")
+DISK_MAX_BYTES = int(float(os.getenv("FETCH_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+_MISS = object()
+
+
+class FetchCache:
+    def __init__(
+        self,
+        max_entries: int = MEMORY_MAX_ENTRIES,
+        disk_dir: str = DISK_DIR,
+        disk_max_bytes: int = DISK_MAX_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._mem: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hit": 0, "disk_hit": 0, "miss": 0, "evict": 0}
+        # 磁碟層目前大小的估計；None 表示還沒掃過目錄
+        self._disk_bytes: Optional[int] = None
+
+    @staticmethod
+    def make_key(source: str, code: str, extra: str = "") -> tuple:
+        return (source, str(code), last_trading_day(), str(extra))
+
+    def _disk_path(self, key: tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{key[0]}_{key[1]}_{digest}.pkl")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _mem_get(self, key: tuple) -> Any:
+        with self._lock:
+            item = self._mem.get(key)
+            if item is None:
+                return _MISS
+            expires, value = item
+            if expires < time.time():
+                del self._mem[key]
+                return _MISS
+            self._mem.move_to_end(key)
+            return value
+
+    def _mem_put(self, key: tuple, value: Any, expires: float) -> None:
+        with self._lock:
+            self._mem[key] = (expires, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+                self.stats["evict"] += 1
+
+    def _disk_get(self, key: tuple) -> tuple[Any, float]:
+        if not self.disk_dir:
+            return _MISS, 0
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                expires, value = pickle.load(f)
+        except Exception:
+            return _MISS, 0
+        if expires < time.time():
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+            return _MISS, 0
+        try:
+            # 讀到就更新 mtime，淘汰時以最近使用時間排序 (LRU)
+            os.utime(path, None)
+        except Exception:
+            pass
+        return value, expires
+
+    def _disk_put(self, key: tuple, value: Any, expires: float) -> None:
+        if not self.disk_dir:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            path = self._disk_path(key)
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump((expires, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp, path)
+            with self._lock:
+                if self._disk_bytes is not None:
+                    self._disk_bytes += size - old_size
+                over = self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+            # 只有估計值超過上限 (或還沒掃過) 才掃整個目錄
+            if over:
+                self._disk_evict()
+        except Exception:
+            return
+
+    def _disk_evict(self) -> None:
+        """重新計算磁碟層大小；超過上限時從最久沒使用的檔案開始刪"""
+        files = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                st = os.stat(path)
+            except Exception:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        evicted = 0
+        if total > self.disk_max_bytes:
+            for _, size, path in sorted(files):
+                try:
+                    os.remove(path)
+                except Exception:
+                    continue
+                total -= size
+                evicted += 1
+                if total <= self.disk_max_bytes:
+                    break
+        with self._lock:
+            self._disk_bytes = total
+            self.stats["evict"] += evicted
+
+    def get(self, source: str, code: str, extra: str = "") -> Any:
+        """只查快取，沒有時回傳 None (不觸發抓取)"""
+        key = self.make_key(source, code, extra)
+        value = self._mem_get(key)
+        if value is not _MISS:
+            self._count("hit")
+            return value
+        value, expires = self._disk_get(key)
+        if value is not _MISS:
+            self._count("disk_hit")
+            self._mem_put(key, value, expires)
+            return value
+        self._count("miss")
+        return None
+
+    def put(
+        self, source: str, code: str, value: Any, extra: str = "", ttl: Optional[int] = None
+    ) -> None:
+        key = self.make_key(source, code, extra)
+        expires = time.time() + (ttl if ttl is not None else SOURCE_TTL.get(source, DEFAULT_TTL))
+        self._mem_put(key, value, expires)
+        self._disk_put(key, value, expires)
+
+    def get_or_fetch(
+        self,
+        source: str,
+        code: str,
+        fetch: Callable[[], Any],
+        extra: str = "",
+        ttl: Optional[int] = None,
+        should_cache: Callable[[Any], bool] = lambda v: v is not None,
+    ) -> Any:
+        """依 (來源, 代號, 交易日, extra) 取快取，沒有才呼叫 fetch()"""
+        value = self.get(source, code, extra)
+        if value is not None:
+            return value
+        value = fetch()
+        if should_cache(value):
+            self.put(source, code, value, extra, ttl)
+        return value
+
+    def invalidate(self, code: Optional[str] = None) -> None:
+        with self._lock:
+            if code is None:
+                self._mem.clear()
+            else:
+                for key in [k for k in self._mem if k[1] == str(code)]:
+                    del self._mem[key]
+            # 磁碟檔案被刪掉，下次寫入時重新掃一次大小
+            self._disk_bytes = None
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return
+        for name in os.listdir(self.disk_dir):
+            if code is None or f"_{code}_" in name:
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except Exception:
+                    continue
+
+    def summary(self) -> dict[str, int]:
+        with self._lock:
+            return {**self.stats, "entries": len(self._mem)}
+
+
+# Streamlit 的各 session 共用同一個已匯入的模組，因此這個實例跨 session 共用
+fetch_cache = FetchCache()
+
+# 跨 rerun / session 共用的執行緒池；逾時的工作仍會跑完並寫入快取
+fetch_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FETCH_POOL_WORKERS", "8")), thread_name_prefix="fetch"
+)
+
+
+# 監控清單總覽專用的池：一次排入整份清單也不會佔滿 fetch_pool，拖慢其他 session 的個股頁
+screener_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SCREENER_POOL_WORKERS", "4")), thread_name_prefix="screener"
+)
+
+_inflight_lock = threading.Lock()
+# key -> 尚未完成的 Future
+_inflight: dict[Any, Future] = {}
+
+
+def submit_once(pool: ThreadPoolExecutor, key: Any, fn: Callable[..., Any], *args: Any) -> Future:
+    """同一個 key 還在計算時直接回傳同一個 Future (例如 rerun 重複送出同一份清單)"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None and not future.done():
+            return future
+        future = pool.submit(fn, *args)
+        _inflight[key] = future
+
+    def _done(f: Future) -> None:
+        with _inflight_lock:
+            if _inflight.get(key) is f:
+                del _inflight[key]
+
+    future.add_done_callback(_done)
+    return future
+
+
+def wait_result(future: Future, deadline: float, default: Any = None) -> Any:
+    """等到 deadline (time.time() 時間點) 為止，逾時或失敗回傳 default"""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.time()))
+    except Exception:
+        return default
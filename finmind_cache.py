@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+import requests
+
+
+FINMIND_API_URL = os.getenv("FINMIND_API_URL", "https://api.finmindtrade.com/api/v4/data")
+FINMIND_TOKEN = os.getenv("FINMIND_TOKEN")
+DEFAULT_CACHE_DIR = os.getenv("FINMIND_CACHE_DIR", "finmind_cache")
+# 儀表板讀快取時，最新一天落後今天超過這麼多個工作日就視為過期 (批次同步可能停了)
+FINMIND_CACHE_MAX_LAG_DAYS = int(os.getenv("FINMIND_CACHE_MAX_LAG_DAYS", "1"))
+
+CHIP_DATASET = "TaiwanStockInstitutionalInvestorBuySell"
+PER_DATASET = "TaiwanStockPER"
+BULK_DATASETS = (CHIP_DATASET, PER_DATASET)
+
+_index_lock = threading.Lock()
+# dataset -> (檔案指紋, {code: [rows...]})
+_index: dict[str, tuple[tuple, dict[str, list[dict[str, Any]]]]] = {}
+
+
+def _dataset_dir(dataset: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, dataset)
+
+
+def _day_path(dataset: str, date: str, cache_dir: str) -> str:
+    return os.path.join(_dataset_dir(dataset, cache_dir), f"{date}.json")
+
+
+def cached_dates(dataset: str, cache_dir: str = DEFAULT_CACHE_DIR) -> list[str]:
+    d = _dataset_dir(dataset, cache_dir)
+    if not os.path.isdir(d):
+        return []
+    return sorted(f[:-5] for f in os.listdir(d) if f.endswith(".json"))
+
+
+def fetch_dataset_day(
+    dataset: str,
+    date: str,
+    api_url: str = FINMIND_API_URL,
+    token: Optional[str] = FINMIND_TOKEN,
+    timeout: int = 30,
+) -> Optional[list[dict[str, Any]]]:
+    """一次抓取某日全市場的資料 (不帶 data_id)"""
+    params = {"dataset": dataset, "start_date": date, "end_date": date}
+    if token:
+        params["token"] = token
+    try:
+        r = requests.get(api_url, params=params, timeout=timeout)
+        data = r.json()
+        if data.get("msg") != "success":
+            return None
+        return list(data.get("data") or [])
+    except Exception:
+        return None
+
+
+def _write_day(dataset: str, date: str, rows: list[dict[str, Any]], cache_dir: str) -> None:
+    path = _day_path(dataset, date, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def sync_dataset(
+    dataset: str,
+    days: int = 90,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    api_url: str = FINMIND_API_URL,
+    today: Optional[datetime] = None,
+) -> dict[str, int]:
+    """
+    補齊最近 days 天中尚未快取的日期；已有的日期不再重抓。
+    當天若還沒有資料 (盤後尚未公布) 不寫檔，下次再補。
+    """
+    today = today or datetime.now()
+    today_s = today.strftime("%Y-%m-%d")
+    have = set(cached_dates(dataset, cache_dir))
+    fetched = failed = 0
+    for i in range(days, -1, -1):
+        day = today - timedelta(days=i)
+        if day.weekday() >= 5:
+            continue
+        date = day.strftime("%Y-%m-%d")
+        if date in have:
+            continue
+        rows = fetch_dataset_day(dataset, date, api_url=api_url)
+        if rows is None:
+            failed += 1
+            continue
+        if not rows and date == today_s:
+            continue
+        _write_day(dataset, date, rows, cache_dir)
+        fetched += 1
+    return {"fetched": fetched, "failed": failed, "cached": len(have) + fetched}
+
+
+def _fingerprint(dataset: str, cache_dir: str) -> tuple:
+    d = _dataset_dir(dataset, cache_dir)
+    if not os.path.isdir(d):
+        return ()
+    out = []
+    for name in sorted(os.listdir(d)):
+        if name.endswith(".json"):
+            out.append((name, os.path.getmtime(os.path.join(d, name))))
+    return tuple(out)
+
+
+def _load_index(dataset: str, cache_dir: str) -> dict[str, list[dict[str, Any]]]:
+    """把整個 dataset 讀進記憶體並依代號分組；檔案有變動才重建"""
+    key = f"{cache_dir}:{dataset}"
+    fp = _fingerprint(dataset, cache_dir)
+    with _index_lock:
+        cached = _index.get(key)
+        if cached and cached[0] == fp:
+            return cached[1]
+
+    by_code: dict[str, list[dict[str, Any]]] = {}
+    for date in cached_dates(dataset, cache_dir):
+        try:
+            with open(_day_path(dataset, date, cache_dir), "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except Exception:
+            continue
+        for row in rows:
+            code = str(row.get("stock_id", ""))
+            if code:
+                by_code.setdefault(code, []).append(row)
+
+    with _index_lock:
+        _index[key] = (fp, by_code)
+    return by_code
+
+
+def cache_lag_days(dataset: str, cache_dir: str = DEFAULT_CACHE_DIR, today: Optional[datetime] = None) -> Optional[int]:
+    """最新一天的快取之後到今天 (含) 有幾個工作日；沒有快取時回傳 None"""
+    dates = cached_dates(dataset, cache_dir)
+    if not dates:
+        return None
+    day = today or datetime.now()
+    lag = 0
+    while day.strftime("%Y-%m-%d") > dates[-1] and lag <= 366:
+        if day.weekday() < 5:
+            lag += 1
+        day -= timedelta(days=1)
+    return lag
+
+
+def load_stock_rows(
+    dataset: str,
+    code: str,
+    days: int = 90,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    today: Optional[datetime] = None,
+    max_lag_days: Optional[int] = None,
+    allow_partial: bool = False,
+) -> Optional[list[dict[str, Any]]]:
+    """
+    從本地快取取出單一代號的資料；快取中完全沒有此代號時回傳 None。
+    快取最早的日期晚於 days 天前 (同步的天數比要求的少) 時也回傳 None，
+    不把較短的序列當成完整資料；allow_partial=True 時照樣回傳有的部分。
+    給定 max_lag_days 時，快取落後超過這麼多個工作日也回傳 None (呼叫端改走網路)。
+    """
+    if max_lag_days is not None:
+        lag = cache_lag_days(dataset, cache_dir, today)
+        if lag is None or lag > max_lag_days:
+            return None
+    start_day = (today or datetime.now()) - timedelta(days=days)
+    start = start_day.strftime("%Y-%m-%d")
+    if not allow_partial:
+        # 同步只抓工作日：起點落在週末時，從下一個週一算起
+        while start_day.weekday() >= 5:
+            start_day += timedelta(days=1)
+        dates = cached_dates(dataset, cache_dir)
+        if not dates or dates[0] > start_day.strftime("%Y-%m-%d"):
+            return None
+    rows = _load_index(dataset, cache_dir).get(str(code))
+    if not rows:
+        return None
+    return [r for r in rows if str(r.get("date", "")) >= start]
+
+
+def net_buy_sell(row: dict[str, Any]) -> float:
+    if row.get("buy_sell") is not None:
+        return float(row["buy_sell"])
+    return float(row.get("buy", 0) or 0) - float(row.get("sell", 0) or 0)
+
+
+def chip_sums(
+    last_n_days: int = 5, cache_dir: str = DEFAULT_CACHE_DIR
+) -> dict[str, dict[str, float]]:
+    """全市場近 N 個交易日的法人買賣超合計，供批次籌碼評分使用"""
+    dates = cached_dates(CHIP_DATASET, cache_dir)[-last_n_days:]
+    if not dates:
+        return {}
+    start = dates[0]
+    out: dict[str, dict[str, float]] = {}
+    for code, rows in _load_index(CHIP_DATASET, cache_dir).items():
+        sums: dict[str, float] = {}
+        for row in rows:
+            if str(row.get("date", "")) < start:
+                continue
+            name = row.get("name", "")
+            try:
+                sums[name] = sums.get(name, 0.0) + net_buy_sell(row)
+            except Exception:
+                continue
+        if sums:
+            out[code] = sums
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="FinMind 全市場資料本地快取")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--dataset", action="append", default=None)
+    args = parser.parse_args()
+
+    for dataset in args.dataset or BULK_DATASETS:
+        result = sync_dataset(dataset, days=args.days, cache_dir=args.cache_dir)
+        print(
+            f"✅ {dataset}: 新增 {result['fetched']} 天 / 失敗 {result['failed']} / 共 {result['cached']} 天"
+        )
+
+
+if __name__ == "__main__":
+    main()
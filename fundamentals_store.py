@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from finmind_cache import DEFAULT_CACHE_DIR, PER_DATASET, cached_dates, load_stock_rows
+
+
+DEFAULT_FUNDAMENTALS_FILE = "fundamentals.json"
+
+_lock = threading.Lock()
+# path -> (mtime, data)
+_loaded: dict[str, tuple[float, dict[str, Any]]] = {}
+
+
+def last_trading_day(now: Optional[datetime] = None) -> str:
+    day = now or datetime.now()
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime("%Y-%m-%d")
+
+
+def _num(value: Any) -> Optional[float]:
+    try:
+        v = float(value)
+    except Exception:
+        return None
+    return v if v == v else None
+
+
+def load_fundamentals(path: str = DEFAULT_FUNDAMENTALS_FILE) -> dict[str, Any]:
+    """讀取估值檔；同一個程序內只有檔案更新時才重新解析"""
+    if not os.path.exists(path):
+        return {"as_of": None, "rows": {}}
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _loaded.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return {"as_of": None, "rows": {}}
+    data.setdefault("rows", {})
+    with _lock:
+        _loaded[path] = (mtime, data)
+    return data
+
+
+def get_fundamentals(
+    code: str, path: str = DEFAULT_FUNDAMENTALS_FILE, now: Optional[datetime] = None
+) -> Optional[dict[str, Any]]:
+    """
+    取得單檔估值 (pe/pb/yield 為 None 代表沒有資料，不是 0)。
+    as_of 為資料本身的日期、refreshed 為這一列最後一次更新成功的日期；
+    任一個超過一個交易日時 stale=True (批次沿用舊資料的代號也會標成過期)。
+    """
+    data = load_fundamentals(path)
+    row = data["rows"].get(str(code))
+    if not row:
+        return None
+    now = now or datetime.now()
+    out = dict(row)
+    # 舊格式的列沒有 refreshed，以資料日期為準
+    out["refreshed"] = row.get("refreshed") or row.get("as_of")
+    oldest = min(str(out.get("as_of") or ""), str(out["refreshed"] or ""))
+    out["stale"] = oldest < last_trading_day(now - timedelta(days=1))
+    return out
+
+
+def empty_fundamentals() -> dict[str, Any]:
+    """畫面用的估值格式 (缺值為 0)"""
+    return {"pe": 0, "pb": 0, "yield": 0, "source": "None", "as_of": None, "stale": True}
+
+
+def stored_fundamentals(stored: dict[str, Any], stale: bool) -> dict[str, Any]:
+    data = empty_fundamentals()
+    for k in ("pe", "pb", "yield"):
+        data[k] = stored.get(k) or 0
+    data.update(source=stored["source"], as_of=stored["as_of"], stale=stale)
+    return data
+
+
+def _from_finmind(code: str, cache_dir: str) -> Optional[dict[str, Any]]:
+    # 只取最新一筆，快取涵蓋的天數不足也沒關係
+    rows = load_stock_rows(PER_DATASET, code, days=30, cache_dir=cache_dir, allow_partial=True)
+    if not rows:
+        return None
+    latest = max(rows, key=lambda r: str(r.get("date", "")))
+    pe = _num(latest.get("PER"))
+    dy = _num(latest.get("dividend_yield"))
+    if not pe and not dy:
+        return None
+    return {
+        "pe": pe,
+        "pb": _num(latest.get("PBR")),
+        "yield": dy,
+        "source": "FinMind",
+        "as_of": str(latest.get("date", "")),
+    }
+
+
+def _from_yahoo(symbol: str, as_of: str) -> Optional[dict[str, Any]]:
+    try:
+        import yfinance as yf
+
+        info = yf.Ticker(symbol).info
+    except Exception:
+        return None
+    pe = _num(info.get("trailingPE"))
+    y_val = _num(info.get("dividendYield"))
+    if pe is None and y_val is None:
+        return None
+    return {
+        "pe": pe,
+        "pb": _num(info.get("priceToBook")),
+        "yield": y_val * 100 if y_val else y_val,
+        "source": "Yahoo",
+        "as_of": as_of,
+    }
+
+
+def refresh_fundamentals(
+    codes: list[str],
+    path: str = DEFAULT_FUNDAMENTALS_FILE,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    yahoo_symbols: Optional[dict[str, str]] = None,
+    force: bool = False,
+    now: Optional[datetime] = None,
+) -> dict[str, Any]:
+    """
+    批次更新全體估值，每個交易日最多一次 (force=True 可強制)。
+    優先使用 FinMind 本地快取；yahoo_symbols 給定時，缺資料的代號才逐檔查 Yahoo。
+    """
+    today = last_trading_day(now)
+    current = load_fundamentals(path)
+    if current.get("as_of") == today and not force:
+        return {"skipped": True, "as_of": today, "count": len(current["rows"])}
+
+    rows: dict[str, dict[str, Any]] = dict(current.get("rows", {}))
+    counts = {"FinMind": 0, "Yahoo": 0, "missing": 0}
+    for code in codes:
+        code = str(code)
+        row = _from_finmind(code, cache_dir)
+        if row is None and yahoo_symbols and code in yahoo_symbols:
+            row = _from_yahoo(yahoo_symbols[code], today)
+        if row is None:
+            # 沿用上次的資料 (保留原本的 refreshed，讀取時會標成過期)
+            counts["missing"] += 1
+            continue
+        rows[code] = {**row, "refreshed": today}
+        counts[row["source"]] += 1
+
+    data = {"as_of": today, "updated_at": int(time.time()), "rows": rows}
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    return {"skipped": False, "as_of": today, "count": len(rows), **counts}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="每日估值 (PE/PB/殖利率) 批次更新")
+    parser.add_argument("--db", default="stock_database.json", help="代號來源")
+    parser.add_argument("--out", default=DEFAULT_FUNDAMENTALS_FILE)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--yahoo", action="store_true", help="FinMind 缺資料時逐檔查 Yahoo")
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    codes: list[str] = []
+    yahoo_symbols: dict[str, str] = {}
+    if os.path.exists(args.db):
+        with open(args.db, "r", encoding="utf-8") as f:
+            codes = list(json.load(f).keys())
+    if not codes:
+        dates = cached_dates(PER_DATASET, args.cache_dir)
+        if dates:
+            day_file = os.path.join(args.cache_dir, PER_DATASET, f"{dates[-1]}.json")
+            with open(day_file, "r", encoding="utf-8") as f:
+                codes = sorted({str(r.get("stock_id")) for r in json.load(f)})
+    if args.yahoo:
+        import twstock
+
+        for code in codes:
+            if code in twstock.codes:
+                suffix = ".TW" if twstock.codes[code].market == "上市" else ".TWO"
+                yahoo_symbols[code] = f"{code}{suffix}"
+
+    result = refresh_fundamentals(
+        codes,
+        path=args.out,
+        cache_dir=args.cache_dir,
+        yahoo_symbols=yahoo_symbols or None,
+        force=args.force,
+    )
+    if result["skipped"]:
+        print(f"⏭️ {result['as_of']} 已更新過 ({result['count']} 檔)")
+    else:
+        print(
+            f"✅ {result['as_of']}: FinMind {result['FinMind']} / Yahoo {result['Yahoo']} / 缺 {result['missing']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Optional
+
+
+# 樹莓派上的常駐 / 排程入口；systemd 每次重啟都要付一次 import 成本
+ENTRY_POINTS = ("rpi_main", "rpi_intraday", "api_server")
+IMPORT_PROFILE_FILE = os.getenv("IMPORT_PROFILE_FILE", "import_profile.jsonl")
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> list[tuple[int, int, int, str]]:
+    """-X importtime 輸出 -> [(self_us, cumulative_us, 層級, 模組)]"""
+    rows = []
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return rows
+
+
+def profile_module(module: str, python: str = sys.executable) -> dict[str, Any]:
+    """在乾淨的子程序 import 一次，回傳總耗時與直接 import 的各模組耗時 (毫秒)"""
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    rows = parse_importtime(proc.stderr)
+    if proc.returncode != 0 or not rows:
+        return {"error": (proc.stderr.strip().splitlines() or ["import 失敗"])[-1]}
+    _, total, _, _ = rows[-1]
+    # 目標模組之下第一層的 import (依累計耗時)
+    children = {name: cum / 1000 for _, cum, level, name in rows if level == 1}
+    return {"total_ms": total / 1000, "children": children}
+
+
+def profile(modules: list[str], repeat: int = 5) -> dict[str, Any]:
+    """每個入口重複 repeat 次取中位數，避免第一次讀磁碟的誤差"""
+    out = {}
+    for module in modules:
+        runs = [profile_module(module) for _ in range(repeat)]
+        ok = [r for r in runs if "error" not in r]
+        if not ok:
+            out[module] = {"error": runs[0]["error"]}
+            continue
+        names = {n for r in ok for n in r["children"]}
+        children = {n: statistics.median(r["children"].get(n, 0.0) for r in ok) for n in names}
+        out[module] = {
+            "total_ms": round(statistics.median(r["total_ms"] for r in ok), 1),
+            "top": dict(sorted(((n, round(v, 1)) for n, v in children.items()), key=lambda x: -x[1])[:8]),
+        }
+    return out
+
+
+def load_last(path: str) -> Optional[dict[str, Any]]:
+    last = None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    last = json.loads(line)
+    except Exception:
+        return None
+    return last
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def parse_limits(values: list[str]) -> dict[Optional[str], float]:
+    """--max-ms 可給 "300" (所有入口) 或 "rpi_main=300" (單一入口)；key None 代表預設值"""
+    limits: dict[Optional[str], float] = {}
+    for value in values:
+        module, sep, ms = value.rpartition("=")
+        limits[module if sep else None] = float(ms)
+    return limits
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="入口程式的 import 耗時 (python -X importtime)")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default=IMPORT_PROFILE_FILE, help="結果附加到此 JSONL (空字串表示不存)")
+    parser.add_argument(
+        "--max-ms",
+        action="append",
+        default=[],
+        help="超過就以非 0 結束 (CI 用)；可重複給 模組=毫秒，例如 --max-ms rpi_main=400",
+    )
+    args = parser.parse_args(argv)
+    limits = parse_limits(args.max_ms)
+
+    previous = load_last(args.out) if args.out else None
+    result = profile(args.modules, repeat=args.repeat)
+
+    failed = False
+    for module, item in result.items():
+        if "error" in item:
+            print(f"❌ {module}: {item['error']}")
+            failed = True
+            continue
+        before = ((previous or {}).get("modules", {}).get(module) or {}).get("total_ms")
+        delta = f" ({item['total_ms'] - before:+.1f} ms)" if before is not None else ""
+        print(f"⏱️ {module}: {item['total_ms']:.1f} ms{delta}")
+        for name, ms in item["top"].items():
+            print(f"    {ms:8.1f} ms  {name}")
+        limit = limits.get(module, limits.get(None))
+        if limit and item["total_ms"] > limit:
+            print(f"⚠️ {module} 超過 {limit:g} ms")
+            failed = True
+
+    if args.out:
+        record = {
+            "ts": int(time.time()),
+            "rev": git_rev(),
+            "python": sys.version.split()[0],
+            "modules": result,
+        }
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
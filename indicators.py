@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import ta
+
+
+BUNDLE_CACHE_SIZE = 64
+
+_lock = threading.Lock()
+_bundles: "OrderedDict[tuple, IndicatorBundle]" = OrderedDict()
+
+
+def _frozen(series: pd.Series) -> np.ndarray:
+    arr = series.to_numpy(dtype=float)
+    arr.flags.writeable = False
+    return arr
+
+
+@dataclass(frozen=True)
+class IndicatorBundle:
+    """一次算好的完整指標序列 (唯讀 numpy 陣列) 與最新值，供指標卡、圖表、評分與 AI 共用"""
+
+    index: pd.Index
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    rsi: np.ndarray
+    macd: np.ndarray
+    macd_signal: np.ndarray
+    macd_hist: np.ndarray
+    k: np.ndarray
+    d: np.ndarray
+    ma20: np.ndarray
+    ma60: np.ndarray
+    techs: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def latest_price(self) -> float:
+        return float(self.close[-1])
+
+    @property
+    def prev_price(self) -> float:
+        return float(self.close[-2])
+
+
+def compute_bundle(df: pd.DataFrame) -> IndicatorBundle:
+    """計算 KD, MACD, RSI, MA"""
+    close = df["Close"]
+    macd = ta.trend.MACD(close)
+    stoch = ta.momentum.StochasticOscillator(
+        df["High"], df["Low"], close, window=9, smooth_window=3
+    )
+
+    rsi = _frozen(ta.momentum.rsi(close, window=14))
+    macd_hist = _frozen(macd.macd_diff())
+    k = _frozen(stoch.stoch())
+    d = _frozen(stoch.stoch_signal())
+    ma20 = _frozen(ta.trend.sma_indicator(close, 20))
+    ma60 = _frozen(ta.trend.sma_indicator(close, 60))
+    close_arr = _frozen(close)
+
+    techs = {
+        "RSI": float(rsi[-1]),
+        "MACD_Hist": float(macd_hist[-1]),
+        "K": float(k[-1]),
+        "D": float(d[-1]),
+        "MA20": float(ma20[-1]),
+        "MA60": float(ma60[-1]),
+        "Trend": "多頭" if close_arr[-1] > ma60[-1] else "空頭",
+    }
+    return IndicatorBundle(
+        index=df.index,
+        open=_frozen(df["Open"]),
+        high=_frozen(df["High"]),
+        low=_frozen(df["Low"]),
+        close=close_arr,
+        volume=_frozen(df["Volume"]),
+        rsi=rsi,
+        macd=_frozen(macd.macd()),
+        macd_signal=_frozen(macd.macd_signal()),
+        macd_hist=macd_hist,
+        k=k,
+        d=d,
+        ma20=ma20,
+        ma60=ma60,
+        techs=techs,
+    )
+
+
+def data_version(df: pd.DataFrame) -> tuple:
+    return (len(df), str(df.index[-1]), float(df["Close"].iloc[-1]), float(df["Volume"].iloc[-1]))
+
+
+def get_bundle(code: str, df: pd.DataFrame) -> IndicatorBundle:
+    """同一檔、同一版資料只計算一次"""
+    key = (str(code), data_version(df))
+    with _lock:
+        bundle = _bundles.get(key)
+        if bundle is not None:
+            _bundles.move_to_end(key)
+            return bundle
+    bundle = compute_bundle(df)
+    with _lock:
+        _bundles[key] = bundle
+        while len(_bundles) > BUNDLE_CACHE_SIZE:
+            _bundles.popitem(last=False)
+    return bundle
@@ -0,0 +1,309 @@
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import requests
+
+
+# 指向本地 stub server 以便測試 (見 llm_stub.py)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# 主要供應商超過這個秒數還沒回應，就同時呼叫備援，取先完成者
+HEDGE_DELAY_SEC = float(os.getenv("LLM_HEDGE_DELAY_SEC", "8"))
+LLM_TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "60"))
+# 連續 BREAKER_THRESHOLD 次失敗 / 過慢 / 輸給備援，就降為備援 BREAKER_COOLDOWN_SEC 秒
+SLOW_SEC = float(os.getenv("LLM_SLOW_SEC", "20"))
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN_SEC = float(os.getenv("LLM_BREAKER_COOLDOWN_SEC", "86400"))
+HEALTH_FILE = os.getenv("LLM_HEALTH_FILE", "llm_health.json")
+
+LATENCY_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# 回傳 (文字, 供應商回報的 token 用量 {"prompt": n, "output": n} 或 None)
+Usage = Optional[dict[str, int]]
+CallFn = Callable[[str, str, threading.Event], tuple[str, Usage]]
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Provider:
+    def __init__(self, name: str, call: CallFn):
+        self.name = name
+        self.call = call
+
+
+# ==========================================
+# 延遲統計與斷路器
+# ==========================================
+class ProviderHealth:
+    """單一供應商的延遲分佈 (固定桶) 與斷路器狀態，可存成 JSON 跨次執行累積"""
+
+    def __init__(self, data: Optional[dict[str, Any]] = None):
+        data = data or {}
+        counts = data.get("buckets") or []
+        self.buckets = counts if len(counts) == len(LATENCY_BUCKETS) + 1 else [0] * (len(LATENCY_BUCKETS) + 1)
+        self.failures = int(data.get("failures", 0))
+        self.strikes = int(data.get("strikes", 0))
+        self.open_until = float(data.get("open_until", 0))
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """以桶的上界估計百分位數 (最後一桶回傳 inf)"""
+        total = sum(self.buckets)
+        if not total:
+            return None
+        running = 0
+        for i, count in enumerate(self.buckets):
+            running += count
+            if running >= q * total:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+    def record(self, ok: bool, seconds: float, now: Optional[float] = None) -> None:
+        now = now or time.time()
+        self.observe(seconds)
+        if ok and seconds < SLOW_SEC:
+            self.strikes = 0
+            self.open_until = 0
+            return
+        if not ok:
+            self.failures += 1
+        self.strikes += 1
+        if self.strikes >= BREAKER_THRESHOLD:
+            self.open_until = now + BREAKER_COOLDOWN_SEC
+
+    def record_lost(self, seconds: float, now: Optional[float] = None) -> None:
+        """被備援搶先完成 (已取消)，實際延遲至少是 seconds，算一次過慢"""
+        now = now or time.time()
+        self.observe(seconds)
+        self.strikes += 1
+        if self.strikes >= BREAKER_THRESHOLD:
+            self.open_until = now + BREAKER_COOLDOWN_SEC
+
+    def is_open(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) < self.open_until
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "buckets": self.buckets,
+            "failures": self.failures,
+            "strikes": self.strikes,
+            "open_until": self.open_until,
+        }
+
+    def summary(self) -> str:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        state = "降級" if self.is_open() else "正常"
+        if p50 is None:
+            return f"{state}, 尚無資料"
+        return f"{state}, p50≤{p50:g}s p90≤{p90:g}s, 共 {sum(self.buckets)} 次"
+
+
+class HealthStore:
+    def __init__(self, path: Optional[str] = HEALTH_FILE):
+        self.path = path
+        self.providers: dict[str, ProviderHealth] = {}
+        data = {}
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                data = {}
+        for name, item in data.items():
+            self.providers[name] = ProviderHealth(item)
+
+    def get(self, name: str) -> ProviderHealth:
+        if name not in self.providers:
+            self.providers[name] = ProviderHealth()
+        return self.providers[name]
+
+    def order(self, providers: list[Provider]) -> list[Provider]:
+        """斷路器打開的供應商排到後面 (仍可當備援)；其餘維持原本順序"""
+        return sorted(providers, key=lambda p: self.get(p.name).is_open())
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        try:
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({k: v.as_dict() for k, v in self.providers.items()}, f, indent=2)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+
+# ==========================================
+# 競速呼叫
+# ==========================================
+def format_usage(usage: Usage) -> str:
+    usage = usage or {}
+    return f"prompt {usage.get('prompt', '?')} / 輸出 {usage.get('output', '?')} tokens"
+
+
+def race(
+    providers: list[Provider],
+    system_prompt: str,
+    user_prompt: str,
+    hedge_delay: float = HEDGE_DELAY_SEC,
+    timeout: float = LLM_TIMEOUT_SEC,
+    health: Optional[HealthStore] = None,
+    log: Callable[[str], None] = print,
+) -> tuple[Optional[str], Optional[str]]:
+    """
+    先呼叫排第一的供應商；hedge_delay 秒內沒完成 (或已失敗) 就加呼叫下一個，
+    採用最先成功的結果並取消其他請求。回傳 (文字, 供應商名稱)，全部失敗回傳 (None, None)。
+    """
+    health = health or HealthStore(path=None)
+    order = health.order(providers)
+    if not order:
+        return None, None
+    results: "queue.Queue[tuple[str, Optional[str], Usage, Optional[Exception], float]]" = queue.Queue()
+    cancels = {p.name: threading.Event() for p in order}
+    started_at: dict[str, float] = {}
+
+    def run(p: Provider) -> None:
+        t0 = time.time()
+        try:
+            text, usage = p.call(system_prompt, user_prompt, cancels[p.name])
+            results.put((p.name, text, usage, None, time.time() - t0))
+        except Exception as e:
+            results.put((p.name, None, None, e, time.time() - t0))
+
+    def launch(i: int) -> None:
+        p = order[i]
+        started_at[p.name] = time.time()
+        threading.Thread(target=run, args=(p,), daemon=True).start()
+
+    started = time.time()
+    deadline = started + timeout
+    launch(0)
+    launched, running = 1, 1
+    next_hedge = started + hedge_delay
+
+    try:
+        while running or launched < len(order):
+            now = time.time()
+            if now >= deadline:
+                break
+            if running == 0 or (launched < len(order) and now >= next_hedge):
+                log(f"🏁 {time.time() - started:.1f}s 仍無結果，加呼叫 {order[launched].name}")
+                launch(launched)
+                launched += 1
+                running += 1
+                next_hedge = time.time() + hedge_delay
+                continue
+            wait_until = min(deadline, next_hedge) if launched < len(order) else deadline
+            try:
+                name, text, usage, err, elapsed = results.get(timeout=max(0.0, wait_until - now))
+            except queue.Empty:
+                continue
+            running -= 1
+            if text:
+                health.get(name).record(True, elapsed)
+                log(f"⏱️ {name} 生成 {elapsed:.1f}s ({format_usage(usage)})")
+                for other, t0 in started_at.items():
+                    if other != name and not cancels[other].is_set():
+                        cancels[other].set()
+                        health.get(other).record_lost(time.time() - t0)
+                        log(f"🏁 取消 {other}")
+                return text, name
+            # 已結束的請求不必再取消
+            cancels[name].set()
+            health.get(name).record(False, elapsed)
+            log(f"⚠️ {name} 失敗 ({elapsed:.1f}s): {err or '空白回應'}")
+        log(f"⚠️ LLM 全部逾時或失敗 ({time.time() - started:.1f}s)")
+        for other, t0 in started_at.items():
+            if not cancels[other].is_set():
+                cancels[other].set()
+                health.get(other).record(False, time.time() - t0)
+        return None, None
+    finally:
+        health.save()
+
+
+# ==========================================
+# 供應商 (串流讀取，才能在中途取消)
+# ==========================================
+def groq_provider(
+    api_key: str,
+    model: str = GROQ_MODEL,
+    base_url: Optional[str] = GROQ_BASE_URL,
+    temperature: float = 0.5,
+) -> Provider:
+    def call(system_prompt: str, user_prompt: str, cancel: threading.Event) -> tuple[str, Usage]:
+        from groq import Groq
+
+        # 失敗時直接交給備援，不在 SDK 內重試
+        kwargs = {"base_url": base_url} if base_url else {}
+        client = Groq(api_key=api_key, max_retries=0, **kwargs)
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=temperature,
+            stream=True,
+            # 最後一個 chunk 附上用量 (Groq 另外放在 x_groq.usage)
+            extra_body={"stream_options": {"include_usage": True}},
+        )
+        parts = []
+        usage = None
+        try:
+            for chunk in stream:
+                if cancel.is_set():
+                    raise Cancelled()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                reported = chunk.usage or (chunk.x_groq.usage if chunk.x_groq else None)
+                if reported:
+                    usage = {"prompt": reported.prompt_tokens, "output": reported.completion_tokens}
+        finally:
+            stream.close()
+        return "".join(parts), usage
+
+    return Provider("Groq", call)
+
+
+def gemini_provider(
+    api_key: str,
+    model: str = GEMINI_MODEL,
+    base_url: str = GEMINI_BASE_URL,
+    timeout: float = 30,
+) -> Provider:
+    def call(system_prompt: str, user_prompt: str, cancel: threading.Event) -> tuple[str, Usage]:
+        url = f"{base_url.rstrip('/')}/v1beta/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+        payload = {"contents": [{"parts": [{"text": system_prompt + "\n\n" + user_prompt}]}]}
+        parts = []
+        usage = None
+        with requests.post(url, json=payload, stream=True, timeout=timeout) as res:
+            res.raise_for_status()
+            for line in res.iter_lines():
+                if cancel.is_set():
+                    raise Cancelled()
+                if not line.startswith(b"data:"):
+                    continue
+                data = json.loads(line[5:])
+                for cand in data.get("candidates", [])[:1]:
+                    for part in cand.get("content", {}).get("parts", []):
+                        parts.append(part.get("text", ""))
+                # 每個事件都帶累計用量，以最後一個為準
+                meta = data.get("usageMetadata")
+                if meta:
+                    usage = {"prompt": meta.get("promptTokenCount"), "output": meta.get("candidatesTokenCount")}
+        return "".join(parts), usage
+
+    return Provider("Gemini", call)
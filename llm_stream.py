@@ -0,0 +1,79 @@
+import os
+import time
+from typing import Any, Iterator, Optional
+
+
+# 指向本地 stub server (OpenAI 相容 /openai/v1/chat/completions) 以便測試
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+
+
+class StreamStats:
+    def __init__(self):
+        self.started = time.time()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.chars = 0
+
+    @property
+    def ttft(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started
+
+    @property
+    def total(self) -> Optional[float]:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"ttft": self.ttft, "total": self.total, "chars": self.chars}
+
+
+def stream_chat(
+    prompt: str,
+    api_key: str,
+    stats: Optional[StreamStats] = None,
+    model: str = DEFAULT_MODEL,
+    base_url: Optional[str] = GROQ_BASE_URL,
+    temperature: float = 0.3,
+    max_tokens: int = 850,
+) -> Iterator[str]:
+    """逐段產出模型輸出的文字；stats 會記錄首字延遲與總耗時"""
+    from groq import Groq
+
+    stats = stats or StreamStats()
+    client = Groq(api_key=api_key, base_url=base_url) if base_url else Groq(api_key=api_key)
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+    )
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if stats.first_token_at is None:
+                stats.first_token_at = time.time()
+            stats.chars += len(delta)
+            yield delta
+    finally:
+        stats.finished_at = time.time()
+
+
+def split_header(text: str) -> tuple[Optional[str], str]:
+    """
+    第一行 (例如「# 決策：觀望」) 收齊後就回傳 (標題, 其餘內容)，
+    還沒收到換行時回傳 (None, text)。前面的空行會略過。
+    """
+    stripped = text.lstrip("\n")
+    if "\n" not in stripped:
+        return None, text
+    first, rest = stripped.split("\n", 1)
+    return first.replace("#", "").strip(), rest
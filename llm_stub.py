@@ -0,0 +1,107 @@
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# 本地 LLM stub：同時模擬 Groq (OpenAI 相容) 與 Gemini 的串流端點，可各自設定延遲
+# 用法：
+#   python llm_stub.py --port 8089 --groq-delay 15 --gemini-delay 2
+#   GROQ_BASE_URL=http://127.0.0.1:8089 GEMINI_BASE_URL=http://127.0.0.1:8089 python rpi_main.py
+
+REPLY = "🧭 台股盤前快訊 (stub)\n\n📈 市場動能\n• 指數：測試\n\n🏁 觀點總結 (100字)\n{provider} stub 回應\n"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delays = {"groq": 0.0, "gemini": 0.0}
+    fail = set()
+
+    def _sse(self, events):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for event in events:
+            self.wfile.write(f"data: {event}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(0.02)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        provider = "gemini" if ":streamGenerateContent" in self.path else "groq"
+        print(f"[stub] {provider} {self.path.split('?')[0]}")
+        time.sleep(self.delays[provider])
+        if provider in self.fail:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        text = REPLY.format(provider=provider)
+        chunks = [text[i : i + 8] for i in range(0, len(text), 8)]
+        try:
+            if provider == "gemini":
+                usage = {"promptTokenCount": len(json.dumps(body)) // 4}
+                self._sse(
+                    json.dumps(
+                        {
+                            "candidates": [{"content": {"parts": [{"text": c}]}}],
+                            "usageMetadata": {**usage, "candidatesTokenCount": i + 1},
+                        }
+                    )
+                    for i, c in enumerate(chunks)
+                )
+            else:
+                events = [
+                    json.dumps(
+                        {
+                            "id": "stub",
+                            "object": "chat.completion.chunk",
+                            "created": 0,
+                            "model": body.get("model", ""),
+                            "choices": [{"index": 0, "delta": {"content": c}, "finish_reason": None}],
+                        }
+                    )
+                    for c in chunks
+                ]
+                # include_usage：最後多送一個 choices 為空、帶用量的 chunk
+                usage = {
+                    "prompt_tokens": len(json.dumps(body)) // 4,
+                    "completion_tokens": len(chunks),
+                    "total_tokens": len(json.dumps(body)) // 4 + len(chunks),
+                }
+                final = {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": body.get("model", ""),
+                    "choices": [],
+                }
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    final["usage"] = usage
+                final["x_groq"] = {"id": "stub", "usage": usage}
+                self._sse(events + [json.dumps(final), "[DONE]"])
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"[stub] {provider} 連線被取消")
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 LLM stub (Groq / Gemini 串流)")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--groq-delay", type=float, default=0)
+    parser.add_argument("--gemini-delay", type=float, default=0)
+    parser.add_argument("--fail", action="append", default=[], choices=["groq", "gemini"])
+    args = parser.parse_args()
+
+    StubHandler.delays = {"groq": args.groq_delay, "gemini": args.gemini_delay}
+    StubHandler.fail = set(args.fail)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f"🧪 LLM stub: http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Any, Optional
+
+import requests
+
+
+FEED_CACHE_DIR = os.getenv("FEED_CACHE_DIR", "feed_cache")
+SEEN_HEADLINES_FILE = os.getenv("SEEN_HEADLINES_FILE", "seen_headlines.json")
+SEEN_TTL_HOURS = float(os.getenv("SEEN_TTL_HOURS", "36"))
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.7"))
+
+# 中文標題短，用 2 字元 shingle；64 個雜湊分 16 段做 LSH，相似度 0.7 時幾乎必定成為候選
+SHINGLE_SIZE = 2
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+# ==========================================
+# RSS 條件式請求快取 (ETag / Last-Modified)
+# ==========================================
+def _feed_paths(url: str, cache_dir: str) -> tuple[str, str]:
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{key}.json"), os.path.join(cache_dir, f"{key}.xml")
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def fetch_feed(
+    url: str,
+    timeout: float = 10,
+    cache_dir: str = FEED_CACHE_DIR,
+    session: Optional[requests.Session] = None,
+) -> tuple[Optional[bytes], str]:
+    """
+    帶上次的 ETag / Last-Modified 送出請求；304 時直接回傳快取內容。
+    回傳 (內容, 狀態)，狀態為 "200" / "304" / "error"。
+    """
+    meta_path, body_path = _feed_paths(url, cache_dir)
+    meta: dict[str, Any] = {}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        meta = {}
+    has_body = os.path.exists(body_path)
+
+    headers = {"User-Agent": "Mozilla/5.0"}
+    if has_body and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if has_body and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        res = (session or requests).get(url, headers=headers, timeout=timeout)
+    except Exception:
+        return None, "error"
+    if res.status_code == 304 and has_body:
+        with open(body_path, "rb") as f:
+            return f.read(), "304"
+    if res.status_code != 200:
+        return None, "error"
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _atomic_write(body_path, res.content)
+        meta = {
+            "url": url,
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+            "fetched_at": int(time.time()),
+            "bytes": len(res.content),
+        }
+        _atomic_write(meta_path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+    except Exception:
+        pass
+    return res.content, "200"
+
+
+# ==========================================
+# 跨次執行的標題去重 (完全相同 + MinHash 近似重複)
+# ==========================================
+def normalize_title(title: str) -> str:
+    """去掉來源標籤 ([CNBC] ...)、標點與空白，英文轉小寫"""
+    title = re.sub(r"^\[[^\]]*\]\s*", "", title)
+    title = re.sub(r"\s+-\s+[^-]{1,12}$", "", title)  # Google News 結尾的「 - 鉅亨網」
+    return re.sub(r"[\W_]+", "", title).lower()
+
+
+def _shingles(text: str) -> set[str]:
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i : i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: str) -> list[int]:
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in _shingles(text)
+    ]
+    if not hashes:
+        return [0] * NUM_PERM
+    return [min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF for a, b in _PERMS]
+
+
+def similarity(sig_a: list[int], sig_b: list[int]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _bands(sig: list[int]) -> list[tuple]:
+    return [(i, tuple(sig[i * ROWS : (i + 1) * ROWS])) for i in range(BANDS)]
+
+
+class HeadlineIndex:
+    """
+    已送進報告的標題。filter() 只更新記憶體中的索引，
+    報告成功送出後呼叫 save() 才寫入檔案，失敗的那次下次仍會再用。
+    """
+
+    def __init__(self, entries: Optional[list[dict[str, Any]]] = None, path: str = SEEN_HEADLINES_FILE):
+        self.path = path
+        self.entries: list[dict[str, Any]] = []
+        self.exact: set[str] = set()
+        self.buckets: dict[tuple, list[int]] = {}
+        for entry in entries or []:
+            self._index(entry)
+
+    @classmethod
+    def load(cls, path: str = SEEN_HEADLINES_FILE, ttl_hours: float = SEEN_TTL_HOURS) -> "HeadlineIndex":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+        cutoff = time.time() - ttl_hours * 3600
+        entries = [e for e in data.get("entries", []) if e.get("ts", 0) >= cutoff]
+        return cls(entries, path)
+
+    def _index(self, entry: dict[str, Any]) -> None:
+        pos = len(self.entries)
+        self.entries.append(entry)
+        self.exact.add(entry["key"])
+        for band in _bands(entry["sig"]):
+            self.buckets.setdefault(band, []).append(pos)
+
+    def is_duplicate(self, key: str, sig: list[int]) -> bool:
+        if key in self.exact:
+            return True
+        candidates = {pos for band in _bands(sig) for pos in self.buckets.get(band, ())}
+        return any(similarity(sig, self.entries[pos]["sig"]) >= NEAR_DUP_THRESHOLD for pos in candidates)
+
+    def filter(self, titles: list[str]) -> list[str]:
+        """回傳沒看過 (含本次前面已出現) 的標題，保留原本順序"""
+        out = []
+        for title in titles:
+            norm = normalize_title(title)
+            if not norm:
+                continue
+            key = hashlib.sha1(norm.encode("utf-8")).hexdigest()
+            sig = minhash(norm)
+            if self.is_duplicate(key, sig):
+                continue
+            entry = {"key": key, "sig": sig, "ts": int(time.time()), "title": title}
+            self._index(entry)
+            out.append(title)
+        return out
+
+    def save(self) -> None:
+        try:
+            data = {"entries": self.entries}
+            _atomic_write(self.path, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        except Exception:
+            pass
@@ -0,0 +1,366 @@
+import json
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# 單則訊息上限 (以 UTF-16 計，emoji 算 2)；超過就分段送出，不再直接截斷
+LINE_MAX_CHARS = int(os.getenv("NOTIFY_LINE_MAX_CHARS", "5000"))
+TELEGRAM_MAX_CHARS = int(os.getenv("NOTIFY_TELEGRAM_MAX_CHARS", "4096"))
+# LINE push 一次最多 5 則
+LINE_MESSAGES_PER_PUSH = 5
+# 每個通道的速率限制 (每秒請求數 / 可累積的額度)；Telegram 對同一個聊天約每秒 1 則
+LINE_RATE_PER_SEC = float(os.getenv("NOTIFY_LINE_RATE_PER_SEC", "5"))
+TELEGRAM_RATE_PER_SEC = float(os.getenv("NOTIFY_TELEGRAM_RATE_PER_SEC", "1"))
+RATE_BURST = int(os.getenv("NOTIFY_RATE_BURST", "3"))
+NOTIFY_TIMEOUT_SEC = float(os.getenv("NOTIFY_TIMEOUT_SEC", "10"))
+# 各程序 (rpi_main / rpi_intraday / api_server) 的累計統計寫在這裡，API 讀檔彙整
+NOTIFY_METRICS_DIR = os.getenv("NOTIFY_METRICS_DIR", "notify_metrics")
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8)
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _hard_split(line: str, limit: int) -> list[str]:
+    parts = []
+    while utf16_len(line) > limit:
+        cut = limit
+        while utf16_len(line[:cut]) > limit:
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+    return parts + [line]
+
+
+def split_message(text: str, limit: int) -> list[str]:
+    """依段落 -> 行 -> 字元的順序切開，每段不超過 limit (UTF-16 長度)"""
+    if utf16_len(text) <= limit:
+        return [text]
+    chunks: list[str] = []
+    current = ""
+
+    def join(piece: str, sep: str) -> bool:
+        nonlocal current
+        candidate = f"{current}{sep}{piece}" if current else piece
+        if utf16_len(candidate) > limit:
+            return False
+        current = candidate
+        return True
+
+    for para in text.split("\n\n"):
+        if join(para, "\n\n"):
+            continue
+        if current:
+            chunks.append(current)
+            current = ""
+        if join(para, ""):
+            continue
+        # 單一段落就超過上限：再依行切，單行仍超過就硬切
+        for line in para.split("\n"):
+            if join(line, "\n"):
+                continue
+            if current:
+                chunks.append(current)
+            *full, current = _hard_split(line, limit)
+            chunks += full
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class RateLimiter:
+    """簡單的 token bucket；acquire() 在額度用完時等待"""
+
+    def __init__(self, rate_per_sec: float, burst: int = RATE_BURST):
+        self.rate = rate_per_sec
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """回傳等待的秒數"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ChannelMetrics:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.requests = 0
+        self.throttled_sec = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.last_error: Optional[str] = None
+        self.last_latency: Optional[float] = None
+
+    def observe(self, seconds: float) -> None:
+        self.last_latency = seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        labels = [f"<={b}s" for b in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "requests": self.requests,
+            "throttled_sec": round(self.throttled_sec, 3),
+            "last_latency_sec": None if self.last_latency is None else round(self.last_latency, 3),
+            "latency_buckets": dict(zip(labels, self.buckets)),
+            "last_error": self.last_error,
+        }
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """接續先前存檔的累計值 (程序重啟或每次排程執行)"""
+        for k in ("sent", "failed", "skipped", "requests"):
+            setattr(self, k, int(data.get(k, 0)))
+        self.throttled_sec = float(data.get("throttled_sec", 0))
+        buckets = list((data.get("latency_buckets") or {}).values())
+        if len(buckets) == len(self.buckets):
+            self.buckets = [int(b) for b in buckets]
+        self.last_error = data.get("last_error")
+        self.last_latency = data.get("last_latency_sec")
+
+    def summary(self) -> str:
+        latency = "-" if self.last_latency is None else f"{self.last_latency:.2f}s"
+        return f"成功 {self.sent} / 失敗 {self.failed} / 略過 {self.skipped} (最近 {latency})"
+
+
+def load_metrics(metrics_dir: str = NOTIFY_METRICS_DIR) -> dict[str, dict[str, Any]]:
+    """讀取所有程序存檔的統計：{程序: {"updated_at": ..., "channels": {...}}}"""
+    out = {}
+    try:
+        names = sorted(os.listdir(metrics_dir))
+    except OSError:
+        return out
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, name), "r", encoding="utf-8") as f:
+                out[name[:-5]] = json.load(f)
+        except Exception:
+            continue
+    return out
+
+
+# ==========================================
+# 通道
+# ==========================================
+class Channel(ABC):
+    name = ""
+    label = ""
+    max_chars = 4096
+
+    def __init__(self, rate_per_sec: float, timeout: float = NOTIFY_TIMEOUT_SEC):
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate_per_sec)
+        self.metrics = ChannelMetrics()
+        # 每個通道一個連線池，重複使用 TLS 連線
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+    @property
+    def configured(self) -> bool:
+        return False
+
+    @abstractmethod
+    def post_chunks(self, chunks: list[str]) -> None:
+        ...
+
+    def _post(self, url: str, **kwargs) -> requests.Response:
+        self.metrics.throttled_sec += self.limiter.acquire()
+        self.metrics.requests += 1
+        res = self.session.post(url, timeout=self.timeout, **kwargs)
+        if res.status_code == 429:
+            # 被限流：依伺服器指示等待後重試一次
+            retry_after = res.headers.get("Retry-After")
+            try:
+                retry_after = retry_after or res.json().get("parameters", {}).get("retry_after")
+            except Exception:
+                pass
+            time.sleep(min(float(retry_after or 1), 30))
+            self.metrics.requests += 1
+            res = self.session.post(url, timeout=self.timeout, **kwargs)
+        if res.status_code != 200:
+            raise RuntimeError(f"HTTP {res.status_code}: {res.text[:200]}")
+        return res
+
+
+class LineChannel(Channel):
+    name = "line"
+    label = "LINE"
+    max_chars = LINE_MAX_CHARS
+
+    def __init__(self, token: Optional[str], target: Optional[str], rate_per_sec: float = LINE_RATE_PER_SEC):
+        super().__init__(rate_per_sec)
+        self.token = token
+        self.target = target
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.token and self.target)
+
+    def post_chunks(self, chunks: list[str]) -> None:
+        headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+        for i in range(0, len(chunks), LINE_MESSAGES_PER_PUSH):
+            messages = [{"type": "text", "text": c} for c in chunks[i : i + LINE_MESSAGES_PER_PUSH]]
+            self._post(
+                "https://api.line.me/v2/bot/message/push",
+                headers=headers,
+                json={"to": self.target, "messages": messages},
+            )
+
+
+class TelegramChannel(Channel):
+    name = "telegram"
+    label = "Telegram"
+    max_chars = TELEGRAM_MAX_CHARS
+
+    def __init__(self, token: Optional[str], chat_id: Optional[str], rate_per_sec: float = TELEGRAM_RATE_PER_SEC):
+        super().__init__(rate_per_sec)
+        self.token = token
+        self.chat_id = chat_id
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.token and self.chat_id)
+
+    def post_chunks(self, chunks: list[str]) -> None:
+        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        for chunk in chunks:
+            self._post(url, json={"chat_id": self.chat_id, "text": chunk})
+
+
+# ==========================================
+# 發送
+# ==========================================
+class Notifier:
+    """
+    各通道同時發送；回傳 {通道: "ok" / "failed" / "skipped"}。
+    給定 process 時，統計會從 NOTIFY_METRICS_DIR/<process>.json 接續，每次發送後寫回。
+    """
+
+    def __init__(
+        self,
+        channels: list[Channel],
+        log: Callable[[str], None] = print,
+        process: Optional[str] = None,
+        metrics_dir: str = NOTIFY_METRICS_DIR,
+    ):
+        self.channels = {c.name: c for c in channels}
+        self.log = log
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(channels)), thread_name_prefix="notify")
+        self._warned: set[str] = set()
+        self.metrics_path = os.path.join(metrics_dir, f"{process}.json") if process else None
+        saved = load_metrics(metrics_dir).get(process, {}) if process else {}
+        for name, data in (saved.get("channels") or {}).items():
+            if name in self.channels:
+                self.channels[name].metrics.restore(data)
+
+    def _deliver(self, channel: Channel, msg: str) -> tuple[str, Optional[str]]:
+        """在背景執行緒發送；回傳 (結果, 要記錄的訊息)，log 交給呼叫端依序輸出"""
+        if not channel.configured:
+            channel.metrics.skipped += 1
+            if channel.name in self._warned:
+                return "skipped", None
+            self._warned.add(channel.name)
+            return "skipped", f"⚠️ {channel.label} 設定缺失"
+        chunks = split_message(msg, channel.max_chars)
+        t0 = time.time()
+        try:
+            channel.post_chunks(chunks)
+        except Exception as e:
+            channel.metrics.failed += 1
+            channel.metrics.last_error = str(e)
+            channel.metrics.observe(time.time() - t0)
+            return "failed", f"❌ {channel.label} 發送失敗: {e}"
+        elapsed = time.time() - t0
+        channel.metrics.sent += 1
+        channel.metrics.observe(elapsed)
+        note = f"{len(chunks)} 段, " if len(chunks) > 1 else ""
+        return "ok", f"✅ {channel.label} 發送成功 ({note}{elapsed:.2f}s)"
+
+    def send(self, msg: str, channels: Optional[tuple[str, ...]] = None) -> dict[str, str]:
+        if not msg:
+            return {}
+        names = [n for n in (self.channels if channels is None else channels) if n in self.channels]
+        futures = {n: self._pool.submit(self._deliver, self.channels[n], msg) for n in names}
+        receipts = {}
+        for name, future in futures.items():
+            receipts[name], line = future.result()
+            if line:
+                self.log(line)
+        self.save_metrics()
+        return receipts
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        return {name: c.metrics.as_dict() for name, c in self.channels.items()}
+
+    def summary(self) -> str:
+        return "; ".join(f"{c.label} {c.metrics.summary()}" for c in self.channels.values())
+
+    def save_metrics(self) -> None:
+        if not self.metrics_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+            tmp = f"{self.metrics_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"updated_at": int(time.time()), "pid": os.getpid(), "channels": self.metrics()},
+                    f,
+                    ensure_ascii=False,
+                )
+            os.replace(tmp, self.metrics_path)
+        except Exception:
+            pass
+
+
+_lock = threading.Lock()
+_notifier: Optional[Notifier] = None
+
+
+def get_notifier(log: Callable[[str], None] = print, process: Optional[str] = None) -> Notifier:
+    """
+    同一個程序共用；第一次呼叫時才讀取環境變數 (entry point 已 load_dotenv)。
+    process 為統計檔名稱，預設取執行的腳本名稱 (rpi_main、rpi_intraday ...)。
+    """
+    global _notifier
+    if _notifier is None:
+        with _lock:
+            if _notifier is None:
+                _notifier = Notifier(
+                    [
+                        LineChannel(os.getenv("LINE_CHANNEL_TOKEN"), os.getenv("LINE_TARGET_ID")),
+                        TelegramChannel(os.getenv("TELEGRAM_BOT_TOKEN"), os.getenv("TELEGRAM_CHAT_ID")),
+                    ],
+                    log=log,
+                    process=process or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "python",
+                )
+    return _notifier
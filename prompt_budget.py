@@ -0,0 +1,126 @@
+import math
+import os
+import re
+from typing import Any
+
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+# Llama 3 的 BPE 對常用中文字多半是 1 token，少數 2~3 token，取偏保守的平均
+CJK_TOKENS_PER_CHAR = 1.3
+
+SOURCE_WEIGHTS = {"MoneyDJ": 1.0, "鉅亨": 1.0, "Yahoo": 0.9, "CNBC": 0.7}
+DEFAULT_SOURCE_WEIGHT = 0.8
+# 與台股相關的關鍵字與權重 (英文不分大小寫)
+KEYWORDS = {
+    "台股": 1.0,
+    "加權": 1.0,
+    "櫃買": 0.8,
+    "外資": 0.8,
+    "投信": 0.8,
+    "法人": 0.6,
+    "營收": 0.8,
+    "法說": 0.8,
+    "財報": 0.6,
+    "eps": 0.6,
+    "除息": 0.5,
+    "台積電": 0.8,
+    "鴻海": 0.5,
+    "聯發科": 0.5,
+    "半導體": 0.6,
+    "晶圓": 0.5,
+    "伺服器": 0.5,
+    "匯率": 0.4,
+    "新台幣": 0.5,
+    "央行": 0.4,
+    "聯準會": 0.5,
+    "fed": 0.5,
+    "費半": 0.6,
+    "nasdaq": 0.4,
+    "nvidia": 0.5,
+    "輝達": 0.5,
+    "tsmc": 0.8,
+    "taiwan": 0.8,
+    "chip": 0.4,
+}
+# 同一來源越後面 (越舊) 的標題分數越低；每往後 RECENCY_HALF_LIFE 則減半
+RECENCY_HALF_LIFE = 5
+
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_OTHER = re.compile(r"[^㐀-鿿豈-﫿A-Za-z0-9\s]")
+_TAGGED = re.compile(r"^\[([^\]]+)\]\s*(.*)$")
+
+
+def estimate_tokens(text: str) -> int:
+    """本地粗估 token 數：中文依字數、英數約 4 字元 1 token、標點與換行各 1"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    words = sum(max(1, math.ceil(len(w) / 4)) for w in _WORD.findall(text))
+    other = len(_OTHER.findall(text)) + text.count("\n")
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR) + words + other
+
+
+def parse_headline(item: str) -> tuple[str, str]:
+    """「[來源] 標題」-> (來源, 標題)"""
+    m = _TAGGED.match(item)
+    if not m:
+        return "", item
+    return m.group(1), m.group(2)
+
+
+def keyword_score(title: str) -> float:
+    lowered = title.lower()
+    return sum(weight for kw, weight in KEYWORDS.items() if kw in lowered)
+
+
+def rank_headlines(items: list[str]) -> list[tuple[float, str]]:
+    """依 來源權重 x (1 + 關鍵字分數) x 新舊程度 由高到低排序"""
+    positions: dict[str, int] = {}
+    scored = []
+    for order, item in enumerate(items):
+        source, title = parse_headline(item)
+        pos = positions.get(source, 0)
+        positions[source] = pos + 1
+        recency = 0.5 ** (pos / RECENCY_HALF_LIFE)
+        weight = SOURCE_WEIGHTS.get(source, DEFAULT_SOURCE_WEIGHT)
+        scored.append((weight * (1 + keyword_score(title)) * recency, order, item))
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [(score, item) for score, _, item in scored]
+
+
+def build_context(
+    header: str, sections: list[tuple[str, list[str]]], budget: int
+) -> tuple[str, dict[str, Any]]:
+    """
+    header 與各段標題一定保留；標題依分數由高到低放入，放不下的略過 (貪婪填滿)。
+    各段內依分數排序。回傳 (context, 統計)。
+    """
+    fixed = header + "\n\n" + "\n\n".join(label for label, _ in sections)
+    remaining = budget - estimate_tokens(fixed) - len(sections)
+
+    candidates = []
+    for idx, (_, items) in enumerate(sections):
+        candidates += [(score, idx, item) for score, item in rank_headlines(items)]
+    candidates.sort(key=lambda x: -x[0])
+
+    kept: list[list[str]] = [[] for _ in sections]
+    dropped = 0
+    for _, idx, item in candidates:
+        cost = estimate_tokens(item) + 1
+        if cost <= remaining:
+            kept[idx].append(item)
+            remaining -= cost
+        else:
+            dropped += 1
+
+    blocks = [header]
+    for (label, _), items in zip(sections, kept):
+        blocks.append(label + "\n" + "\n".join(items))
+    context = "\n\n".join(blocks).strip()
+    stats = {
+        "tokens": estimate_tokens(context),
+        "kept": sum(len(k) for k in kept),
+        "dropped": dropped,
+    }
+    return context, stats
@@ -1,30 +1,27 @@
+import importlib
 import os
 import json
 import time
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import requests
-import ta
-import twstock
 from dotenv import load_dotenv
 
+# 下面的模組在 import 時就會讀取設定
+load_dotenv()
+
 from alert_store import append_alert
+from notifier import get_notifier
+from scan_scheduler import AdaptiveScheduler, proximity
+from sheets_writer import get_writer
+from trading_calendar import TradingCalendar
 from watchlist_store import (
     load_watchlist_file,
     parse_numeric_codes,
     save_watchlist_file,
 )
 
-try:
-    import gspread
-except Exception:
-    gspread = None
-
-load_dotenv()
-
-LINE_CHANNEL_TOKEN = os.getenv("LINE_CHANNEL_TOKEN")
-LINE_TARGET_ID = os.getenv("LINE_TARGET_ID")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
@@ -41,6 +38,15 @@ RSI_OVERSOLD = float(os.getenv("INTRADAY_RSI_OVERSOLD", "30"))
 VOLUME_SPIKE_MULT = float(os.getenv("INTRADAY_VOLUME_SPIKE_MULT", "2.5"))
 ALERT_COOLDOWN_MIN = int(os.getenv("INTRADAY_ALERT_COOLDOWN_MIN", "30"))
 TG_POLL_INTERVAL_SEC = int(os.getenv("INTRADAY_TG_POLL_SEC", "10"))
+# 依接近觸發條件的程度調整各股票的掃描間隔 (秒)；總請求數不超過每分鐘預算
+# 預算 0 表示沿用原本的總量：清單檔數 x 60 / INTRADAY_CHECK_INTERVAL_SEC
+SCAN_MIN_INTERVAL_SEC = float(os.getenv("INTRADAY_SCAN_MIN_INTERVAL_SEC", "5"))
+SCAN_MAX_INTERVAL_SEC = float(os.getenv("INTRADAY_SCAN_MAX_INTERVAL_SEC", str(CHECK_INTERVAL_SEC * 3)))
+SCAN_BUDGET_PER_MIN = float(os.getenv("INTRADAY_SCAN_BUDGET_PER_MIN", "0"))
+# 休市時 Telegram long polling 每次最多等待的秒數 (有指令會立即回應)
+TG_IDLE_POLL_SEC = int(os.getenv("INTRADAY_TG_IDLE_POLL_SEC", "50"))
+# 開盤前幾分鐘先載入套件、代號表並連上 Yahoo
+PREWARM_MIN = int(os.getenv("INTRADAY_PREWARM_MIN", "5"))
 
 WATCHLIST_FILE = "watchlist.json"
 
@@ -49,48 +55,15 @@ def log(msg):
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}")
 
 
-def push_line_message(msg):
-    if not LINE_CHANNEL_TOKEN or not LINE_TARGET_ID:
-        return
-    url = "https://api.line.me/v2/bot/message/push"
-    headers = {
-        "Authorization": f"Bearer {LINE_CHANNEL_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "to": LINE_TARGET_ID,
-        "messages": [{"type": "text", "text": msg[:4500]}],
-    }
-    try:
-        res = requests.post(url, headers=headers, json=payload, timeout=10)
-        res.raise_for_status()
-    except Exception:
-        log(f"Error sending Line message: {traceback.format_exc()}")
-        return
-
-
-def push_telegram_message(msg):
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        return
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": TELEGRAM_CHAT_ID, "text": msg}
-    try:
-        res = requests.post(url, json=payload, timeout=10)
-        res.raise_for_status()
-    except Exception:
-        log(f"Error sending Telegram message: {traceback.format_exc()}")
-        return
+sheets = get_writer("intraday", log=log)
+notifier = get_notifier(log, process="rpi_intraday")
+calendar = TradingCalendar.load()
+# Yahoo 共用連線，開盤前預熱後第一次掃描不必重新建立 TLS
+http = requests.Session()
 
 
 def notify_all(msg):
-    push_line_message(msg)
-    push_telegram_message(msg)
-
-
-def is_market_open():
-    now = datetime.now()
-    hhmm = now.hour * 100 + now.minute
-    return 900 <= hhmm <= 1330
+    return notifier.send(msg)
 
 
 def load_watchlist():
@@ -113,7 +86,7 @@ def yahoo_chart(symbol):
     url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
     params = {"interval": "1m", "range": "1d"}
     headers = {"User-Agent": "Mozilla/5.0"}
-    res = requests.get(url, params=params, headers=headers, timeout=10)
+    res = http.get(url, params=params, headers=headers, timeout=10)
     res.raise_for_status()
     return res.json()
 
@@ -123,42 +96,30 @@ def save_watchlist(codes):
     sync_watchlist_to_sheet(codes)
 
 
-def get_sheet_client():
-    if not gspread:
-        return None
+def sync_watchlist_to_sheet(codes):
+    """只排入目標內容，實際寫入在 flush_sheet_writes() (一次輪詢最多寫一次)"""
     sheet_id = WATCHLIST_SPREADSHEET_ID or SPREADSHEET_ID
-    if not sheet_id or not GOOGLE_SERVICE_ACCOUNT_FILE:
-        return None
-    if not os.path.exists(GOOGLE_SERVICE_ACCOUNT_FILE):
-        return None
-    try:
-        return gspread.service_account(filename=GOOGLE_SERVICE_ACCOUNT_FILE)
-    except Exception:
-        return None
+    if not sheet_id or not sheets.configured:
+        return
+    sheets.set_column(sheet_id, WATCHLIST_SHEET_NAME, sorted(set(codes)))
 
 
-def sync_watchlist_to_sheet(codes):
-    client = get_sheet_client()
-    if not client:
-        return
-    try:
-        sheet_id = WATCHLIST_SPREADSHEET_ID or SPREADSHEET_ID
-        if not sheet_id:
-            return
-        sh = client.open_by_key(sheet_id)
-        try:
-            ws = sh.worksheet(WATCHLIST_SHEET_NAME)
-        except Exception:
-            ws = sh.add_worksheet(title=WATCHLIST_SHEET_NAME, rows=1000, cols=1)
-        ws.clear()
-        if codes:
-            ws.update("A1", [[c] for c in sorted(list(set(codes)))])
-    except Exception:
+def flush_sheet_writes():
+    if not sheets.configured or not sheets.pending():
         return
+    if not sheets.flush():
+        log(f"📥 Sheets 暫時無法寫入，{sheets.pending()} 筆留在 outbox")
+
+
+def stock_codes():
+    # twstock 載入代號表要零點幾秒，第一次用到時才 import
+    import twstock
+
+    return twstock.codes
 
 
 def parse_codes(tokens):
-    return parse_numeric_codes(tokens, set(twstock.codes.keys()))
+    return parse_numeric_codes(tokens, set(stock_codes().keys()))
 
 
 def handle_command(text, current):
@@ -195,13 +156,18 @@ def handle_command(text, current):
     return current, None
 
 
-def poll_telegram(last_update_id, watchlist):
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+def telegram_enabled():
+    return bool(TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID)
+
+
+def poll_telegram(last_update_id, watchlist, wait=0):
+    """wait > 0 時用 long polling：最多等 wait 秒，有新訊息就立即回傳"""
+    if not telegram_enabled():
         return last_update_id, watchlist
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getUpdates"
-    params = {"timeout": 0, "offset": last_update_id + 1}
+    params = {"timeout": int(wait), "offset": last_update_id + 1}
     try:
-        res = requests.get(url, params=params, timeout=10)
+        res = requests.get(url, params=params, timeout=int(wait) + 10)
         res.raise_for_status()
         data = res.json()
         updates = data.get("result", [])
@@ -214,19 +180,32 @@ def poll_telegram(last_update_id, watchlist):
             text = msg.get("text", "")
             watchlist, reply = handle_command(text, watchlist)
             if reply:
-                push_telegram_message(reply)
+                notifier.send(reply, channels=("telegram",))
     except Exception:
         log(f"Error polling Telegram: {traceback.format_exc()}")
+        # 網路異常時不要立刻重試
+        time.sleep(min(wait, TG_POLL_INTERVAL_SEC))
         return last_update_id, watchlist
     return last_update_id, watchlist
 
 
-def analyze_symbol(code):
-    if code not in twstock.codes:
+def to_symbol(code):
+    codes = stock_codes()
+    if code not in codes:
+        return None
+    suffix = ".TW" if codes[code].market == "上市" else ".TWO"
+    return f"{code}{suffix}"
+
+
+def measure_symbol(code):
+    """抓 1 分 K 並計算漲跌幅、RSI、量能倍數與近期波動；資料不足回傳 None"""
+    # ta 會一併載入 pandas，只在盤中掃描時才需要
+    import ta
+
+    codes = stock_codes()
+    symbol = to_symbol(code)
+    if not symbol:
         return None
-    market = twstock.codes[code].market
-    suffix = ".TW" if market == "上市" else ".TWO"
-    symbol = f"{code}{suffix}"
 
     data = yahoo_chart(symbol)
     result = data.get("chart", {}).get("result", [])
@@ -256,28 +235,48 @@ def analyze_symbol(code):
 
     last_vol = float(volumes[-1])
     avg_vol = sum(volumes[-20:]) / max(1, len(volumes[-20:]))
-    vol_ok = True if VOLUME_SPIKE_MULT <= 0 else last_vol >= avg_vol * VOLUME_SPIKE_MULT
-
-    status = None
-    if pct >= PRICE_UP_PCT and rsi >= RSI_OVERBOUGHT and vol_ok:
-        status = "UP"
-    elif pct <= PRICE_DOWN_PCT and rsi <= RSI_OVERSOLD and vol_ok:
-        status = "DOWN"
-
-    if not status:
-        return None
+    # 近 30 根 1 分 K 報酬的標準差 (百分點 / 分鐘)
+    recent = closes[-31:]
+    returns = [(b - a) / a * 100 for a, b in zip(recent, recent[1:]) if a]
+    mean = sum(returns) / len(returns) if returns else 0.0
+    sigma = (sum((r - mean) ** 2 for r in returns) / len(returns)) ** 0.5 if returns else 0.0
 
     return {
         "code": code,
-        "name": twstock.codes[code].name,
+        "name": codes[code].name,
         "price": last_price,
         "pct": pct,
         "rsi": float(rsi),
         "volume": last_vol,
-        "status": status,
+        "vol_ratio": last_vol / avg_vol if avg_vol else 0.0,
+        "sigma": sigma,
     }
 
 
+def signal_status(m):
+    vol_ok = True if VOLUME_SPIKE_MULT <= 0 else m["vol_ratio"] >= VOLUME_SPIKE_MULT
+    if m["pct"] >= PRICE_UP_PCT and m["rsi"] >= RSI_OVERBOUGHT and vol_ok:
+        return "UP"
+    if m["pct"] <= PRICE_DOWN_PCT and m["rsi"] <= RSI_OVERSOLD and vol_ok:
+        return "DOWN"
+    return None
+
+
+def signal_proximity(m):
+    return proximity(
+        m["pct"],
+        m["rsi"],
+        m["vol_ratio"],
+        m["sigma"],
+        PRICE_UP_PCT,
+        PRICE_DOWN_PCT,
+        RSI_OVERBOUGHT,
+        RSI_OVERSOLD,
+        VOLUME_SPIKE_MULT,
+        horizon_min=SCAN_MAX_INTERVAL_SEC / 60,
+    )
+
+
 def format_alert(item):
     arrow = "📈" if item["status"] == "UP" else "📉"
     return (
@@ -288,6 +287,93 @@ def format_alert(item):
     )
 
 
+def check_symbol(code, last_alert):
+    """掃描單檔並在觸發時通知；回傳 (接近程度, 冷卻結束時間)，失敗時接近程度為 None"""
+    now = time.time()
+    try:
+        m = measure_symbol(code)
+    except Exception:
+        log(f"Error analyzing symbol {code}: {traceback.format_exc()}")
+        return None, 0.0
+    if not m:
+        return None, 0.0
+
+    cooldown_end = last_alert.get(code, 0) + ALERT_COOLDOWN_MIN * 60
+    status = signal_status(m)
+    if status and now >= cooldown_end:
+        item = {**m, "status": status}
+        append_alert(
+            {
+                "kind": "intraday_signal",
+                "code": item["code"],
+                "name": item["name"],
+                "status": item["status"],
+                "price": item["price"],
+                "pct": item["pct"],
+                "rsi": item["rsi"],
+                "volume": item["volume"],
+                "message": format_alert(item),
+            }
+        )
+        notify_all(format_alert(item))
+        last_alert[code] = now
+        cooldown_end = now + ALERT_COOLDOWN_MIN * 60
+        log(f"✅ 通知: {code} {item['status']}")
+    return signal_proximity(m), cooldown_end
+
+
+def new_scheduler():
+    if SCAN_BUDGET_PER_MIN:
+        return AdaptiveScheduler(SCAN_BUDGET_PER_MIN, SCAN_MIN_INTERVAL_SEC, SCAN_MAX_INTERVAL_SEC)
+    # 沒有指定預算時，每次 sync 依清單大小重算 (開盤時清單為空、之後 /add 也能拿到額度)
+    return AdaptiveScheduler(
+        1,
+        SCAN_MIN_INTERVAL_SEC,
+        SCAN_MAX_INTERVAL_SEC,
+        per_code_budget=60 / max(1, CHECK_INTERVAL_SEC),
+    )
+
+
+def scan_due(scheduler, last_alert):
+    for code in scheduler.pop_due():
+        score, hold_until = check_symbol(code, last_alert)
+        scheduler.reschedule(code, score, hold_until)
+
+
+def prewarm():
+    """開盤前先載入 ta / pandas、代號表，並和 Yahoo 建立連線，讓第一次掃描不必等"""
+    started = time.time()
+    try:
+        importlib.import_module("ta.momentum")
+        watchlist = load_watchlist()
+        symbol = to_symbol(watchlist[0]) if watchlist else None
+        if symbol:
+            yahoo_chart(symbol)
+    except Exception:
+        log(f"⚠️ 預熱未完成: {traceback.format_exc(limit=1)}")
+    log(f"🔥 開盤前預熱完成 ({time.time() - started:.1f}s)")
+
+
+def wait_for_commands(state, seconds, window):
+    """等到下一個事件；期間用 Telegram long polling 處理指令，沒有 Telegram 就直接睡"""
+    deadline = time.time() + max(0.0, seconds)
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        if not telegram_enabled():
+            time.sleep(min(remaining, 600))
+            continue
+        state["last_update_id"], state["watchlist"] = poll_telegram(
+            state["last_update_id"], state["watchlist"], wait=min(remaining, window)
+        )
+        # 同一輪的多個 /add /del 合併成一次寫入；離線時累積的也在這裡補寫
+        flush_sheet_writes()
+        if remaining > window:
+            # 每個 window 回到主迴圈一次，讓日曆與排程重新判斷
+            return
+
+
 def main():
     watchlist = load_watchlist()
     if not watchlist:
@@ -295,67 +381,68 @@ def main():
     else:
         log(f"🚀 盤中監控啟動: {len(watchlist)} 檔")
 
+    state = {"watchlist": watchlist, "last_update_id": 0}
     last_alert = {}
-    last_update_id = 0
-    next_scan_time = time.time()
-    next_poll_time = time.time()
+    scheduler = None
+    next_reload_time = 0.0
+    next_summary_time = 0.0
+    prewarmed_for = None
+    announced_open = None
+    calendar_checked = None
 
     while True:
-        now = time.time()
-
-        if now >= next_poll_time:
-            last_update_id, watchlist = poll_telegram(last_update_id, watchlist)
-            next_poll_time = now + TG_POLL_INTERVAL_SEC
-
-        if now >= next_scan_time:
-            if not is_market_open():
-                log("⏸️ 非盤中時間，延後掃描")
-                next_scan_time = now + 300
-                time.sleep(1)
-                continue
-
-            watchlist = load_watchlist()
-            if not watchlist:
-                log(
-                    "⚠️ watchlist 為空，請設定 WATCHLIST_CODES 或更新 stock_database.json"
-                )
-                next_scan_time = now + CHECK_INTERVAL_SEC
-                time.sleep(1)
-                continue
-
-            for code in watchlist:
-                try:
-                    item = analyze_symbol(code)
-                    if not item:
-                        continue
-                    last_ts = last_alert.get(code, 0)
-                    if now - last_ts < ALERT_COOLDOWN_MIN * 60:
-                        continue
-
-                    append_alert(
-                        {
-                            "kind": "intraday_signal",
-                            "code": item["code"],
-                            "name": item["name"],
-                            "status": item["status"],
-                            "price": item["price"],
-                            "pct": item["pct"],
-                            "rsi": item["rsi"],
-                            "volume": item["volume"],
-                            "message": format_alert(item),
-                        }
-                    )
-
-                    notify_all(format_alert(item))
-                    last_alert[code] = now
-                    log(f"✅ 通知: {code} {item['status']}")
-                except Exception:
-                    log(f"Error analyzing symbol {code}: {traceback.format_exc()}")
-                    continue
-
-            next_scan_time = now + CHECK_INTERVAL_SEC
-
-        time.sleep(1)
+        now = datetime.now()
+
+        # 臨時休市 (trading_calendar.py --close) 由另一個程序寫入檔案，每輪都檢查 mtime
+        if calendar.reload_if_changed():
+            log("📅 交易日曆檔案已變更，重新讀取")
+
+        # 每天檢查一次日曆是否需要重新下載
+        if calendar_checked != now.date():
+            calendar_checked = now.date()
+            if calendar.refresh_if_stale(now):
+                log("📅 已更新證交所休市日")
+            if not calendar.covers(now.date()):
+                log(f"⚠️ 交易日曆沒有 {now.year} 年資料，只略過週末 (python trading_calendar.py --refresh)")
+
+        if calendar.is_open(now):
+            announced_open = None
+            # 每 CHECK_INTERVAL_SEC 重新讀一次清單；各股票何時再掃由排程器依接近程度決定
+            if time.time() >= next_reload_time:
+                state["watchlist"] = load_watchlist()
+                next_reload_time = time.time() + CHECK_INTERVAL_SEC
+                if not state["watchlist"]:
+                    log("⚠️ watchlist 為空，請設定 WATCHLIST_CODES 或更新 stock_database.json")
+                if scheduler is None:
+                    scheduler = new_scheduler()
+                    next_summary_time = time.time() + 1800
+                scheduler.sync(state["watchlist"])
+            scan_due(scheduler, last_alert)
+            if time.time() >= next_summary_time:
+                log(f"📊 掃描排程: {scheduler.summary()}")
+                next_summary_time = time.time() + 1800
+            wake = min(scheduler.next_wake() or next_reload_time, next_reload_time)
+            wait_for_commands(state, wake - time.time(), TG_POLL_INTERVAL_SEC)
+            continue
+
+        # 休市：睡到預熱 / 開盤，期間只回應 Telegram 指令
+        open_at = calendar.next_open(now)
+        if announced_open != open_at:
+            announced_open = open_at
+            reason = calendar.closed_reason(now.date()) or "非盤中時間"
+            log(f"⏸️ {reason}，下次開盤 {open_at:%Y-%m-%d %H:%M}")
+        prewarm_at = open_at - timedelta(minutes=PREWARM_MIN)
+        if now >= prewarm_at and prewarmed_for != open_at:
+            prewarm()
+            prewarmed_for = open_at
+        target = open_at if prewarmed_for == open_at else prewarm_at
+        if scheduler is not None:
+            log(f"📊 掃描排程: {scheduler.summary()}")
+            log(f"📊 通知統計: {notifier.summary()}")
+            # 每天開盤重新排程
+            scheduler = None
+            next_reload_time = 0.0
+        wait_for_commands(state, (target - datetime.now()).total_seconds(), TG_IDLE_POLL_SEC)
 
 
 if __name__ == "__main__":
@@ -1,30 +1,32 @@
+import argparse
 import os
 import json
+import shutil
+import time
 import requests
 import feedparser
 import urllib3
-import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from dotenv import load_dotenv
-from groq import Groq
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+
+# 加載環境變數 (下面的模組在 import 時就會讀取設定)
+load_dotenv()
+
+from llm_hedge import HealthStore, gemini_provider, groq_provider, race
+from news_cache import HeadlineIndex, fetch_feed
+from notifier import get_notifier
+from prompt_budget import PROMPT_TOKEN_BUDGET, build_context, estimate_tokens
+from sheets_writer import get_writer
 
 # 禁用不安全請求警告 (針對證交所 API)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# 加載環境變數
-load_dotenv()
-
 # ==========================================
 # 1) 設定區
 # ==========================================
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-LINE_CHANNEL_TOKEN = os.getenv("LINE_CHANNEL_TOKEN")
-LINE_TARGET_ID = os.getenv("LINE_TARGET_ID")
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 GOOGLE_SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
 MODE = os.getenv("MODE", "AUTO")
@@ -35,6 +37,14 @@ TW_RSS_CNYES = "https://news.google.com/rss/search?q=site:news.cnyes.com%20when:
 TW_RSS_MONEYDJ = "https://www.moneydj.com/rss/headlines.rss"
 TW_RSS_YAHOO = "https://tw.stock.yahoo.com/rss?category=tw-market"
 
+# 所有來源同時抓取，共用的截止時間 (秒)；單一來源請求逾時
+GATHER_DEADLINE_SEC = float(os.getenv("GATHER_DEADLINE_SEC", "12"))
+SOURCE_TIMEOUT_SEC = float(os.getenv("SOURCE_TIMEOUT_SEC", "10"))
+
+# 每次報告的分段結果 (新聞、指數、報告、發送紀錄)
+REPORT_RUNS_DIR = os.getenv("REPORT_RUNS_DIR", "report_runs")
+REPORT_RUNS_KEEP_DAYS = int(os.getenv("REPORT_RUNS_KEEP_DAYS", "14"))
+
 DEBUG_LOG = True
 
 
@@ -50,7 +60,14 @@ def log(msg):
 
 def fetch_rss(url, source, max_items=10):
     try:
-        feed = feedparser.parse(url)
+        # 條件式請求 (ETag / Last-Modified)，feedparser 只負責解析
+        content, status = fetch_feed(url, timeout=SOURCE_TIMEOUT_SEC)
+        if content is None:
+            log(f"RSS Error ({source}): 下載失敗")
+            return []
+        if status == "304":
+            log(f"📰 {source}: 304 未變更，使用快取")
+        feed = feedparser.parse(content)
         out = []
         for entry in feed.entries[:max_items]:
             title = entry.title.strip()
@@ -62,13 +79,17 @@ def fetch_rss(url, source, max_items=10):
         return []
 
 
+def empty_index():
+    return {"price": "N/A", "chg": "N/A", "pct": "N/A", "turnover": None}
+
+
 def get_yahoo_realtime_index():
     url = (
         "https://query1.finance.yahoo.com/v8/finance/chart/%5ETWII?interval=1d&range=2d"
     )
     try:
         headers = {"User-Agent": "Mozilla/5.0"}
-        res = requests.get(url, headers=headers, timeout=10)
+        res = requests.get(url, headers=headers, timeout=SOURCE_TIMEOUT_SEC)
         json_data = res.json()
         meta = json_data["chart"]["result"][0]["meta"]
         price = float(meta["regularMarketPrice"])
@@ -82,18 +103,15 @@ def get_yahoo_realtime_index():
         }
     except Exception as e:
         log(f"Yahoo Index Error: {e}")
-        return {"price": "N/A", "chg": "N/A", "pct": "N/A", "turnover": None}
+        return empty_index()
 
 
-def get_market_index_official():
-    yahoo_data = get_yahoo_realtime_index()
-    official_turnover = None
-
+def get_twse_turnover():
     try:
         # 證交所 API: 每日收盤行情 (FMTQIK)
         res = requests.get(
             "https://openapi.twse.com.tw/v1/exchangeReport/FMTQIK",
-            timeout=10,
+            timeout=SOURCE_TIMEOUT_SEC,
             verify=False,
         )
         json_data = res.json()
@@ -105,60 +123,78 @@ def get_market_index_official():
             billions = f"{raw_value / 100000000:.0f}"
             official_turnover = f"{billions}億"
             log(f"🏛️ 證交所 API: 成交金額 {official_turnover}")
+            return official_turnover
     except Exception as e:
         log(f"⚠️ 證交所 API 失敗: {e}")
+    return None
 
-    final_turnover = official_turnover or yahoo_data["turnover"] or "N/A"
-    yahoo_data["turnover"] = final_turnover
-    return yahoo_data
 
-
-# ==========================================
-# 3) 通知系統
-# ==========================================
+def merge_market_data(yahoo_data, official_turnover):
+    yahoo_data["turnover"] = official_turnover or yahoo_data["turnover"] or "N/A"
+    return yahoo_data
 
 
-def push_line_message(msg):
-    if not LINE_CHANNEL_TOKEN or not LINE_TARGET_ID:
-        log("⚠️ LINE 設定缺失")
-        return
-    url = "https://api.line.me/v2/bot/message/push"
-    headers = {
-        "Authorization": f"Bearer {LINE_CHANNEL_TOKEN}",
-        "Content-Type": "application/json",
+def get_market_index_official():
+    return merge_market_data(get_yahoo_realtime_index(), get_twse_turnover())
+
+
+def _timed(fn, *args):
+    started = time.time()
+    result = fn(*args)
+    return result, time.time() - started
+
+
+def gather_sources(deadline_sec=GATHER_DEADLINE_SEC):
+    """
+    新聞與指數來源同時抓取，共用同一個截止時間。
+    逾時或失敗的來源以空結果繼續，不讓最慢的來源拖住整份報告。
+    """
+    # 名稱 -> (函式, 參數, 失敗時的預設值)
+    tasks = {
+        "CNBC": (fetch_rss, (CNBC_RSS, "CNBC", 8), list),
+        "MoneyDJ": (fetch_rss, (TW_RSS_MONEYDJ, "MoneyDJ", 8), list),
+        "鉅亨": (fetch_rss, (TW_RSS_CNYES, "鉅亨", 8), list),
+        "Yahoo": (fetch_rss, (TW_RSS_YAHOO, "Yahoo", 5), list),
+        "Yahoo指數": (get_yahoo_realtime_index, (), empty_index),
+        "證交所": (get_twse_turnover, (), lambda: None),
     }
-    payload = {"to": LINE_TARGET_ID, "messages": [{"type": "text", "text": msg}]}
-    try:
-        res = requests.post(url, headers=headers, json=payload, timeout=10)
-        if res.status_code == 200:
-            log("✅ LINE 發送成功")
-        else:
-            log(f"❌ LINE 發送失敗: {res.text}")
-    except Exception as e:
-        log(f"❌ LINE 錯誤: {e}")
+    started = time.time()
+    pool = ThreadPoolExecutor(max_workers=len(tasks))
+    futures = {
+        name: pool.submit(_timed, fn, *args) for name, (fn, args, _) in tasks.items()
+    }
+    done, _ = wait(futures.values(), timeout=deadline_sec)
+    # 不等逾時的來源，背景執行緒會在各自的 timeout 後結束
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for name, future in futures.items():
+        default = tasks[name][2]
+        if future not in done:
+            log(f"⏱️ {name}: 逾時 (>{deadline_sec:g}s)，略過")
+            results[name] = default()
+            continue
+        try:
+            value, elapsed = future.result()
+        except Exception as e:
+            log(f"⏱️ {name}: 失敗 ({e})")
+            results[name] = default()
+            continue
+        size = f" / {len(value)} 則" if isinstance(value, list) else ""
+        log(f"⏱️ {name}: {elapsed:.2f}s{size}")
+        results[name] = value
+    log(f"⏱️ 資料收集完成: {time.time() - started:.2f}s")
+    return results
 
 
-def push_telegram_message(msg):
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        log("⚠️ Telegram 設定缺失")
-        return
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": TELEGRAM_CHAT_ID, "text": msg}
-    try:
-        res = requests.post(url, json=payload, timeout=10)
-        if res.status_code == 200:
-            log("✅ Telegram 發送成功")
-        else:
-            log(f"❌ Telegram 發送失敗: {res.text}")
-    except Exception as e:
-        log(f"❌ Telegram 錯誤: {e}")
+# ==========================================
+# 3) 通知系統
+# ==========================================
 
 
-def notify_all(msg):
-    # LINE 限制長度
-    line_msg = msg[:4500] + "..." if len(msg) > 4500 else msg
-    push_line_message(line_msg)
-    push_telegram_message(msg)
+def notify_all(msg, channels=None):
+    """回傳各通道的發送結果 (ok / failed / skipped)；過長的訊息依各通道上限分段"""
+    return get_notifier(log, process="rpi_main").send(msg, channels)
 
 
 # ==========================================
@@ -175,21 +211,6 @@ def generate_report_v7(mode, market, us_news, tw_news):
     )
     index_note = "(昨日收盤)" if mode == "PRE" else ""
 
-    context = f"""
-【日期】{date_str}
-【模式】{mode}
-
-【市場數據】
-指數: {market["price"]} (漲跌 {market["chg"]} / {market["pct"]}%)
-★成交值: {market["turnover"]} (資料來源: 證交所/Yahoo)
-
-【新聞素材 (MoneyDJ/鉅亨/Yahoo)】
-{"\n".join(tw_news)}
-
-【美股參考】
-{"\n".join(us_news)}
-""".strip()
-
     system_prompt = f"""
 你是一位專業台股操盤手。請撰寫手機版操盤筆記。
 
@@ -226,34 +247,38 @@ def generate_report_v7(mode, market, us_news, tw_news):
 • 僅供參考，不構成投資建議
 """.strip()
 
-    # 1. Groq
-    if GROQ_API_KEY:
-        try:
-            client = Groq(api_key=GROQ_API_KEY)
-            completion = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": context},
-                ],
-                temperature=0.5,
-            )
-            return completion.choices[0].message.content
-        except Exception as e:
-            log(f"Groq Fail: {e}")
+    # 新聞依與台股的相關程度排序，在 token 上限內盡量放入
+    header = f"""
+【日期】{date_str}
+【模式】{mode}
 
-    # 2. Gemini Fallback
+【市場數據】
+指數: {market["price"]} (漲跌 {market["chg"]} / {market["pct"]}%)
+★成交值: {market["turnover"]} (資料來源: 證交所/Yahoo)
+""".strip()
+    system_tokens = estimate_tokens(system_prompt)
+    context, stats = build_context(
+        header,
+        [("【新聞素材 (MoneyDJ/鉅亨/Yahoo)】", tw_news), ("【美股參考】", us_news)],
+        budget=PROMPT_TOKEN_BUDGET - system_tokens,
+    )
+    log(
+        f"🧮 Prompt ≈ {system_tokens + stats['tokens']} tokens (上限 {PROMPT_TOKEN_BUDGET})"
+        f"，新聞 {stats['kept']} 則 / 略過 {stats['dropped']} 則"
+    )
+
+    # Groq 為主、Gemini 備援；Groq 太慢時同時呼叫 Gemini，取先完成者
+    providers = []
+    if GROQ_API_KEY:
+        providers.append(groq_provider(GROQ_API_KEY))
     if GEMINI_API_KEY:
-        try:
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
-            payload = {
-                "contents": [{"parts": [{"text": system_prompt + "\n\n" + context}]}]
-            }
-            res = requests.post(url, json=payload, timeout=30)
-            json_data = res.json()
-            return json_data["candidates"][0]["content"]["parts"][0]["text"]
-        except Exception as e:
-            log(f"Gemini Fail: {e}")
+        providers.append(gemini_provider(GEMINI_API_KEY))
+    health = HealthStore()
+    report, _ = race(providers, system_prompt, context, health=health, log=log)
+    for p in providers:
+        log(f"📊 {p.name}: {health.get(p.name).summary()}")
+    if report:
+        return report
 
     return "⚠️ AI 無回應"
 
@@ -264,21 +289,12 @@ def generate_report_v7(mode, market, us_news, tw_news):
 
 
 def save_to_sheet(report_text, market, mode):
-    if not SPREADSHEET_ID or not GOOGLE_SERVICE_ACCOUNT_FILE:
+    """寫入成功或已排進 outbox (稍後補寫) 都回傳 True"""
+    writer = get_writer("report", log=log)
+    if not SPREADSHEET_ID or not writer.configured:
         log("⚠️ Google Sheets 設定缺失")
-        return
+        return False
     try:
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive",
-        ]
-        creds = ServiceAccountCredentials.from_json_keyfile_name(
-            GOOGLE_SERVICE_ACCOUNT_FILE, scope
-        )
-        client = gspread.authorize(creds)
-
-        sheet = client.open_by_key(SPREADSHEET_ID).sheet1
-
         # 取得摘要
         import re
 
@@ -298,10 +314,15 @@ def save_to_sheet(report_text, market, mode):
             summary,
             report_text,
         ]
-        sheet.append_row(row)
-        log("✅ Google Sheet 存檔成功")
+        writer.append_rows(SPREADSHEET_ID, [row])
+        if writer.flush():
+            log("✅ Google Sheet 存檔成功")
+        else:
+            log(f"📥 Google Sheet 暫時無法寫入，已存入 outbox ({writer.pending()} 筆待補寫)")
+        return True
     except Exception as e:
         log(f"Sheet Error: {e}")
+    return False
 
 
 # ==========================================
@@ -316,43 +337,172 @@ def resolve_mode():
     return "POST" if hhmm >= 1340 else "PRE"
 
 
-def main():
-    log(f"🚀 啟動 V7.0 流程 ({MODE})...")
+# ==========================================
+# 7) 分段執行 (每段結果存檔，重跑時從未完成的段落接續)
+# ==========================================
+STAGES = ("gather", "generate", "notify", "sheet")
+
+
+def default_run_id(mode):
+    return f"{datetime.now().strftime('%Y-%m-%d')}_{mode}"
+
+
+def load_stage(run_dir, stage):
     try:
-        run_mode = resolve_mode()
-        log(f"🧩 執行模式: {run_mode}")
+        with open(os.path.join(run_dir, f"{stage}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
 
-        # 1. 抓新聞
-        us_news = fetch_rss(CNBC_RSS, "CNBC", max_items=8)
-        tw_news = []
-        tw_news.extend(fetch_rss(TW_RSS_MONEYDJ, "MoneyDJ", max_items=8))
-        tw_news.extend(fetch_rss(TW_RSS_CNYES, "鉅亨", max_items=8))
-        tw_news.extend(fetch_rss(TW_RSS_YAHOO, "Yahoo", max_items=5))
 
-        # 2. 抓指數
-        market_data = get_market_index_official()
-        log(f"📈 指數數據: {market_data}")
+def write_stage(run_dir, stage, data):
+    os.makedirs(run_dir, exist_ok=True)
+    path = os.path.join(run_dir, f"{stage}.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
-        if not us_news and not tw_news:
-            notify_all("⚠️ 系統通知：未抓到新聞，請檢查來源。")
-            return
 
-        # 3. 產報告
-        report = generate_report_v7(run_mode, market_data, us_news, tw_news)
+def clear_stages(run_dir, from_stage):
+    for stage in STAGES[STAGES.index(from_stage) :]:
+        try:
+            os.remove(os.path.join(run_dir, f"{stage}.json"))
+        except FileNotFoundError:
+            pass
 
-        # 4. 發送通知
-        if report and not report.startswith("⚠️"):
-            notify_all(report)
-            # 5. 存檔
-            save_to_sheet(report, market_data, run_mode)
-        else:
+
+def prune_runs(runs_dir=REPORT_RUNS_DIR, keep_days=REPORT_RUNS_KEEP_DAYS):
+    cutoff = time.time() - keep_days * 86400
+    try:
+        names = os.listdir(runs_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(runs_dir, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def stage_gather(run_mode):
+    # 新聞與指數同時抓取
+    sources = gather_sources()
+    raw_us = sources["CNBC"]
+    raw_tw = sources["MoneyDJ"] + sources["鉅亨"] + sources["Yahoo"]
+
+    # 去掉前幾次報告已用過、以及各來源間重複 / 近似重複的標題
+    seen = HeadlineIndex.load()
+    us_news = seen.filter(raw_us)
+    tw_news = seen.filter(raw_tw)
+    log(
+        f"🧹 標題去重: 美股 {len(raw_us)} -> {len(us_news)} / 台股 {len(raw_tw)} -> {len(tw_news)}"
+    )
+    if not us_news and not tw_news and (raw_us or raw_tw):
+        # 全部都出現過：只做本次內的去重，仍產出報告
+        fresh = HeadlineIndex(path=seen.path)
+        us_news, tw_news = fresh.filter(raw_us), fresh.filter(raw_tw)
+
+    # 指數 (證交所成交值優先)
+    market_data = merge_market_data(sources["Yahoo指數"], sources["證交所"])
+    log(f"📈 指數數據: {market_data}")
+    return {"mode": run_mode, "us_news": us_news, "tw_news": tw_news, "market": market_data}
+
+
+def stage_notify(report, previous):
+    """只重送上次沒成功的通道"""
+    receipts = dict((previous or {}).get("receipts", {}))
+    pending = [ch for ch in ("line", "telegram") if receipts.get(ch) not in ("ok", "skipped")]
+    receipts.update(notify_all(report, channels=pending))
+    return {
+        "receipts": receipts,
+        "complete": all(v in ("ok", "skipped") for v in receipts.values()),
+        "sent_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "headlines_recorded": bool((previous or {}).get("headlines_recorded")),
+    }
+
+
+def run_report(run_id=None, from_stage=None, runs_dir=REPORT_RUNS_DIR):
+    run_mode = resolve_mode()
+    run_id = run_id or default_run_id(run_mode)
+    run_dir = os.path.join(runs_dir, run_id)
+    if from_stage:
+        # 重跑後段時前面的段落必須已存檔，否則會默默重新抓取 / 再呼叫一次 LLM
+        missing = [s for s in STAGES[: STAGES.index(from_stage)] if load_stage(run_dir, s) is None]
+        if missing:
+            msg = f"❌ {run_dir} 缺少 {', '.join(missing)} 段落，無法從 {from_stage} 重跑 (請確認 --run-id)"
+            log(msg)
+            raise SystemExit(msg)
+        clear_stages(run_dir, from_stage)
+    log(f"🧩 執行模式: {run_mode} / run: {run_dir}")
+
+    # 1. 新聞 + 指數
+    bundle = load_stage(run_dir, "gather")
+    if bundle is None:
+        bundle = stage_gather(run_mode)
+        if not bundle["us_news"] and not bundle["tw_news"]:
+            notify_all("⚠️ 系統通知：未抓到新聞，請檢查來源。")
+            return
+        write_stage(run_dir, "gather", bundle)
+    else:
+        log("⏭️ gather 已完成，沿用存檔")
+
+    # 2. 產報告 (失敗不存檔，重跑時會重新產生)
+    generated = load_stage(run_dir, "generate")
+    if generated is None:
+        report = generate_report_v7(
+            bundle["mode"], bundle["market"], bundle["us_news"], bundle["tw_news"]
+        )
+        if not report or report.startswith("⚠️"):
             notify_all(report)
             log("⚠️ 報告生成有誤")
+            return
+        generated = {"report": report}
+        write_stage(run_dir, "generate", generated)
+    else:
+        log("⏭️ generate 已完成，沿用存檔")
+    report = generated["report"]
+
+    # 3. 發送通知
+    delivered = load_stage(run_dir, "notify")
+    if delivered is None or not delivered.get("complete"):
+        delivered = stage_notify(report, delivered)
+        if not delivered["headlines_recorded"] and any(v == "ok" for v in delivered["receipts"].values()):
+            # 第一次有通道送達時才把這次用到的標題記為已看過 (重試才成功也算)
+            seen = HeadlineIndex.load()
+            seen.filter(bundle["us_news"] + bundle["tw_news"])
+            seen.save()
+            delivered["headlines_recorded"] = True
+        write_stage(run_dir, "notify", delivered)
+    else:
+        log("⏭️ notify 已完成，沿用存檔")
+
+    # 4. 存檔
+    if load_stage(run_dir, "sheet") is None:
+        if save_to_sheet(report, bundle["market"], bundle["mode"]):
+            write_stage(run_dir, "sheet", {"saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+    else:
+        log("⏭️ sheet 已完成，沿用存檔")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="台股每日報告")
+    parser.add_argument("--run-id", default=None, help="預設為 <日期>_<PRE|POST>")
+    parser.add_argument(
+        "--from-stage", choices=STAGES, default=None, help="從指定段落重跑 (之後的段落也會重跑)"
+    )
+    args = parser.parse_args(argv)
 
+    log(f"🚀 啟動 V7.0 流程 ({MODE})...")
+    try:
+        prune_runs()
+        run_report(run_id=args.run_id, from_stage=args.from_stage)
     except Exception as e:
         error_msg = f"❌ 系統錯誤: {str(e)}"
         log(error_msg)
         notify_all(error_msg)
+    log(f"📊 通知統計: {get_notifier(log, process='rpi_main').summary()}")
 
 
 if __name__ == "__main__":
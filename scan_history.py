@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+from datetime import datetime
+from typing import Any, Optional
+
+
+DEFAULT_DB_FILE = "stock_database.json"
+DEFAULT_HISTORY_FILE = "scan_history.jsonl"
+
+# 每 N 筆差異寫一次完整快照，讀取時不必從第一天開始重播
+KEYFRAME_EVERY = 30
+
+# 每天都會變動的欄位放在快照層級，不列入逐檔差異
+VOLATILE_FIELDS = ("update_date", "update_time")
+
+
+def _strip_row(row: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in row.items() if k not in VOLATILE_FIELDS}
+
+
+def _snapshot_date(db: dict[str, Any]) -> str:
+    dates = [str(v.get("update_date")) for v in db.values() if v.get("update_date")]
+    if dates:
+        return max(dates)
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _snapshot_time(db: dict[str, Any]) -> Optional[str]:
+    times = [str(v.get("update_time")) for v in db.values() if v.get("update_time")]
+    return max(times) if times else None
+
+
+def _read_entries(path: str) -> list[dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    out: list[dict[str, Any]] = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    out.append(json.loads(line))
+                except Exception:
+                    continue
+    except Exception:
+        return []
+    return out
+
+
+def _apply_entry(state: dict[str, dict[str, Any]], entry: dict[str, Any]) -> None:
+    if entry.get("kind") == "keyframe":
+        state.clear()
+        state.update({k: dict(v) for k, v in entry.get("rows", {}).items()})
+        return
+    for code, fields in entry.get("changed", {}).items():
+        state.setdefault(code, {}).update(fields)
+    # 從列中拿掉的欄位
+    for code, keys in entry.get("unset", {}).items():
+        for key in keys:
+            state.get(code, {}).pop(key, None)
+    for code in entry.get("removed", []):
+        state.pop(code, None)
+
+
+def _replay(
+    entries: list[dict[str, Any]], date: Optional[str] = None
+) -> dict[str, dict[str, Any]]:
+    if date is not None:
+        entries = [e for e in entries if str(e.get("date", "")) <= date]
+    start = 0
+    for i in range(len(entries) - 1, -1, -1):
+        if entries[i].get("kind") == "keyframe":
+            start = i
+            break
+    state: dict[str, dict[str, Any]] = {}
+    for entry in entries[start:]:
+        _apply_entry(state, entry)
+    return state
+
+
+def _row_delta(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in new.items() if old.get(k) != v}
+
+
+def record_snapshot(
+    db: dict[str, Any],
+    path: str = DEFAULT_HISTORY_FILE,
+    date: Optional[str] = None,
+) -> dict[str, Any]:
+    """把當日資料庫以差異形式追加到歷史檔，只存有變動的欄位"""
+    date = date or _snapshot_date(db)
+    rows = {str(k): _strip_row(v) for k, v in db.items() if isinstance(v, dict)}
+
+    entries = _read_entries(path)
+    deltas_since_keyframe = 0
+    for e in reversed(entries):
+        if e.get("kind") == "keyframe":
+            break
+        deltas_since_keyframe += 1
+
+    if not entries or deltas_since_keyframe >= KEYFRAME_EVERY:
+        entry: dict[str, Any] = {"kind": "keyframe", "date": date, "rows": rows}
+    else:
+        prev = _replay(entries)
+        changed: dict[str, dict[str, Any]] = {}
+        for code, row in rows.items():
+            delta = _row_delta(prev.get(code, {}), row)
+            if delta:
+                changed[code] = delta
+        unset: dict[str, list[str]] = {}
+        for code, row in rows.items():
+            dropped = sorted(k for k in prev.get(code, {}) if k not in row)
+            if dropped:
+                unset[code] = dropped
+        removed = sorted(code for code in prev if code not in rows)
+        entry = {"kind": "delta", "date": date, "changed": changed}
+        if unset:
+            entry["unset"] = unset
+        if removed:
+            entry["removed"] = removed
+
+    update_time = _snapshot_time(db)
+    if update_time:
+        entry["update_time"] = update_time
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return entry
+
+
+def list_dates(path: str = DEFAULT_HISTORY_FILE) -> list[str]:
+    return sorted({str(e["date"]) for e in _read_entries(path) if e.get("date")})
+
+
+def load_snapshot(
+    date: Optional[str] = None, path: str = DEFAULT_HISTORY_FILE
+) -> dict[str, dict[str, Any]]:
+    return _replay(_read_entries(path), date)
+
+
+def diff_snapshots(
+    old: dict[str, dict[str, Any]],
+    new: dict[str, dict[str, Any]],
+    top_n: int = 10,
+) -> dict[str, Any]:
+    transitions: list[dict[str, Any]] = []
+    rsi_moves: list[dict[str, Any]] = []
+
+    for code, row in new.items():
+        before = old.get(code)
+        if before is None:
+            continue
+        if before.get("status") != row.get("status"):
+            transitions.append(
+                {
+                    "code": code,
+                    "name": row.get("name", ""),
+                    "from": before.get("status"),
+                    "to": row.get("status"),
+                }
+            )
+        try:
+            delta = float(row["rsi"]) - float(before["rsi"])
+        except Exception:
+            continue
+        if delta == 0:
+            continue
+        rsi_moves.append(
+            {
+                "code": code,
+                "name": row.get("name", ""),
+                "rsi_from": before["rsi"],
+                "rsi_to": row["rsi"],
+                "delta": round(delta, 2),
+            }
+        )
+
+    rsi_moves.sort(key=lambda x: abs(x["delta"]), reverse=True)
+    return {
+        "transitions": sorted(transitions, key=lambda x: x["code"]),
+        "rsi_moves": rsi_moves[:top_n] if top_n > 0 else rsi_moves,
+        "added": sorted(code for code in new if code not in old),
+        "removed": sorted(code for code in old if code not in new),
+    }
+
+
+def diff_dates(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    path: str = DEFAULT_HISTORY_FILE,
+    top_n: int = 10,
+) -> dict[str, Any]:
+    """比較兩個日期的快照，預設為最近兩次掃描"""
+    entries = _read_entries(path)
+    dates = sorted({str(e["date"]) for e in entries if e.get("date")})
+    if not dates:
+        return diff_snapshots({}, {}, top_n)
+    date_to = date_to or dates[-1]
+    if date_from is None:
+        earlier = [d for d in dates if d < date_to]
+        date_from = earlier[-1] if earlier else date_to
+    result = diff_snapshots(_replay(entries, date_from), _replay(entries, date_to), top_n)
+    result["date_from"] = date_from
+    result["date_to"] = date_to
+    return result
+
+
+def filter_transitions(
+    diff: dict[str, Any], from_status: Optional[str] = None, to_status: Optional[str] = None
+) -> list[dict[str, Any]]:
+    return [
+        t
+        for t in diff.get("transitions", [])
+        if (from_status is None or t["from"] == from_status)
+        and (to_status is None or t["to"] == to_status)
+    ]
+
+
+def format_diff_summary(diff: dict[str, Any], max_items: int = 10) -> str:
+    lines = [f"📊 掃描變化 {diff.get('date_from', '')} → {diff.get('date_to', '')}"]
+
+    to_red = filter_transitions(diff, to_status="RED")
+    to_green = filter_transitions(diff, to_status="GREEN")
+    if to_red:
+        lines.append(f"🔴 轉強 ({len(to_red)})")
+        lines.extend(f"• {t['code']} {t['name']} ({t['from']}→RED)" for t in to_red[:max_items])
+    if to_green:
+        lines.append(f"🟢 轉弱 ({len(to_green)})")
+        lines.extend(f"• {t['code']} {t['name']} ({t['from']}→GREEN)" for t in to_green[:max_items])
+
+    moves = diff.get("rsi_moves", [])[:max_items]
+    if moves:
+        lines.append("⚡ RSI 變動最大")
+        lines.extend(
+            f"• {m['code']} {m['name']} {m['rsi_from']}→{m['rsi_to']} ({m['delta']:+.1f})"
+            for m in moves
+        )
+
+    if len(lines) == 1:
+        lines.append("無狀態變化")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="stock_database.json 每日快照歷史")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_record = sub.add_parser("record", help="把目前的資料庫寫入歷史")
+    p_record.add_argument("--db", default=DEFAULT_DB_FILE)
+    p_record.add_argument("--history", default=DEFAULT_HISTORY_FILE)
+    p_record.add_argument("--date", default=None)
+
+    p_diff = sub.add_parser("diff", help="比較兩次掃描")
+    p_diff.add_argument("--history", default=DEFAULT_HISTORY_FILE)
+    p_diff.add_argument("--from", dest="date_from", default=None)
+    p_diff.add_argument("--to", dest="date_to", default=None)
+    p_diff.add_argument("--top", type=int, default=10)
+    p_diff.add_argument("--json", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.cmd == "record":
+        with open(args.db, "r", encoding="utf-8") as f:
+            db = json.load(f)
+        entry = record_snapshot(db, path=args.history, date=args.date)
+        size = len(entry.get("rows", entry.get("changed", {})))
+        print(f"✅ {entry['date']} {entry['kind']}: {size} 檔")
+    else:
+        diff = diff_dates(args.date_from, args.date_to, path=args.history, top_n=args.top)
+        if args.json:
+            print(json.dumps(diff, ensure_ascii=False, indent=2))
+        else:
+            print(format_diff_summary(diff))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import traceback
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+
+DEFAULT_JOURNAL_DIR = "scan_journal"
+DEFAULT_DB_FILE = "stock_database.json"
+
+ScanFn = Callable[[str], Optional[dict[str, Any]]]
+
+
+def default_run_id() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def journal_path(run_id: str, journal_dir: str = DEFAULT_JOURNAL_DIR) -> str:
+    return os.path.join(journal_dir, f"{run_id}.jsonl")
+
+
+def _append(path: str, record: dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_journal(path: str) -> dict[str, dict[str, Any]]:
+    """讀取 journal，回傳每個代號最後一筆紀錄 (後寫入的覆蓋先前的失敗)"""
+    out: dict[str, dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return out
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except Exception:
+                    # 寫到一半被中斷的最後一行
+                    continue
+                code = rec.get("code")
+                if code:
+                    out[str(code)] = rec
+    except Exception:
+        return {}
+    return out
+
+
+def journal_summary(
+    codes: list[str], records: dict[str, dict[str, Any]]
+) -> dict[str, list[str]]:
+    done = [c for c in codes if records.get(c, {}).get("ok")]
+    failed = [c for c in codes if c in records and not records[c].get("ok")]
+    pending = [c for c in codes if c not in records]
+    return {"done": done, "failed": failed, "pending": pending}
+
+
+def write_json_atomic(data: Any, path: str) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def collect_results(
+    codes: list[str], records: dict[str, dict[str, Any]]
+) -> dict[str, dict[str, Any]]:
+    out: dict[str, dict[str, Any]] = {}
+    for code in codes:
+        rec = records.get(code)
+        if rec and rec.get("ok") and rec.get("result"):
+            out[code] = rec["result"]
+    return out
+
+
+def run_scan(
+    codes: list[str],
+    scan_one: ScanFn,
+    out_path: Optional[str] = DEFAULT_DB_FILE,
+    run_id: Optional[str] = None,
+    journal_dir: str = DEFAULT_JOURNAL_DIR,
+    retry_failed: bool = False,
+    log: Callable[[str], None] = print,
+) -> dict[str, Any]:
+    """
+    逐檔掃描並把結果寫入 journal；同一個 run_id 重跑時跳過已完成的代號。
+    retry_failed=True 時只重抓上次失敗的代號。
+    全部代號都有紀錄後，才以原子替換方式發布到 out_path。
+    """
+    run_id = run_id or default_run_id()
+    path = journal_path(run_id, journal_dir)
+    records = load_journal(path)
+    summary = journal_summary(codes, records)
+
+    if retry_failed:
+        todo = summary["failed"]
+    else:
+        todo = summary["pending"]
+    if records:
+        log(
+            f"♻️ 續跑 {run_id}: 已完成 {len(summary['done'])} / 失敗 {len(summary['failed'])} / 待處理 {len(todo)}"
+        )
+
+    for i, code in enumerate(todo, 1):
+        started = time.time()
+        record: dict[str, Any] = {"code": code}
+        try:
+            result = scan_one(code)
+            record.update({"ok": True, "result": result})
+        except Exception:
+            record.update({"ok": False, "error": traceback.format_exc(limit=1).strip()})
+        record["elapsed"] = round(time.time() - started, 3)
+        record["ts"] = int(time.time())
+        _append(path, record)
+        records[code] = record
+        if i % 50 == 0:
+            log(f"⏳ {i}/{len(todo)}")
+
+    summary = journal_summary(codes, records)
+    results = collect_results(codes, records)
+    complete = not summary["pending"]
+    published = False
+    if complete and out_path:
+        write_json_atomic(results, out_path)
+        published = True
+        log(f"✅ 發布 {out_path}: {len(results)} 檔 (失敗 {len(summary['failed'])})")
+    elif not complete:
+        log(f"⚠️ 尚有 {len(summary['pending'])} 檔未完成，暫不發布")
+
+    return {
+        "run_id": run_id,
+        "results": results,
+        "failed": summary["failed"],
+        "pending": summary["pending"],
+        "published": published,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="批次掃描 journal 狀態")
+    parser.add_argument("--run-id", default=None)
+    parser.add_argument("--journal-dir", default=DEFAULT_JOURNAL_DIR)
+    parser.add_argument("--reset", action="store_true", help="刪除此 run 的 journal")
+    args = parser.parse_args()
+
+    run_id = args.run_id or default_run_id()
+    path = journal_path(run_id, args.journal_dir)
+    if args.reset:
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"🗑️ 已清除 {path}")
+        return
+
+    records = load_journal(path)
+    ok = [c for c, r in records.items() if r.get("ok")]
+    failed = [c for c, r in records.items() if not r.get("ok")]
+    print(f"{run_id}: 完成 {len(ok)} / 失敗 {len(failed)}")
+    for code in failed:
+        print(f"• {code}: {records[code].get('error', '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import heapq
+import math
+import time
+from typing import Callable, Optional
+
+
+def _clamp(x: float) -> float:
+    return max(0.0, min(1.0, x))
+
+
+def proximity(
+    pct: float,
+    rsi: float,
+    vol_ratio: float,
+    sigma: float,
+    up_pct: float,
+    down_pct: float,
+    rsi_overbought: float,
+    rsi_oversold: float,
+    volume_mult: float,
+    horizon_min: float,
+) -> float:
+    """
+    0~1，越接近觸發條件越高。每一邊 (漲 / 跌) 取 價格、RSI、量能 三項接近程度的平均，再取較高的一邊。
+    價格先加上 horizon_min 分鐘內可能的波動 (1 分 K 報酬標準差 x 根號時間)，波動大的股票會更早被排進來。
+    """
+    move = sigma * math.sqrt(max(horizon_min, 0.0))
+    vol_c = 1.0 if volume_mult <= 0 else _clamp(vol_ratio / volume_mult)
+    up = (
+        _clamp((pct + move) / up_pct) if up_pct > 0 else 1.0,
+        _clamp((rsi - 50) / (rsi_overbought - 50)) if rsi_overbought > 50 else 1.0,
+        vol_c,
+    )
+    down = (
+        _clamp((pct - move) / down_pct) if down_pct < 0 else 1.0,
+        _clamp((50 - rsi) / (50 - rsi_oversold)) if rsi_oversold < 50 else 1.0,
+        vol_c,
+    )
+    return max(sum(up) / 3, sum(down) / 3)
+
+
+class AdaptiveScheduler:
+    """
+    依優先度排程每檔股票的下次掃描時間 (heap，依到期時間)：
+    - 分數 1 (快觸發) 每 min_interval 秒、分數 0 (平靜) 每 max_interval 秒，中間以等比內插
+    - 所有股票的需求加總超過 budget_per_min 時，全部間隔等比拉長；另有 token bucket 當硬上限
+    - per_code_budget > 0 時預算隨清單大小調整 (每次 sync 重新計算 檔數 x per_code_budget)
+    """
+
+    def __init__(
+        self,
+        budget_per_min: float,
+        min_interval: float,
+        max_interval: float,
+        clock: Callable[[], float] = time.time,
+        per_code_budget: float = 0.0,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.per_code_budget = per_code_budget
+        self.clock = clock
+        self.heap: list[tuple[float, int, str]] = []
+        self.due: dict[str, float] = {}
+        self.desired: dict[str, float] = {}
+        self.scores: dict[str, float] = {}
+        self._seq = 0
+        self.updated = clock()
+        self.rate = 0.0
+        self.capacity = 1.0
+        self.tokens = 0.0
+        self.requests = 0
+        self.set_budget(budget_per_min)
+        self.tokens = self.capacity
+
+    def set_budget(self, budget_per_min: float) -> None:
+        """變更每分鐘預算；之前累積的額度先依舊速率結算"""
+        self._refill(self.clock())
+        self.rate = max(budget_per_min, 1e-6) / 60.0
+        # 額度最多累積 5 秒，避免一次把整份清單打出去
+        self.capacity = max(1.0, self.rate * 5)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def _push(self, code: str, due: float) -> None:
+        self._seq += 1
+        self.due[code] = due
+        heapq.heappush(self.heap, (due, self._seq, code))
+
+    def sync(self, codes: list[str]) -> None:
+        """加入新股票 (立即掃描)、移除已不在清單的股票"""
+        now = self.clock()
+        wanted = set(codes)
+        for code in list(self.desired):
+            if code not in wanted:
+                self.due.pop(code, None)
+                self.desired.pop(code, None)
+                self.scores.pop(code, None)
+        for code in codes:
+            if code not in self.desired:
+                self.desired[code] = self.max_interval
+                self._push(code, now)
+        if self.per_code_budget > 0:
+            budget = max(1.0, len(self.desired) * self.per_code_budget)
+            if abs(budget / 60.0 - self.rate) > 1e-9:
+                self.set_budget(budget)
+
+    def interval_for(self, score: float) -> float:
+        return self.max_interval * (self.min_interval / self.max_interval) ** _clamp(score)
+
+    def pressure(self) -> float:
+        demand = sum(1.0 / i for i in self.desired.values())
+        return max(1.0, demand / self.rate)
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _peek(self) -> Optional[tuple[float, str]]:
+        while self.heap:
+            due, _, code = self.heap[0]
+            if self.due.get(code) == due:
+                return due, code
+            heapq.heappop(self.heap)  # 已移除或已重排的舊項目
+        return None
+
+    def pop_due(self) -> list[str]:
+        """回傳現在可以掃描的股票 (依到期先後，受額度限制)"""
+        now = self.clock()
+        self._refill(now)
+        out = []
+        while self.tokens >= 1:
+            top = self._peek()
+            if not top or top[0] > now:
+                break
+            heapq.heappop(self.heap)
+            self.due.pop(top[1], None)
+            self.tokens -= 1
+            self.requests += 1
+            out.append(top[1])
+        return out
+
+    def reschedule(self, code: str, score: Optional[float], hold_until: float = 0.0) -> None:
+        """score=None (抓取失敗) 以最慢頻率重試；hold_until 之前不必再掃 (例如通知冷卻中)"""
+        if code not in self.desired:
+            return
+        now = self.clock()
+        score = 0.0 if score is None else score
+        self.scores[code] = score
+        # 冷卻中的股票實際上不會被掃，不佔用預算
+        self.desired[code] = max(self.interval_for(score), hold_until - now)
+        self._push(code, max(now + self.desired[code] * self.pressure(), hold_until))
+
+    def next_wake(self) -> Optional[float]:
+        top = self._peek()
+        if not top:
+            return None
+        token_ready = self.updated + max(0.0, 1 - self.tokens) / self.rate
+        return max(top[0], token_ready)
+
+    def summary(self) -> str:
+        if not self.scores:
+            return "尚無資料"
+        hot = sorted(self.scores.items(), key=lambda x: -x[1])[:3]
+        hot_text = ", ".join(f"{c} {s:.2f}" for c, s in hot)
+        return f"{self.requests} 次請求, 壓力 x{self.pressure():.2f}, 最接近: {hot_text}"
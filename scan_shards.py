@@ -0,0 +1,213 @@
+import argparse
+import glob
+import json
+import os
+from typing import Any, Optional
+
+from scan_journal import (
+    DEFAULT_DB_FILE,
+    DEFAULT_JOURNAL_DIR,
+    ScanFn,
+    default_run_id,
+    journal_path,
+    load_journal,
+    run_scan,
+    write_json_atomic,
+)
+
+
+DEFAULT_PARTS_DIR = "scan_parts"
+DEFAULT_COSTS_FILE = "scan_costs.json"
+
+# 沒有歷史耗時紀錄的代號，以此秒數估算
+DEFAULT_FETCH_COST = 1.0
+
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """解析 "i/N" (1-based)，例如 "2/4" 代表四份中的第二份"""
+    try:
+        index_s, count_s = str(text).split("/", 1)
+        index, count = int(index_s), int(count_s)
+    except Exception:
+        raise ValueError(f"shard 格式錯誤: {text!r} (應為 i/N，例如 1/4)")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"shard 超出範圍: {text!r}")
+    return index, count
+
+
+def load_fetch_costs(path: str = DEFAULT_COSTS_FILE) -> dict[str, float]:
+    """讀取上次合併時記錄的每檔抓取耗時；各 runner 讀同一份檔案，分配結果才會一致"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {str(k): float(v) for k, v in data.items()}
+    except Exception:
+        return {}
+
+
+def partition_universe(
+    codes: list[str], count: int, costs: Optional[dict[str, float]] = None
+) -> list[list[str]]:
+    """
+    依歷史耗時做貪婪平衡分配 (由大到小放進目前負載最小的 shard)。
+    相同輸入一定得到相同結果，各 runner 不必互相溝通。
+    """
+    costs = costs or {}
+    shards: list[list[str]] = [[] for _ in range(count)]
+    loads = [0.0] * count
+    unique = sorted(set(codes))
+    ordered = sorted(unique, key=lambda c: (-costs.get(c, DEFAULT_FETCH_COST), c))
+    for code in ordered:
+        target = min(range(count), key=lambda i: (loads[i], i))
+        shards[target].append(code)
+        loads[target] += costs.get(code, DEFAULT_FETCH_COST)
+    return [sorted(s) for s in shards]
+
+
+def shard_codes(
+    codes: list[str], index: int, count: int, costs: Optional[dict[str, float]] = None
+) -> list[str]:
+    return partition_universe(codes, count, costs)[index - 1]
+
+
+def part_path(index: int, count: int, parts_dir: str = DEFAULT_PARTS_DIR) -> str:
+    return os.path.join(parts_dir, f"part_{index}_of_{count}.json")
+
+
+def run_shard(
+    codes: list[str],
+    scan_one: ScanFn,
+    shard: str,
+    parts_dir: str = DEFAULT_PARTS_DIR,
+    journal_dir: str = DEFAULT_JOURNAL_DIR,
+    costs_path: str = DEFAULT_COSTS_FILE,
+    run_id: Optional[str] = None,
+    retry_failed: bool = False,
+) -> dict[str, Any]:
+    """掃描這個 shard 負責的代號，完成後寫出部分結果檔"""
+    index, count = parse_shard(shard)
+    mine = shard_codes(codes, index, count, load_fetch_costs(costs_path))
+    run_id = run_id or default_run_id()
+    shard_run_id = f"{run_id}_shard{index}of{count}"
+
+    summary = run_scan(
+        mine,
+        scan_one,
+        out_path=None,
+        run_id=shard_run_id,
+        journal_dir=journal_dir,
+        retry_failed=retry_failed,
+    )
+    if not summary["pending"]:
+        records = load_journal(journal_path(shard_run_id, journal_dir))
+        costs = {
+            c: records[c]["elapsed"] for c in mine if "elapsed" in records.get(c, {})
+        }
+        os.makedirs(parts_dir, exist_ok=True)
+        write_json_atomic(
+            {
+                "shard": index,
+                "count": count,
+                "run_id": run_id,
+                "codes": mine,
+                "failed": summary["failed"],
+                "costs": costs,
+                "results": summary["results"],
+            },
+            part_path(index, count, parts_dir),
+        )
+        summary["published"] = True
+    return summary
+
+
+def merge_parts(
+    parts_dir: str = DEFAULT_PARTS_DIR,
+    out_path: str = DEFAULT_DB_FILE,
+    costs_path: Optional[str] = DEFAULT_COSTS_FILE,
+    allow_partial: bool = False,
+    run_id: Optional[str] = None,
+) -> dict[str, Any]:
+    """
+    合併同一個 run_id (預設今天) 的所有 shard 結果，缺少任何一份時預設不發布；同時更新耗時紀錄供下次分配。
+    先前執行留下的部分結果檔 (run_id 不同) 不算數，避免新舊資料混在一起發布。
+    """
+    run_id = run_id or default_run_id()
+    parts: dict[int, dict[str, Any]] = {}
+    ignored: list[str] = []
+    count = None
+    for path in sorted(glob.glob(os.path.join(parts_dir, "part_*_of_*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            part = json.load(f)
+        if part.get("run_id") != run_id:
+            ignored.append(os.path.basename(path))
+            continue
+        if count is None:
+            count = int(part["count"])
+        elif int(part["count"]) != count:
+            raise ValueError(f"shard 數量不一致: {path}")
+        parts[int(part["shard"])] = part
+
+    if count is None:
+        raise FileNotFoundError(f"{parts_dir} 沒有 {run_id} 的 shard 結果 (略過舊檔: {ignored})")
+    missing = [i for i in range(1, count + 1) if i not in parts]
+    if missing and not allow_partial:
+        raise RuntimeError(f"缺少 shard: {missing}")
+
+    merged: dict[str, Any] = {}
+    failed: list[str] = []
+    costs = load_fetch_costs(costs_path) if costs_path else {}
+    for i in sorted(parts):
+        merged.update(parts[i].get("results", {}))
+        failed.extend(parts[i].get("failed", []))
+        costs.update(parts[i].get("costs", {}))
+    merged = {k: merged[k] for k in sorted(merged)}
+
+    write_json_atomic(merged, out_path)
+    if costs_path and costs:
+        write_json_atomic({k: costs[k] for k in sorted(costs)}, costs_path)
+    return {"count": len(merged), "failed": sorted(failed), "missing": missing, "ignored": ignored}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="分片掃描：規劃與合併")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_plan = sub.add_parser("plan", help="列出某個 shard 負責的代號")
+    p_plan.add_argument("--shard", required=True, help="i/N，例如 1/4")
+    p_plan.add_argument("--codes", required=True, help="代號清單檔 (JSON list 或每行一個)")
+    p_plan.add_argument("--costs", default=DEFAULT_COSTS_FILE)
+
+    p_merge = sub.add_parser("merge", help="合併各 shard 結果為 stock_database.json")
+    p_merge.add_argument("--parts", default=DEFAULT_PARTS_DIR)
+    p_merge.add_argument("--out", default=DEFAULT_DB_FILE)
+    p_merge.add_argument("--costs", default=DEFAULT_COSTS_FILE)
+    p_merge.add_argument("--allow-partial", action="store_true")
+    p_merge.add_argument("--run-id", help="只合併這次執行的結果 (預設今天)")
+
+    args = parser.parse_args()
+
+    if args.cmd == "plan":
+        with open(args.codes, "r", encoding="utf-8") as f:
+            raw = f.read()
+        try:
+            codes = [str(c) for c in json.loads(raw)]
+        except Exception:
+            codes = [line.strip() for line in raw.splitlines() if line.strip()]
+        index, count = parse_shard(args.shard)
+        mine = shard_codes(codes, index, count, load_fetch_costs(args.costs))
+        print("\n".join(mine))
+    else:
+        result = merge_parts(
+            args.parts, args.out, args.costs, allow_partial=args.allow_partial, run_id=args.run_id
+        )
+        if result["ignored"]:
+            print(f"⏭️ 略過其他執行的結果檔: {', '.join(result['ignored'])}")
+        print(
+            f"✅ 合併 {result['count']} 檔 -> {args.out} (失敗 {len(result['failed'])}, 缺少 shard {result['missing']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
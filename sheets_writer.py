@@ -0,0 +1,207 @@
+import importlib.util
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+GOOGLE_SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
+# 寫入失敗 (離線、配額) 的操作先存在這裡，下次 flush 時一次補寫
+SHEETS_OUTBOX_DIR = os.getenv("SHEETS_OUTBOX_DIR", "sheets_outbox")
+SHEETS_OUTBOX_MAX = int(os.getenv("SHEETS_OUTBOX_MAX", "500"))
+# 寫入失敗後，至少隔這麼久才再試
+SHEETS_RETRY_SEC = float(os.getenv("SHEETS_RETRY_SEC", "300"))
+# gspread (含 google-auth) 載入要零點幾秒，真的要寫入時才 import
+HAS_GSPREAD = importlib.util.find_spec("gspread") is not None
+
+
+def _column_letter(col: int) -> str:
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def column_diff(current: list[str], desired: list[str], col: int = 1) -> list[dict[str, Any]]:
+    """
+    比較單欄的現有值與目標值，只回傳有變動的連續區段 (給 batch_update 用)；
+    目標比現有短時，多出來的格子寫成空字串。
+    """
+    letter = _column_letter(col)
+    size = max(len(current), len(desired))
+    changed = [
+        i
+        for i in range(size)
+        if (current[i] if i < len(current) else "") != (desired[i] if i < len(desired) else "")
+    ]
+    ranges = []
+    start = prev = None
+    for i in changed + [None]:
+        if start is not None and (i is None or i != prev + 1):
+            values = [[desired[j] if j < len(desired) else ""] for j in range(start, prev + 1)]
+            ranges.append({"range": f"{letter}{start + 1}:{letter}{prev + 1}", "values": values})
+            start = None
+        if i is not None and start is None:
+            start = i
+        prev = i
+    return ranges
+
+
+class SheetsWriter:
+    """
+    共用的 Google Sheets 寫入器：
+    - 授權後的 client 與 worksheet handle 都快取，不必每次重新登入 / 開檔
+    - 操作先寫進本地 outbox (JSON)，flush 時同一張表的 append 合併成一次 append_rows
+    - 單欄清單 (監控清單) 只保留最後一次的目標值，寫入時只更新有差異的格子
+    """
+
+    def __init__(
+        self,
+        name: str,
+        creds_file: Optional[str] = GOOGLE_SERVICE_ACCOUNT_FILE,
+        outbox_dir: str = SHEETS_OUTBOX_DIR,
+        log: Callable[[str], None] = print,
+    ):
+        self.creds_file = creds_file
+        self.outbox_path = os.path.join(outbox_dir, f"{name}.json")
+        self.log = log
+        self._client = None
+        self._worksheets: dict[tuple[str, Optional[str]], Any] = {}
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+
+    @property
+    def configured(self) -> bool:
+        return bool(HAS_GSPREAD and self.creds_file and os.path.exists(self.creds_file))
+
+    # ---------- outbox ----------
+    def _load_outbox(self) -> list[dict[str, Any]]:
+        try:
+            with open(self.outbox_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, list) else []
+        except Exception:
+            return []
+
+    def _save_outbox(self, ops: list[dict[str, Any]]) -> None:
+        try:
+            if not ops:
+                if os.path.exists(self.outbox_path):
+                    os.remove(self.outbox_path)
+                return
+            os.makedirs(os.path.dirname(self.outbox_path) or ".", exist_ok=True)
+            tmp = f"{self.outbox_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(ops[-SHEETS_OUTBOX_MAX:], f, ensure_ascii=False)
+            os.replace(tmp, self.outbox_path)
+        except Exception:
+            pass
+
+    def pending(self) -> int:
+        return len(self._load_outbox())
+
+    def append_rows(self, sheet_id: str, rows: list[list[Any]], worksheet: Optional[str] = None) -> None:
+        """排入要附加的列 (worksheet=None 表示第一張工作表)"""
+        if not rows:
+            return
+        op = {"kind": "append", "sheet_id": sheet_id, "worksheet": worksheet, "rows": rows, "ts": int(time.time())}
+        with self._lock:
+            self._save_outbox(self._load_outbox() + [op])
+
+    def set_column(self, sheet_id: str, worksheet: str, values: list[str]) -> None:
+        """排入單欄的目標內容；同一張表之前還沒寫出的目標值會被取代"""
+        op = {"kind": "column", "sheet_id": sheet_id, "worksheet": worksheet, "values": values, "ts": int(time.time())}
+        with self._lock:
+            ops = [
+                o
+                for o in self._load_outbox()
+                if not (o.get("kind") == "column" and o.get("sheet_id") == sheet_id and o.get("worksheet") == worksheet)
+            ]
+            self._save_outbox(ops + [op])
+
+    # ---------- Google Sheets ----------
+    def _get_client(self):
+        if self._client is None:
+            import gspread
+
+            self._client = gspread.service_account(filename=self.creds_file)
+        return self._client
+
+    def _get_worksheet(self, sheet_id: str, name: Optional[str], create: bool = False):
+        key = (sheet_id, name)
+        if key not in self._worksheets:
+            sh = self._get_client().open_by_key(sheet_id)
+            if name is None:
+                ws = sh.sheet1
+            else:
+                try:
+                    ws = sh.worksheet(name)
+                except Exception:
+                    if not create:
+                        raise
+                    ws = sh.add_worksheet(title=name, rows=1000, cols=1)
+            self._worksheets[key] = ws
+        return self._worksheets[key]
+
+    def _write_column(self, op: dict[str, Any]) -> int:
+        ws = self._get_worksheet(op["sheet_id"], op["worksheet"], create=True)
+        ranges = column_diff(ws.col_values(1), op["values"])
+        if ranges:
+            ws.batch_update(ranges)
+        return sum(len(r["values"]) for r in ranges)
+
+    def flush(self, force: bool = False) -> bool:
+        """寫出 outbox 內所有操作；回傳是否全部成功 (失敗的留待下次)"""
+        if not self.configured:
+            return False
+        if not force and time.time() < self._retry_at:
+            return False
+        with self._lock:
+            ops = self._load_outbox()
+            if not ops:
+                return True
+
+            # 同一張表的 append 依序合併
+            groups: dict[tuple[str, Optional[str]], list[dict[str, Any]]] = {}
+            columns = []
+            for op in ops:
+                if op.get("kind") == "append":
+                    groups.setdefault((op["sheet_id"], op.get("worksheet")), []).append(op)
+                elif op.get("kind") == "column":
+                    columns.append(op)
+
+            failed: list[dict[str, Any]] = []
+            for (sheet_id, name), items in groups.items():
+                rows = [row for item in items for row in item["rows"]]
+                try:
+                    self._get_worksheet(sheet_id, name).append_rows(rows)
+                    self.log(f"📤 Sheets 附加 {len(rows)} 列 ({name or 'sheet1'})")
+                except Exception as e:
+                    self._worksheets.pop((sheet_id, name), None)
+                    self.log(f"⚠️ Sheets 附加失敗，{len(rows)} 列留在 outbox: {e}")
+                    failed += items
+            for op in columns:
+                try:
+                    cells = self._write_column(op)
+                    self.log(f"📤 Sheets 更新 {op['worksheet']}: {cells} 格")
+                except Exception as e:
+                    self._worksheets.pop((op["sheet_id"], op.get("worksheet")), None)
+                    self.log(f"⚠️ Sheets 更新 {op['worksheet']} 失敗，留在 outbox: {e}")
+                    failed.append(op)
+
+            failed.sort(key=lambda o: o.get("ts", 0))
+            self._save_outbox(failed)
+            self._retry_at = time.time() + SHEETS_RETRY_SEC if failed else 0.0
+            return not failed
+
+
+_writers: dict[str, SheetsWriter] = {}
+
+
+def get_writer(name: str, log: Callable[[str], None] = print) -> SheetsWriter:
+    """同一個程序共用同一個 writer (與其快取的 client / worksheet)"""
+    if name not in _writers:
+        _writers[name] = SheetsWriter(name, log=log)
+    return _writers[name]
@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+DEFAULT_DB_FILE = "stock_database.json"
+SHEET_TTL_SEC = int(os.getenv("WATCHLIST_SHEET_TTL_SEC", "300"))
+TOP_N = 10
+
+_db_lock = threading.Lock()
+# path -> (mtime, model)
+_db_models: dict[str, tuple[float, dict[str, Any]]] = {}
+
+
+def _build_model(db: dict[str, Any], version: float) -> dict[str, Any]:
+    red = [v for v in db.values() if v.get("status") == "RED"]
+    green = [v for v in db.values() if v.get("status") == "GREEN"]
+    update_time = next(iter(db.values())).get("update_time", "未知") if db else None
+    return {
+        "version": version,
+        "db": db,
+        "update_time": update_time,
+        "red_top": sorted(red, key=lambda x: x.get("pct_change", 0), reverse=True)[:TOP_N],
+        "green_top": sorted(green, key=lambda x: x.get("pct_change", 0))[:TOP_N],
+    }
+
+
+def load_sidebar_model(path: str = DEFAULT_DB_FILE) -> Optional[dict[str, Any]]:
+    """資料庫檔案的 mtime 沒變就直接回傳上次解析、排序好的結果"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _db_lock:
+        cached = _db_models.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            db = json.load(f)
+    except Exception:
+        return None
+    model = _build_model(db if isinstance(db, dict) else {}, mtime)
+    with _db_lock:
+        _db_models[path] = (mtime, model)
+    return model
+
+
+class BackgroundTTLCache:
+    """
+    過期後仍先回傳舊值，同時在背景重新載入 (stale-while-revalidate)。
+    只有第一次 (還沒有任何值) 會同步等待 loader。
+    """
+
+    def __init__(self):
+        self._values: dict[str, tuple[float, Any]] = {}
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _refresh(self, name: str, loader: Callable[[], Any]) -> None:
+        try:
+            value = loader()
+            with self._lock:
+                self._values[name] = (time.time(), value)
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+
+    def get(self, name: str, loader: Callable[[], Any], ttl: int = SHEET_TTL_SEC) -> Any:
+        with self._lock:
+            entry = self._values.get(name)
+            expired = entry is None or time.time() - entry[0] > ttl
+            start = entry is not None and expired and name not in self._refreshing
+            if start:
+                self._refreshing.add(name)
+        if entry is None:
+            value = loader()
+            with self._lock:
+                self._values[name] = (time.time(), value)
+            return value
+        if start:
+            threading.Thread(
+                target=self._refresh, args=(name, loader), daemon=True
+            ).start()
+        return entry[1]
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._values.clear()
+            else:
+                self._values.pop(name, None)
+
+
+sheet_cache = BackgroundTTLCache()
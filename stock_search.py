@@ -0,0 +1,185 @@
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except Exception:
+    lazy_pinyin = None
+
+
+ALIASES_FILE = os.getenv("STOCK_ALIASES_FILE", "stock_aliases.json")
+# 常見簡稱 / 俗稱；stock_aliases.json 可再補充或覆寫
+ALIASES = {
+    "台積": "2330",
+    "gg": "2330",
+    "tsmc": "2330",
+    "鴻海": "2317",
+    "海公公": "2317",
+    "發哥": "2454",
+    "聯發": "2454",
+    "大立": "3008",
+    "股王": "5274",
+    "中華電": "2412",
+    "台塑": "1301",
+    "台化": "1326",
+    "長榮": "2603",
+    "陽明": "2609",
+    "萬海": "2615",
+    "台灣50": "0050",
+    "高股息": "0056",
+}
+# 權證數量龐大且不會出現在儀表板，不收進索引
+INDEXED_TYPES = ("股票", "ETF", "ETN", "特別股", "創新板", "臺灣存託憑證(TDR)")
+TYPE_ORDER = {t: i for i, t in enumerate(INDEXED_TYPES)}
+
+@dataclass(frozen=True)
+class StockEntry:
+    code: str
+    name: str
+    market: str
+    type: str
+
+    @property
+    def suffix(self) -> str:
+        return ".TW" if self.market == "上市" else ".TWO"
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", "", text).lower()
+
+
+def _initials(name: str) -> list[str]:
+    """拼音與注音首字母，例如 台積電 -> tjd、ㄊㄐㄉ；沒有 pypinyin 時略過"""
+    if lazy_pinyin is None:
+        return []
+    out = []
+    for style in (Style.FIRST_LETTER, Style.BOPOMOFO_FIRST):
+        try:
+            letters = "".join(lazy_pinyin(name, style=style, errors="ignore"))
+        except Exception:
+            continue
+        letters = _normalize(re.sub(r"\W", "", letters))
+        if letters:
+            out.append(letters)
+    return out
+
+
+def load_aliases(path: str = ALIASES_FILE) -> dict[str, str]:
+    aliases = dict(ALIASES)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            aliases.update({str(k): str(v) for k, v in data.items()})
+    except Exception:
+        pass
+    return {_normalize(k): v for k, v in aliases.items()}
+
+
+class StockIndex:
+    """
+    代號前綴 / 名稱子字串 / 拼音注音首字母 / 別名 全部預先展開成 dict，
+    查詢只做幾次 dict 查表，不再逐一掃描 twstock.codes。
+    """
+
+    def __init__(self, entries: list[StockEntry], aliases: dict[str, str]):
+        entries = sorted(entries, key=lambda e: (TYPE_ORDER.get(e.type, 99), len(e.code), e.code))
+        self.entries = entries
+        self.by_code = {e.code: e for e in entries}
+        self.exact: dict[str, list[StockEntry]] = {}
+        self.code_prefix: dict[str, list[StockEntry]] = {}
+        self.name_prefix: dict[str, list[StockEntry]] = {}
+        self.name_substring: dict[str, list[StockEntry]] = {}
+        self.initials: dict[str, list[StockEntry]] = {}
+
+        for e in entries:
+            name = _normalize(e.name)
+            self._add(self.exact, e.code, e)
+            self._add(self.exact, name, e)
+            for i in range(1, len(e.code) + 1):
+                self._add(self.code_prefix, e.code[:i], e)
+            for i in range(len(name)):
+                for j in range(i + 1, len(name) + 1):
+                    key = name[i:j]
+                    self._add(self.name_prefix if i == 0 else self.name_substring, key, e)
+            for letters in _initials(e.name):
+                for i in range(1, len(letters) + 1):
+                    self._add(self.initials, letters[:i], e)
+
+        for alias, code in aliases.items():
+            e = self.by_code.get(code)
+            if e is None:
+                continue
+            self._add(self.exact, alias, e)
+            for i in range(1, len(alias)):
+                self._add(self.name_prefix, alias[:i], e)
+
+    @staticmethod
+    def _add(table: dict[str, list[StockEntry]], key: str, entry: StockEntry) -> None:
+        bucket = table.setdefault(key, [])
+        if not bucket or bucket[-1] is not entry:
+            bucket.append(entry)
+
+    def search(self, query: str, limit: int = 10) -> list[StockEntry]:
+        q = _normalize(query or "")
+        if not q:
+            return []
+        out: list[StockEntry] = []
+        seen: set[str] = set()
+        # 排名依序：完全符合 > 代號前綴 > 名稱 / 別名開頭 > 名稱中間 > 首字母
+        tables = (self.exact, self.code_prefix, self.name_prefix, self.name_substring, self.initials)
+        for table in tables:
+            for e in table.get(q, ()):
+                if e.code in seen:
+                    continue
+                seen.add(e.code)
+                out.append(e)
+                if len(out) >= limit:
+                    return out
+        return out
+
+    def resolve(self, query: str) -> Optional[StockEntry]:
+        """完全符合 (代號 / 名稱 / 別名) 優先，否則取排名第一的候選；純數字只接受完全符合的代號"""
+        q = _normalize(query or "")
+        if q.isdigit():
+            hits = self.exact.get(q)
+            return hits[0] if hits else None
+        matches = self.search(q, limit=1)
+        return matches[0] if matches else None
+
+
+def build_index(aliases_path: str = ALIASES_FILE) -> StockIndex:
+    import twstock
+
+    entries = [
+        StockEntry(code=code, name=info.name, market=info.market, type=info.type)
+        for code, info in twstock.codes.items()
+        if info.type in TYPE_ORDER
+    ]
+    return StockIndex(entries, load_aliases(aliases_path))
+
+
+_lock = threading.Lock()
+_index: Optional[StockIndex] = None
+
+
+def get_index() -> StockIndex:
+    """第一次查詢時才建立，同一個程序 (所有 Streamlit session) 共用"""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = build_index()
+    return _index
+
+
+def search_stocks(query: str, limit: int = 10) -> list[StockEntry]:
+    return get_index().search(query, limit)
+
+
+def resolve_stock(query: str) -> Optional[StockEntry]:
+    return get_index().resolve(query)
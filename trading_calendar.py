@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import re
+from datetime import date, datetime, time as dtime, timedelta
+from typing import Any, Optional
+
+import requests
+
+
+TRADING_CALENDAR_FILE = os.getenv("TRADING_CALENDAR_FILE", "twse_calendar.json")
+TWSE_HOLIDAY_URL = os.getenv(
+    "TWSE_HOLIDAY_URL", "https://openapi.twse.com.tw/v1/holidaySchedule/holidaySchedule"
+)
+# 超過這麼多天沒更新就重新下載證交所休市日
+CALENDAR_REFRESH_DAYS = int(os.getenv("TRADING_CALENDAR_REFRESH_DAYS", "7"))
+
+MARKET_OPEN = dtime(9, 0)
+MARKET_CLOSE = dtime(13, 30)
+
+
+def parse_date(text: str) -> Optional[date]:
+    """支援 2026-01-01、2026/01/01、20260101 與民國年 1150101"""
+    digits = re.sub(r"\D", "", str(text or ""))
+    try:
+        if len(digits) == 8:
+            return date(int(digits[:4]), int(digits[4:6]), int(digits[6:]))
+        if len(digits) == 7:
+            return date(int(digits[:3]) + 1911, int(digits[3:5]), int(digits[5:]))
+    except ValueError:
+        return None
+    return None
+
+
+def parse_twse_holidays(rows: list[dict[str, Any]]) -> dict[str, str]:
+    """
+    證交所休市日表 -> {日期: 名稱}。
+    表中的「開始交易日 / 最後交易日」是有交易的日子，不算休市；
+    「僅辦理結算交割」的日子沒有交易，算休市。
+    """
+    out = {}
+    for row in rows:
+        d = parse_date(row.get("Date") or row.get("date") or "")
+        name = str(row.get("Name") or row.get("name") or "").strip()
+        if not d or "交易日" in name:
+            continue
+        out[d.isoformat()] = name or "休市"
+    return out
+
+
+def _read(path: str) -> dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class TradingCalendar:
+    """
+    休市日來自證交所 (holidays) 與手動加入 (closures，例如颱風停止交易)；
+    closures 不會被重新下載覆蓋。沒有資料的年份退回「週一到週五都開盤」。
+    常駐程式用 reload_if_changed() 讀進其他程序 (CLI --close) 寫入的變更。
+    """
+
+    def __init__(self, data: Optional[dict[str, Any]] = None, path: str = TRADING_CALENDAR_FILE):
+        data = data or {}
+        self.path = path
+        self.holidays: dict[str, str] = dict(data.get("holidays", {}))
+        self.closures: dict[str, str] = dict(data.get("closures", {}))
+        self.updated_at: float = float(data.get("updated_at", 0))
+        self.mtime = _mtime(path)
+
+    @classmethod
+    def load(cls, path: str = TRADING_CALENDAR_FILE) -> "TradingCalendar":
+        return cls(_read(path), path)
+
+    def reload_if_changed(self) -> bool:
+        """檔案被其他程序改過就重新讀取；回傳是否有重新讀取"""
+        mtime = _mtime(self.path)
+        if mtime == self.mtime:
+            return False
+        data = _read(self.path)
+        self.holidays = dict(data.get("holidays", self.holidays))
+        self.closures = dict(data.get("closures", self.closures))
+        self.updated_at = float(data.get("updated_at", self.updated_at))
+        self.mtime = mtime
+        return True
+
+    def save(self) -> None:
+        """寫入前先合併檔案上已有的 closures，不會蓋掉其他程序剛加入的臨時休市日"""
+        try:
+            self.closures = {**_read(self.path).get("closures", {}), **self.closures}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"updated_at": self.updated_at, "holidays": self.holidays, "closures": self.closures},
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                    sort_keys=True,
+                )
+            os.replace(tmp, self.path)
+            self.mtime = _mtime(self.path)
+        except Exception:
+            pass
+
+    # ---------- 更新 ----------
+    def is_stale(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now()
+        return now.timestamp() - self.updated_at > CALENDAR_REFRESH_DAYS * 86400
+
+    def refresh(self, timeout: float = 10) -> bool:
+        """下載證交所休市日表；失敗時保留原本的資料"""
+        try:
+            res = requests.get(TWSE_HOLIDAY_URL, timeout=timeout, headers={"User-Agent": "Mozilla/5.0"})
+            res.raise_for_status()
+            holidays = parse_twse_holidays(res.json())
+        except Exception:
+            return False
+        if not holidays:
+            return False
+        # 只替換下載到的年份，其他年份保留
+        years = {d[:4] for d in holidays}
+        self.holidays = {d: n for d, n in self.holidays.items() if d[:4] not in years}
+        self.holidays.update(holidays)
+        self.updated_at = datetime.now().timestamp()
+        self.save()
+        return True
+
+    def refresh_if_stale(self, now: Optional[datetime] = None) -> bool:
+        if not self.is_stale(now):
+            return False
+        if self.refresh():
+            return True
+        # 下載失敗：稍後 (一天後) 再試，不要每次檢查都打 API
+        self.updated_at = (now or datetime.now()).timestamp() - (CALENDAR_REFRESH_DAYS - 1) * 86400
+        return False
+
+    def add_closure(self, day: date, reason: str = "臨時休市") -> None:
+        self.closures[day.isoformat()] = reason
+        self.save()
+
+    def covers(self, day: date) -> bool:
+        return any(d.startswith(f"{day.year}-") for d in self.holidays)
+
+    # ---------- 查詢 ----------
+    def closed_reason(self, day: date) -> Optional[str]:
+        key = day.isoformat()
+        if key in self.closures:
+            return self.closures[key]
+        if key in self.holidays:
+            return self.holidays[key]
+        if day.weekday() >= 5:
+            return "週末"
+        return None
+
+    def is_trading_day(self, day: date) -> bool:
+        return self.closed_reason(day) is None
+
+    def is_open(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now()
+        return self.is_trading_day(now.date()) and MARKET_OPEN <= now.time() <= MARKET_CLOSE
+
+    def next_open(self, now: Optional[datetime] = None) -> datetime:
+        """下一次開盤時間 (現在正在盤中時回傳今天的開盤時間)"""
+        now = now or datetime.now()
+        day = now.date()
+        if now.time() > MARKET_CLOSE:
+            day += timedelta(days=1)
+        for _ in range(60):
+            if self.is_trading_day(day):
+                return datetime.combine(day, MARKET_OPEN)
+            day += timedelta(days=1)
+        return datetime.combine(day, MARKET_OPEN)
+
+    def close_at(self, day: date) -> datetime:
+        return datetime.combine(day, MARKET_CLOSE)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="證交所交易日曆 (本地檔案)")
+    parser.add_argument("--file", default=TRADING_CALENDAR_FILE)
+    parser.add_argument("--refresh", action="store_true", help="重新下載證交所休市日")
+    parser.add_argument("--close", metavar="YYYY-MM-DD", help="加入臨時休市日 (例如颱風)")
+    parser.add_argument("--reason", default="颱風停止交易")
+    args = parser.parse_args(argv)
+
+    cal = TradingCalendar.load(args.file)
+    if args.refresh:
+        print("✅ 已更新" if cal.refresh() else "❌ 下載失敗，保留原本資料")
+    if args.close:
+        day = parse_date(args.close)
+        if not day:
+            raise SystemExit(f"日期格式錯誤: {args.close}")
+        cal.add_closure(day, args.reason)
+        print(f"✅ {day} 標記為休市: {args.reason}")
+
+    today = date.today()
+    upcoming = sorted(
+        (d, n) for d, n in {**cal.holidays, **cal.closures}.items() if d >= today.isoformat()
+    )[:10]
+    print(f"下次開盤: {cal.next_open():%Y-%m-%d %H:%M}")
+    for d, n in upcoming:
+        print(f"  {d} {n}")
+    if not cal.covers(today):
+        print(f"⚠️ 日曆沒有 {today.year} 年的資料，只會略過週末")
+
+
+if __name__ == "__main__":
+    main()